@@ -1,20 +1,64 @@
 """Store banks' contents (feature test, scenarios, etc.)."""
 
+import errno
 import socket
+from os import stat, fstat
+from os.path import abspath
+from collections import OrderedDict
+from httplib import HTTPException
+from threading import Thread, Lock
+from time import sleep
+from uuid import uuid4
+from hashlib import sha1
 from abc import ABCMeta, abstractmethod, abstractproperty
-from xmlrpclib import ServerProxy
-from .parser import parse_bank
+from array import array
+from mmap import mmap, ACCESS_READ
+from xmlrpclib import ServerProxy, Fault
+from .parser import iter_bank, index_bank, read_bank, normalize_section
+from .parser import SECTION_HEADER, SECTION_FEATURE, SECTION_SCENARIO
+from .transport import XMLRPCTransport, JSONProxy, RemoteError, PROTOCOL_XMLRPC, PROTOCOL_JSON
 from .errors import BotError
 
+# Requests and responses larger than this (in bytes) are compressed, if the other side supports it.
+COMPRESS_THRESHOLD = 1400
+
+# Seconds to wait for the server before giving up on a request (None waits forever).
+TIMEOUT = 10.0
+
+# Failed requests are retried this many times, waiting twice as long as the last time before each.
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+
+# Errors on which requests are retried.
+TRANSPORT_ERRORS = (socket.error, HTTPException, )
+
+# Lazy banks keep at most this many bank files mapped at once (each holding a file descriptor).
+MAPPED_BANKS = 64
+
 class ConnectionError(BotError):
     """An error on a remote operation."""
     def __init__(self, operation):
         super(ConnectionError, self).__init__("Failed on remote '{:s}'".format(operation))
         self.operation = operation
 
+class FileLimitError(BotError):
+    """Ran out of file descriptors while opening a bank."""
+    def __init__(self, bank_path):
+        super(FileLimitError, self).__init__(
+            "Too many open files opening features bank '{:s}' (see 'ulimit -n')".format(bank_path))
+        self.bank_path = bank_path
+
+class BankChangedError(BotError):
+    """A lazy bank's file changed since it was indexed, so its offsets can't be trusted."""
+    def __init__(self, bank_path):
+        super(BankChangedError, self).__init__(
+            "Features bank '{:s}' changed since it was read".format(bank_path))
+        self.bank_path = bank_path
+
 class BaseBank(object):
     """Access parts and aspects of feature bank/s."""
     __metaclass__ = ABCMeta
+    __slots__ = ()
 
     @abstractmethod
     def is_fresh(self):
@@ -50,32 +94,129 @@ class BaseBank(object):
         This has the effect of marking the scenario returned as dealt.
         """
 
-class Bank(BaseBank):
-    """Holds a bank file's parsed contents and allows access to its scenarios in order."""
-    def __init__(self, bank_path):
+    def fetch_status(self):
+        """Fetch whatever's needed to answer queries about the bank in advance.
+
+        Local banks have everything at hand, so this does nothing for them.
+        """
+        pass
+
+    def prefetch(self):
+        """Fetch the next scenario in advance, in the background (nothing, unless overridden).
+
+        The prefetched scenario is returned by the next call to `get_next_scenario()`.
+        """
+        pass
+
+    def commit(self):
+        """Commit to taking the prefetched scenario, so it isn't released when the bank is closed
+        (nothing, unless overridden)."""
+        pass
+
+    def close(self):
+        """Release any resources held between operations (like connections)."""
+        pass
+
+class LocalBank(BaseBank):
+    """A bank which keeps its scenarios at hand (in memory, or in its file).
+
+    Since scenarios are dealt in order, a cursor to the next scenario is all that's needed to track
+    which were dealt. Local banks supply only their number and how to read each of them
+    (`total_count` and `_read_scenario()`).
+    """
+    __slots__ = ("__next_scenario", )
+
+    def __init__(self):
+        self.__next_scenario = 0
+
+    def is_fresh(self):
+        return (0 == self.dealt_count) and (0 < self.total_count)
+
+    def is_done(self):
+        return self.total_count <= self.dealt_count
+
+    @property
+    def dealt_count(self):
+        """The number of scenarios dealt so far."""
+        return self.__next_scenario
+
+    @abstractproperty
+    def total_count(self):
+        """The number of scenarios in the bank."""
+
+    def mark_dealt(self, count):
+        """Mark the first `count` scenarios as dealt (for example, when carrying progress over from
+        a previous version of the bank)."""
+        self.__next_scenario = max(self.__next_scenario, min(count, self.total_count))
+
+    def get_next_scenario(self):
+        if self.is_done():
+            # No more scenarios.
+            return None
+
+        # Only count the scenario as dealt once it was read.
+        scenario = self._read_scenario(self.__next_scenario + 1)
+        self.__next_scenario += 1
+
+        return scenario
+
+    def return_scenario(self):
+        """Return the last scenario dealt to the bank, so it's dealt again next."""
+        if 0 < self.__next_scenario:
+            self.__next_scenario -= 1
+
+    @abstractmethod
+    def _read_scenario(self, number):
+        """Return the scenario by its number (starting from 1)."""
+
+class Bank(LocalBank):
+    """Holds a bank file's parsed contents and allows access to its scenarios in order.
+
+    All of the bank's sections are kept in a single text buffer, along with an array of the offsets
+    each of them ends at. Scenarios are only sliced out of the buffer when they're dealt.
+
+    If a parse cache is given, the bank is only parsed if it changed since it was last cached.
+    """
+    __slots__ = ("__output_path", "__contents", "__offsets", "__digest", )
+
+    def __init__(self, bank_path, cache = None):
+        super(Bank, self).__init__()
         try:
-            with open(bank_path, "r") as bank_contents:
-                (header, feature, scenarios) = parse_bank(bank_contents.read())
+            with open(bank_path, "r") as bank_file:
+                if cache:
+                    offsets = cache.index(bank_path, bank_file)
+                    reader = _HashingReader(bank_file)
+                    sections = read_bank(reader, offsets)
+                else:
+                    # Parse the bank file line by line, instead of reading it all at once.
+                    reader = _HashingReader(bank_file)
+                    sections = iter_bank(reader)
+
+                (contents, offsets) = _pack_sections(sections)
         except IOError:
             raise BotError("Couldn't open features bank '{:s}'".format(bank_path))
 
-        self.__output_path = bank_path.replace("bank", "feature")
-        self.__header = header
-        self.__feature = feature
-        self.__scenarios = [(False, scenario) for scenario in scenarios]
+        self.__output_path = _get_output_path(bank_path)
+        self.__contents = contents
+        self.__offsets = offsets
+        self.__digest = reader.hexdigest()
 
-        # Ensure output path's extension is 'feature'.
-        if not self.__output_path.endswith(".feature"):
-            self.__output_path += ".feature"
+    def __getstate__(self):
+        return (self.__output_path, self.__contents, self.__offsets, self.dealt_count)
 
-    def is_fresh(self):
-        if not self.__scenarios:
-            return False
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = _migrate_state(state)
 
-        return not any(was_dealt for (was_dealt, _) in self.__scenarios)
+        (self.__output_path, self.__contents, self.__offsets, dealt_count) = state
+        self.__digest = None
+        super(Bank, self).__init__()
+        self.mark_dealt(dealt_count)
 
-    def is_done(self):
-        return all(was_dealt for (was_dealt, _) in self.__scenarios)
+    @property
+    def digest(self):
+        """The hash of the bank file's contents, as read when parsing it (None once unpickled)."""
+        return self.__digest
 
     @property
     def output_path(self):
@@ -83,65 +224,524 @@ class Bank(BaseBank):
 
     @property
     def header(self):
-        return self.__header
+        return self.__contents[:self.__offsets[0]]
 
     @property
     def feature(self):
-        return self.__feature
+        return self.__read_section(0)
 
-    def get_next_scenario(self):
-        for i in xrange(len(self.__scenarios)):
-            (was_dealt, scenario) = self.__scenarios[i]
+    @property
+    def total_count(self):
+        return len(self.__offsets) - 2
 
-            if not was_dealt:
-                self.__scenarios[i] = (True, scenario)
-                return scenario
+    def _read_scenario(self, number):
+        return self.__read_section(number)
 
-        # No more scenarios.
-        return None
+    def __read_section(self, i):
+        """Slice the section between the i-th offset and the next one out of the bank's text."""
+        return self.__contents[self.__offsets[i]:self.__offsets[i + 1]]
+
+class LazyBank(LocalBank):
+    """Index a bank file's sections and read them from a memory-mapped file only when needed.
+
+    Only the offsets of the bank's sections (and the file's size and modification time when it was
+    indexed) are kept in memory. Bank files are only mapped while they're being read from, and up
+    to `MAPPED_BANKS` of them stay mapped between reads (see `_MappedFiles`). If a parse cache is
+    given, the bank is only indexed if it changed since it was last cached.
+    """
+    __slots__ = ("__path", "__status", "__output_path", "__offsets", )
+
+    def __init__(self, bank_path, cache = None):
+        super(LazyBank, self).__init__()
+        try:
+            with open(bank_path, "rb") as bank_file:
+                status = fstat(bank_file.fileno())
+                if cache:
+                    offsets = cache.index(bank_path, bank_file)
+                else:
+                    offsets = index_bank(bank_file)
+        except EnvironmentError as error:
+            raise _get_open_error(bank_path, error)
+
+        self.__path = abspath(bank_path)
+        self.__status = (status.st_size, status.st_mtime)
+        self.__output_path = _get_output_path(bank_path)
+        self.__offsets = array("L", offsets)
+
+    @property
+    def output_path(self):
+        return self.__output_path
+
+    @property
+    def header(self):
+        return normalize_section(SECTION_HEADER, self.__read(0, self.__offsets[0]), False)
+
+    @property
+    def feature(self):
+        return self.__read_section(SECTION_FEATURE, 0)
+
+    @property
+    def total_count(self):
+        return len(self.__offsets) - 2
+
+    def _read_scenario(self, number):
+        return self.__read_section(SECTION_SCENARIO, number)
+
+    def __read_section(self, kind, i):
+        """Read the section between the i-th offset and the next one."""
+        contents = self.__read(self.__offsets[i], self.__offsets[i + 1])
+        is_last = (len(self.__offsets) - 2 == i)
+
+        return normalize_section(kind, contents, is_last)
+
+    def __read(self, start, end):
+        """Read the bank file's contents between two offsets."""
+        if start == end:
+            # Nothing to read (empty files can't be mapped anyway).
+            return ""
+
+        return _MAPPED_FILES.read(self.__path, self.__status, start, end)
+
+class _MappedFiles(object):
+    """Bank files mapped to memory, shared between all lazy banks.
+
+    Each file is mapped along with its status (size and modification time) when it's first read
+    from, and is only read from by banks which indexed the same status. Once there are more than
+    `MAPPED_BANKS` files mapped, the least recently read one is unmapped.
+
+    Files might be edited in place while they're mapped (before the server reloads them), which
+    would make reading from the mapping return garbage or even crash. So the file's status is
+    checked again before each read, and a file that changed is unmapped (see `BankChangedError`).
+    """
+    def __init__(self):
+        self.__maps = OrderedDict()
+        self.__lock = Lock()
+
+    def read(self, path, status, start, end):
+        """Read a bank file's contents between two offsets."""
+        with self.__lock:
+            contents = self.__maps.pop((path, status), None)
+            if contents is None:
+                contents = self.__map(path, status)
+            elif status != _get_file_status(path):
+                contents.close()
+                raise BankChangedError(path)
+
+            self.__maps[(path, status)] = contents
+            while MAPPED_BANKS < len(self.__maps):
+                (_, unmapped) = self.__maps.popitem(last = False)
+                unmapped.close()
+
+            return contents[start:end]
+
+    @staticmethod
+    def __map(path, status):
+        """Map a bank file to memory, making sure it's still the version that was indexed."""
+        try:
+            with open(path, "rb") as bank_file:
+                current = fstat(bank_file.fileno())
+                if status != (current.st_size, current.st_mtime):
+                    raise BankChangedError(path)
+
+                # The mapping keeps a descriptor of its own, so the file can be closed.
+                return mmap(bank_file.fileno(), 0, access = ACCESS_READ)
+        except EnvironmentError as error:
+            raise _get_open_error(path, error)
+
+_MAPPED_FILES = _MappedFiles()
+
+class _HashingReader(object):
+    """Wrap a bank file, hashing its contents as they're read by the parser.
+
+    Both ways of parsing a bank read the whole file, from its beginning (`read_bank()` rewinds the
+    file first), so the file doesn't have to be read again just to hash it.
+    """
+    def __init__(self, bank_file):
+        self.__file = bank_file
+        self.__hash = sha1()
+
+    def __iter__(self):
+        for line in self.__file:
+            self.__hash.update(line)
+            yield line
+
+    def seek(self, offset):
+        """Seek the file, hashing it over from there (the parser only rewinds it)."""
+        self.__file.seek(offset)
+        self.__hash = sha1()
+
+    def read(self, size = -1):
+        """Read from the file."""
+        data = self.__file.read(size)
+        self.__hash.update(data)
+        return data
+
+    def hexdigest(self):
+        """Return the hash of the contents read so far."""
+        return self.__hash.hexdigest()
+
+class RemoteSession(object):
+    """A connection to a bank server, shared by all remote banks dealt from it.
+
+    The server is called either over XML-RPC or length-prefixed JSON (see `bddbot.transport`).
+    Over XML-RPC, requests larger than the compression threshold are sent gzip-compressed, and the
+    server is told the client accepts compressed responses as well.
+
+    Requests which time out or fail on the connection are retried a few times. Calls are made one
+    at a time, since banks might call the server from their prefetching threads.
+
+    The connection is kept open between deals if the server is threaded (its banks are told so along
+    with their status). Otherwise, it's closed whenever it's idle (see `close_idle()`).
+    """
+    def __init__(self, host, port, compress_threshold = COMPRESS_THRESHOLD,
+                 protocol = PROTOCOL_XMLRPC, timeout = TIMEOUT, retries = RETRIES,
+                 retry_backoff = RETRY_BACKOFF):
+        # pylint: disable=too-many-arguments
+        if PROTOCOL_JSON == protocol:
+            self.__proxy = JSONProxy(host, port, timeout)
+        else:
+            address = "http://{host}:{port:d}".format(host = host, port = port)
+            transport = XMLRPCTransport(compress_threshold, timeout)
+            self.__proxy = ServerProxy(address, transport = transport, allow_none = True)
+
+        self.__retries = retries
+        self.__retry_backoff = retry_backoff
+        self.__lock = Lock()
+        self.protocol = protocol
+        self.host = host
+        self.port = port
+        self.is_threaded = False
+
+    def call(self, operation, method, *params):
+        """Call one of the server's methods, retrying if the connection fails.
+
+        Retries wait twice as long as the previous one did, and once they run out the operation
+        fails with a `ConnectionError`.
+        """
+        with self.__lock:
+            for attempt in xrange(self.__retries + 1):
+                try:
+                    return getattr(self.__proxy, method)(*params)
+                except TRANSPORT_ERRORS:
+                    # Start over on a new connection.
+                    self.__proxy("close")()
+
+                if attempt < self.__retries:
+                    sleep(self.__retry_backoff * (2 ** attempt))
+
+        raise ConnectionError(operation)
+
+    def fetch_statuses(self, banks):
+        """Fetch the statuses of several banks dealt from this server in a single call.
+
+        Banks which know their status already aren't asked for it. If the server can't query them
+        together (older servers don't support it), each bank is asked on its own.
+        """
+        banks = [bank for bank in banks if bank.needs_status()]
+        if 1 < len(banks):
+            queries = [[bank.client, bank.token] for bank in banks]
+            try:
+                statuses = self.call("fetch_status", "get_statuses", queries)
+            except (Fault, RemoteError):
+                pass
+            else:
+                for (bank, status) in zip(banks, statuses):
+                    bank.set_status(status)
+                return
+
+        for bank in banks:
+            bank.fetch_status()
+
+    def close(self):
+        """Close the connection to the server.
+
+        The connection is kept open between calls (HTTP/1.1 keep-alive) and is opened again as
+        needed, but unless the server is threaded it only handles a single connection at a time.
+        """
+        self.__proxy("close")()
+
+    def close_idle(self):
+        """Close the connection while it's idle, unless the server is threaded.
+
+        Servers which aren't threaded handle a single connection at a time, so they aren't kept
+        waiting on this one. Threaded servers close idle connections themselves, once their
+        keep-alive timeout passes.
+        """
+        if not self.is_threaded:
+            self.close()
 
 class RemoteBank(BaseBank):
-    """Access banks over a remote connection."""
-    def __init__(self, client, host, port):
-        address = "http://{host}:{port:d}".format(host = host, port = port)
-        self.__proxy = ServerProxy(address)
+    """Access banks over a remote connection.
+
+    Everything needed to deal a scenario is fetched in a single call (see `BankServer.get_status()`)
+    and dealing returns the status for the next deal along with the scenario. That status is kept
+    only while the client's bank is still being dealt, since once it's done the server might assign
+    it a different bank by the time it deals again.
+
+    The bank's metadata (output path, header and feature) is kept along with the token the server
+    identifies it by. The server only sends it again once the token changes.
+
+    While the dealer runs the tests, the next scenario can be prefetched in the background (see
+    `prefetch()`). The server reserves it for the client until the client's next deal (or
+    reservation), which tells the server the reservation was taken. Reservations which weren't
+    taken are released when the bank is closed, or by the next deal if the dealer stopped first.
+
+    The server is called through a `RemoteSession`, either the given one (shared with other banks
+    dealt from the same server) or a new one with the given options. Deals are sent along with a
+    request ID, so the server deals the same scenario again if the request is retried (its response
+    might've been lost, after all).
+    """
+    def __init__(self, client, host, port, compress_threshold = COMPRESS_THRESHOLD,
+                 protocol = PROTOCOL_XMLRPC, timeout = TIMEOUT, retries = RETRIES,
+                 retry_backoff = RETRY_BACKOFF, session = None):
+        # pylint: disable=too-many-arguments
+        if session is None:
+            session = RemoteSession(
+                host, port,
+                compress_threshold = compress_threshold,
+                protocol = protocol,
+                timeout = timeout,
+                retries = retries,
+                retry_backoff = retry_backoff)
+
+        self.__session = session
+        self.__status = None
+        self.__token = None
+        self.__metadata = None
+        self.__prefetcher = None
+        self.__prefetch_id = None
+        self.__reservation = None
+        self.__is_committed = False
+        self.__committed = None
         self.client = client
 
+    @property
+    def token(self):
+        """The token of the client's bank's metadata (None before it's fetched)."""
+        return self.__token
+
+    @property
+    def committed(self):
+        """The request ID of the last reservation taken (None if there's none).
+
+        It's sent along with the next deal, and saved with the dealer's state until then.
+        """
+        return self.__committed
+
+    @committed.setter
+    def committed(self, request_id):
+        # pylint: disable=missing-docstring
+        self.__committed = request_id
+
     def is_fresh(self):
-        try:
-            return self.__proxy.is_fresh(self.client)
-        except socket.error:
-            raise ConnectionError("is_fresh")
+        return self.__get_status("is_fresh")["is_fresh"]
 
     def is_done(self):
-        try:
-            return self.__proxy.is_done(self.client)
-        except socket.error:
-            raise ConnectionError("is_done")
+        return self.__get_status("is_done")["is_done"]
 
     @property
     def output_path(self):
-        try:
-            return self.__proxy.get_output_path(self.client)
-        except socket.error:
-            raise ConnectionError("output_path")
+        self.__get_status("output_path")
+        return self.__metadata["output_path"]
 
     @property
     def header(self):
-        try:
-            return self.__proxy.get_header(self.client)
-        except socket.error:
-            raise ConnectionError("header")
+        self.__get_status("header")
+        return self.__metadata["header"]
 
     @property
     def feature(self):
-        try:
-            return self.__proxy.get_feature(self.client)
-        except socket.error:
-            raise ConnectionError("feature")
+        self.__get_status("feature")
+        return self.__metadata["feature"]
 
     def get_next_scenario(self):
+        # If prefetching failed, the scenario might've been reserved all the same (and its response
+        # lost), so it's dealt with the same request ID.
+        request_id = self.__prefetch_id or _get_request_id()
+        response = self.__take_reservation()
+        if response is None:
+            response = self.__call_committing("get_next_scenario", "deal", request_id)
+        elif response["scenario"] is not None:
+            self.__committed = request_id
+
+        status = response["status"]
+        self.__update_metadata(status)
+        if status["is_fresh"] or status["is_done"]:
+            status = None
+
+        self.__status = status
+        return response["scenario"]
+
+    def needs_status(self):
+        """Return True if the client's bank's status has to be fetched from the server."""
+        return self.__status is None
+
+    def set_status(self, status):
+        """Set the client's bank's status, as fetched from the server (see `fetch_status()`)."""
+        self.__update_metadata(status)
+        self.__status = status
+
+    def fetch_status(self):
+        """Fetch the client's bank's status from the server, unless it's known already."""
+        self.__get_status("fetch_status")
+
+    def prefetch(self):
+        """Reserve the next scenario on the server in the background.
+
+        If the server can't reserve it (older servers don't support it, for example), scenarios are
+        dealt as usual.
+        """
+        self.__prefetch_id = _get_request_id()
+        self.__prefetcher = Thread(target = self.__reserve)
+        self.__prefetcher.daemon = True
+        self.__prefetcher.start()
+
+    def commit(self):
+        """Commit the prefetched scenario, once it's sure to be taken, so it isn't released.
+
+        The server isn't called until the client's next deal, which commits the reservation.
+        """
+        if self.__prefetcher is not None:
+            self.__is_committed = True
+
+    def close(self):
+        """Release the prefetched scenario if it wasn't taken, closing the idle server connection.
+
+        If prefetching failed, the scenario might've been reserved all the same (and the response
+        lost), so it's released anyway. Servers ignore releases from clients with no reservation.
+        """
+        is_released = (self.__prefetcher is not None) and (not self.__is_committed)
+        reservation = self.__take_reservation()
+
+        try:
+            if is_released:
+                self.__release(reservation)
+        finally:
+            self.__session.close_idle()
+
+    def __reserve(self):
+        """Reserve the next scenario (in the prefetching thread).
+
+        The connection is idle once the scenario is reserved, since the tests are still running.
+        """
+        try:
+            self.__reservation = self.__call_committing("prefetch", "reserve", self.__prefetch_id)
+        except Exception:
+            # pylint: disable=broad-except
+            self.__reservation = None
+        finally:
+            self.__session.close_idle()
+
+    def __release(self, reservation):
+        """Release the prefetched scenario, given its reservation (None if it's unknown)."""
+        if reservation is not None:
+            if reservation["scenario"] is not None:
+                self.__call("release", "release")
+            return
+
         try:
-            return self.__proxy.get_next_scenario(self.client)
-        except socket.error:
-            raise ConnectionError("get_next_scenario")
+            self.__call("release", "release")
+        except Exception:
+            # pylint: disable=broad-except
+            # Older servers can't reserve scenarios, so there's nothing to release.
+            pass
+
+    def __take_reservation(self):
+        """Wait for the prefetched scenario's reservation and return it (None if there's none)."""
+        if self.__prefetcher is None:
+            return None
+
+        self.__prefetcher.join()
+        (reservation, self.__prefetcher, self.__reservation) = (self.__reservation, None, None)
+        (self.__prefetch_id, self.__is_committed) = (None, False)
+
+        return reservation
+
+    def __get_status(self, operation):
+        """Return the client's bank's status, fetching it from the server unless it's known."""
+        if self.__status is None:
+            self.set_status(self.__call(operation, "get_status", self.__token))
+
+        return self.__status
+
+    def __call(self, operation, method, *params):
+        """Call one of the server's methods for the client."""
+        return self.__session.call(operation, method, self.client, *params)
+
+    def __call_committing(self, operation, method, request_id):
+        """Deal (or reserve) a scenario, committing the last reservation taken (if any).
+
+        The reservation's request ID is only sent if there's one, since older servers can't take it.
+        """
+        params = (self.__token, request_id)
+        if self.__committed is not None:
+            params += (self.__committed, )
+
+        return self.__call(operation, method, *params)
+
+    def __update_metadata(self, status):
+        """Keep the bank's metadata, if the server sent it (because the client's token changed).
+
+        Whether the server is threaded is sent along with the status (older servers don't).
+        """
+        self.__session.is_threaded = status.get("threaded", False)
+        if "header" in status:
+            self.__token = status["token"]
+            self.__metadata = dict(
+                (field, status[field]) for field in ("output_path", "header", "feature", ))
+
+def _get_request_id():
+    """Return a new ID to identify a request to the server by."""
+    return uuid4().hex
+
+def _pack_sections(sections):
+    """Pack a bank's sections' texts into a single buffer.
+
+    Returns the buffer and an array of the offsets each section ends at.
+    """
+    (texts, offsets, end) = ([], array("L"), 0)
+    for text in sections:
+        texts.append(text)
+        end += len(text)
+        offsets.append(end)
+
+    return ("".join(texts), offsets)
+
+def _migrate_state(state):
+    """Convert a bank's state, as pickled by older versions, to the current one.
+
+    Older banks kept their header, feature and a list of (was_dealt, scenario) pairs as attributes.
+    """
+    scenarios = state["_Bank__scenarios"]
+    sections = [state["_Bank__header"], state["_Bank__feature"], ]
+    sections.extend(scenario for (_, scenario) in scenarios)
+    (contents, offsets) = _pack_sections(sections)
+    dealt_count = sum(1 for (was_dealt, _) in scenarios if was_dealt)
+
+    return (state["_Bank__output_path"], contents, offsets, dealt_count)
+
+def _get_open_error(bank_path, error):
+    """Return the error to raise when a bank file couldn't be opened."""
+    if error.errno in (errno.EMFILE, errno.ENFILE):
+        return FileLimitError(bank_path)
+
+    return BotError("Couldn't open features bank '{:s}'".format(bank_path))
+
+def _get_file_status(path):
+    """Return a file's size and modification time (or None if it's missing)."""
+    try:
+        status = stat(path)
+    except OSError:
+        return None
+
+    return (status.st_size, status.st_mtime)
+
+def _get_output_path(bank_path):
+    """Return the feature's path to write to, given the bank's path."""
+    output_path = bank_path.replace("bank", "feature")
+
+    # Ensure output path's extension is 'feature'.
+    if not output_path.endswith(".feature"):
+        output_path += ".feature"
+
+    return output_path
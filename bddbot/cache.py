@@ -0,0 +1,80 @@
+"""Cache the offsets of parsed banks on disk, so that unchanged banks aren't parsed again."""
+
+from os import stat, rename, makedirs
+from os.path import abspath, join, isdir
+from hashlib import sha1
+import json
+import logging
+from .parser import index_bank
+
+CACHE_PATH = ".bdd-cache"
+CHUNK_SIZE = 0x10000
+
+class ParseCache(object):
+    """Store banks' offsets (see `index_bank()`) in a directory, one file per bank.
+
+    Cached offsets are only used as long as the bank's fingerprint stays the same: Its path, size,
+    modification time and the hash of its contents.
+    """
+    def __init__(self, directory = CACHE_PATH):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.__log = logging.getLogger(__name__)
+
+    def index(self, bank_path, bank_file):
+        """Return the offsets of a bank's sections, parsing the bank only if it wasn't cached.
+
+        The bank file's position is undefined once this returns.
+        """
+        fingerprint = _get_fingerprint(bank_path, bank_file)
+        entry_path = self.__get_entry_path(bank_path)
+
+        try:
+            with open(entry_path, "r") as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, ValueError):
+            entry = None
+
+        if entry and (fingerprint == entry.get("fingerprint")):
+            self.__log.debug("Parse cache hit for '%s'", bank_path)
+            self.hits += 1
+            return entry["offsets"]
+
+        self.__log.debug("Parse cache miss for '%s'", bank_path)
+        self.misses += 1
+
+        bank_file.seek(0)
+        offsets = index_bank(bank_file)
+        self.__store(entry_path, {"fingerprint": fingerprint, "offsets": offsets, })
+
+        return offsets
+
+    def __get_entry_path(self, bank_path):
+        """Return the path of a bank's cache entry."""
+        return join(self.directory, sha1(abspath(bank_path)).hexdigest())
+
+    def __store(self, entry_path, entry):
+        """Write a cache entry, failing silently (the cache is only an optimization)."""
+        try:
+            if not isdir(self.directory):
+                makedirs(self.directory)
+
+            # Write to a temporary file first, so a failed write won't leave a broken entry.
+            with open(entry_path + ".tmp", "w") as entry_file:
+                json.dump(entry, entry_file)
+
+            rename(entry_path + ".tmp", entry_path)
+        except EnvironmentError:
+            self.__log.warning("Couldn't write to parse cache '%s'", self.directory)
+
+def _get_fingerprint(bank_path, bank_file):
+    """Return the bank's path, size, modification time and the hash of its contents."""
+    status = stat(bank_path)
+    contents_hash = sha1()
+
+    bank_file.seek(0)
+    for chunk in iter(lambda: bank_file.read(CHUNK_SIZE), ""):
+        contents_hash.update(chunk)
+
+    return [abspath(bank_path), status.st_size, status.st_mtime, contents_hash.hexdigest(), ]
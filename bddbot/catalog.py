@@ -0,0 +1,273 @@
+"""Store a server's banks and progress in an SQLite database.
+
+The catalog imports each bank once: Its header, feature and scenarios are stored in indexed tables,
+along with the number of scenarios dealt from it and the client it's assigned to. A bank is only
+parsed again if its file changed since it was imported, so a server restarted over a large catalog
+doesn't parse anything, and dealing a scenario reads just that scenario from the database instead
+of keeping the banks' contents in memory.
+
+The database is kept in write-ahead logging mode and synced to disk only at its checkpoints, so a
+crash may lose the last few deals (and those scenarios are dealt again), but never the catalog.
+"""
+
+from os import stat
+from threading import Lock
+import sqlite3
+import logging
+from .bank import BaseBank, _get_output_path
+from .parser import iter_bank, read_bank
+from .errors import BotError
+
+CATALOG_PATH = ".bdd-catalog"
+CATALOG_VERSION = 2
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS banks (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        output_path TEXT NOT NULL,
+        header TEXT NOT NULL,
+        feature TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        dealt INTEGER NOT NULL DEFAULT 0,
+        client TEXT UNIQUE)""",
+    """CREATE TABLE IF NOT EXISTS scenarios (
+        bank_id INTEGER NOT NULL REFERENCES banks (id),
+        number INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (bank_id, number))""",
+    # Free banks (which aren't assigned or done), in the order they were imported.
+    """CREATE INDEX IF NOT EXISTS free_banks ON banks (id)
+        WHERE client IS NULL AND dealt < total""",
+]
+
+class CatalogError(BotError):
+    # pylint: disable=missing-docstring
+    pass
+
+class BankCatalog(object):
+    """Import banks into a database and deal them from it (see `CatalogBank`).
+
+    The catalog records the server's progress the same way a `DealJournal` does: `dealt` maps each
+    bank's path to the number of scenarios dealt from it, and `assigned` maps each client to its
+    bank's path. Dealt scenarios are recorded by the banks themselves, as they're dealt, so free
+    banks are looked up in the catalog as well (see `get_free_bank()`).
+
+    Calls are made one at a time, since the server might deal from several threads.
+    """
+    def __init__(self, path = CATALOG_PATH):
+        self.path = path
+        self.__lock = Lock()
+        self.__log = logging.getLogger(__name__)
+
+        # Statements are committed on their own, unless they're part of an import.
+        self.__connection = sqlite3.connect(path, isolation_level = None, check_same_thread = False)
+        self.__connection.text_factory = str
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__connection.execute("PRAGMA synchronous = NORMAL")
+
+        # Older versions' catalogs only lack some of the tables and indexes, which are created.
+        (version, ) = self.fetch_one("PRAGMA user_version")
+        if version < CATALOG_VERSION:
+            for statement in SCHEMA:
+                self.execute(statement)
+
+            self.execute("PRAGMA user_version = {:d}".format(CATALOG_VERSION))
+        elif CATALOG_VERSION != version:
+            raise CatalogError("Unsupported catalog version: {!r}".format(version))
+
+    @property
+    def dealt(self):
+        """The number of scenarios dealt from each bank (if any were dealt)."""
+        with self.__lock:
+            return dict(self.__connection.execute("SELECT path, dealt FROM banks WHERE 0 < dealt"))
+
+    @property
+    def assigned(self):
+        """The path of each client's bank."""
+        with self.__lock:
+            return dict(self.__connection.execute(
+                "SELECT client, path FROM banks WHERE client IS NOT NULL"))
+
+    def open(self, bank_path, cache = None):
+        """Return a bank from the catalog, importing it first if it's new or changed since it was
+        imported.
+
+        Re-imported banks keep the number of scenarios dealt from them (as long as they have that
+        many scenarios) and the client they were assigned to. If a parse cache is given, banks are
+        only parsed if they changed since they were last cached.
+        """
+        try:
+            status = stat(bank_path)
+        except OSError:
+            raise BotError("Couldn't open features bank '{:s}'".format(bank_path))
+
+        row = self.fetch_one("SELECT id, size, mtime FROM banks WHERE path = ?", bank_path)
+        if (row is None) or ((status.st_size, status.st_mtime) != row[1:]):
+            row = (self.__import(bank_path, status, row and row[0], cache), )
+
+        return CatalogBank(self, row[0])
+
+    def assign(self, client, bank_path):
+        """Record the client's assignment to a bank."""
+        with self.__lock:
+            if (bank_path, ) == self.__connection.execute(
+                    "SELECT path FROM banks WHERE client = ?", (client, )).fetchone():
+                return
+
+            with self.__connection:
+                self.__connection.execute("BEGIN")
+                self.__connection.execute(
+                    "UPDATE banks SET client = NULL WHERE client = ?", (client, ))
+                self.__connection.execute(
+                    "UPDATE banks SET client = ? WHERE path = ?", (client, bank_path))
+
+    def unassign(self, client):
+        """Record that the client isn't assigned a bank anymore."""
+        self.execute("UPDATE banks SET client = NULL WHERE client = ?", client)
+
+    def get_free_bank(self):
+        """Return the path of the first bank imported which isn't assigned or done (None if there
+        isn't any)."""
+        row = self.fetch_one(
+            "SELECT path FROM banks INDEXED BY free_banks "
+            "WHERE client IS NULL AND dealt < total ORDER BY id LIMIT 1")
+        return row and row[0]
+
+    def retain(self, bank_paths):
+        """Remove the banks which aren't in the given paths from the catalog."""
+        with self.__lock:
+            paths = [path for (path, ) in self.__connection.execute("SELECT path FROM banks")]
+
+        for path in set(paths).difference(bank_paths):
+            self.remove(path)
+
+    def remove(self, bank_path):
+        """Remove a bank from the catalog, along with its progress."""
+        with self.__lock, self.__connection:
+            self.__connection.execute("BEGIN")
+            self.__connection.execute(
+                "DELETE FROM scenarios WHERE bank_id IN (SELECT id FROM banks WHERE path = ?)",
+                (bank_path, ))
+            self.__connection.execute("DELETE FROM banks WHERE path = ?", (bank_path, ))
+
+    def close(self):
+        """Close the database."""
+        with self.__lock:
+            self.__connection.close()
+
+    def fetch_one(self, statement, *params):
+        """Execute a statement, returning its first row (None if there isn't any)."""
+        with self.__lock:
+            return self.__connection.execute(statement, params).fetchone()
+
+    def execute(self, statement, *params):
+        """Execute a statement, returning the number of rows it changed."""
+        with self.__lock:
+            return self.__connection.execute(statement, params).rowcount
+
+    def __import(self, bank_path, status, bank_id, cache):
+        """Parse a bank into the catalog (replacing its previous version, if it has an ID)."""
+        try:
+            with open(bank_path, "r") as bank_file:
+                if cache:
+                    sections = list(read_bank(bank_file, cache.index(bank_path, bank_file)))
+                else:
+                    sections = list(iter_bank(bank_file))
+        except IOError:
+            raise BotError("Couldn't open features bank '{:s}'".format(bank_path))
+
+        (header, feature, scenarios) = (sections[0], sections[1], sections[2:])
+        fields = (status.st_size, status.st_mtime, header, feature, len(scenarios))
+
+        with self.__lock, self.__connection:
+            self.__connection.execute("BEGIN")
+            if bank_id is None:
+                bank_id = self.__connection.execute(
+                    "INSERT INTO banks (size, mtime, header, feature, total, path, output_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    fields + (bank_path, _get_output_path(bank_path))).lastrowid
+            else:
+                self.__connection.execute(
+                    "UPDATE banks SET size = ?, mtime = ?, header = ?, feature = ?, total = ?, "
+                    "dealt = MIN(dealt, ?) WHERE id = ?",
+                    fields + (len(scenarios), bank_id))
+                self.__connection.execute("DELETE FROM scenarios WHERE bank_id = ?", (bank_id, ))
+
+            self.__connection.executemany(
+                "INSERT INTO scenarios (bank_id, number, text) VALUES (?, ?, ?)",
+                ((bank_id, number, text) for (number, text) in enumerate(scenarios, 1)))
+
+        self.__log.info("Imported features bank '%s' (%d scenario/s)", bank_path, len(scenarios))
+        return bank_id
+
+class CatalogBank(BaseBank):
+    """A bank in a catalog, which reads everything from the catalog's database when it's needed.
+
+    Nothing but the bank's ID is kept in memory. The scenarios dealt from it are recorded in the
+    database, and scenarios are read from it one at a time as they're dealt.
+    """
+    __slots__ = ("__catalog", "__id", )
+
+    def __init__(self, catalog, bank_id):
+        self.__catalog = catalog
+        self.__id = bank_id
+
+    def is_fresh(self):
+        return bool(self.__get("0 = dealt AND 0 < total"))
+
+    def is_done(self):
+        return bool(self.__get("total <= dealt"))
+
+    @property
+    def output_path(self):
+        return self.__get("output_path")
+
+    @property
+    def header(self):
+        return self.__get("header")
+
+    @property
+    def feature(self):
+        return self.__get("feature")
+
+    @property
+    def dealt_count(self):
+        """The number of scenarios dealt so far."""
+        return self.__get("dealt")
+
+    @property
+    def total_count(self):
+        """The number of scenarios in the bank."""
+        return self.__get("total")
+
+    def mark_dealt(self, count):
+        """Mark the first `count` scenarios as dealt (for example, when carrying progress over from
+        a previous version of the bank)."""
+        self.__catalog.execute(
+            "UPDATE banks SET dealt = MAX(dealt, MIN(?, total)) WHERE id = ?", count, self.__id)
+
+    def get_next_scenario(self):
+        if not self.__catalog.execute(
+                "UPDATE banks SET dealt = dealt + 1 WHERE id = ? AND dealt < total", self.__id):
+            # No more scenarios.
+            return None
+
+        (text, ) = self.__catalog.fetch_one(
+            "SELECT text FROM scenarios WHERE bank_id = ? AND "
+            "number = (SELECT dealt FROM banks WHERE id = ?)",
+            self.__id, self.__id)
+        return text
+
+    def return_scenario(self):
+        """Return the last scenario dealt to the bank, so it's dealt again next."""
+        self.__catalog.execute(
+            "UPDATE banks SET dealt = dealt - 1 WHERE id = ? AND 0 < dealt", self.__id)
+
+    def __get(self, expression):
+        """Read one of the bank's columns (or an expression of them) from the catalog."""
+        (value, ) = self.__catalog.fetch_one(
+            "SELECT {:s} FROM banks WHERE id = ?".format(expression), self.__id)
+        return value
@@ -1,6 +1,11 @@
 """Encapsulate configuration properties."""
 
 from ConfigParser import SafeConfigParser as ConfigParser
+from .cache import CACHE_PATH
+from .journal import JOURNAL_PATH, GROUP_COMMIT
+from .catalog import CATALOG_PATH
+from .bank import COMPRESS_THRESHOLD, TIMEOUT, RETRIES, RETRY_BACKOFF
+from .server import KEEP_ALIVE
 from .errors import BotError
 
 CONFIG_FILENAME = "bddbot.cfg"
@@ -21,15 +26,45 @@ class BotConfiguration(object):
         config.read([filename, ])
 
         self.__banks = _get_banks(config)
+        self.__cache = _get_cache(config)
+        self.__journal = _get_journal(config)
+        self.__catalog = _get_catalog(config)
         self.__tests = _get_tests(config)
+        self.__workers = _get_workers(config)
         self.__host = _get_host(config)
         self.__port = _get_port(config)
+        self.__lazy = _get_lazy(config)
+        self.__reload_interval = _get_reload_interval(config)
+        self.__keep_alive = _get_keep_alive(config)
+        self.__threads = _get_threads(config)
+        self.__event_loop = _get_event_loop(config)
+        self.__group_commit = _get_group_commit(config)
+        self.__compress_threshold = _get_compress_threshold(config)
+        self.__prefetch = _get_prefetch(config)
+        self.__timeout = _get_timeout(config)
+        self.__retries = _get_retries(config)
+        self.__retry_backoff = _get_retry_backoff(config)
 
     @property
     def banks(self):
         """Features bank paths."""
         return self.__banks
 
+    @property
+    def cache(self):
+        """The parse cache's directory (None if banks shouldn't be cached)."""
+        return self.__cache
+
+    @property
+    def journal(self):
+        """The server's journal path (None if the server shouldn't keep a journal)."""
+        return self.__journal
+
+    @property
+    def catalog(self):
+        """The server's catalog path (None if the server shouldn't deal from a catalog)."""
+        return self.__catalog
+
     @property
     def tests(self):
         """The commands to run BDD tests with.
@@ -39,6 +74,11 @@ class BotConfiguration(object):
         """
         return self.__tests
 
+    @property
+    def workers(self):
+        """The number of processes to parse banks in (1 if undefined, parsing them serially)."""
+        return self.__workers
+
     @property
     def host(self):
         """Server's hostname (None if undefined)."""
@@ -49,6 +89,70 @@ class BotConfiguration(object):
         """Server's port (None if undefined)."""
         return self.__port
 
+    @property
+    def lazy(self):
+        """Whether the server should load banks lazily (False if undefined)."""
+        return self.__lazy
+
+    @property
+    def reload_interval(self):
+        """The number of seconds between the server's checks for changed banks (None if undefined,
+        in which case banks aren't reloaded)."""
+        return self.__reload_interval
+
+    @property
+    def keep_alive(self):
+        """The number of seconds the server keeps idle connections open (0 to close them after each
+        request)."""
+        return self.__keep_alive
+
+    @property
+    def threads(self):
+        """The number of threads the server handles connections in (0 if undefined, handling them
+        one at a time)."""
+        return self.__threads
+
+    @property
+    def event_loop(self):
+        """Whether the server handles all connections in a single thread, over an event loop (False
+        if undefined)."""
+        return self.__event_loop
+
+    @property
+    def group_commit(self):
+        """The number of seconds the server's journal waits for more records before syncing them
+        to disk (0 to sync each record at once)."""
+        return self.__group_commit
+
+    @property
+    def compress_threshold(self):
+        """The size (in bytes) above which requests to and responses from the server are
+        compressed."""
+        return self.__compress_threshold
+
+    @property
+    def prefetch(self):
+        """Whether to fetch the next scenario from remote banks while the tests run (False if
+        undefined)."""
+        return self.__prefetch
+
+    @property
+    def timeout(self):
+        """The number of seconds to wait for the server before giving up on a request (None waits
+        forever)."""
+        return self.__timeout
+
+    @property
+    def retries(self):
+        """The number of times to retry failed requests to the server."""
+        return self.__retries
+
+    @property
+    def retry_backoff(self):
+        """The number of seconds to wait before retrying a failed request to the server (doubled
+        on each retry)."""
+        return self.__retry_backoff
+
 def _get_banks(config):
     """get the feature banks' paths from configuration."""
     if not config.has_option("paths", "bank"):
@@ -61,6 +165,40 @@ def _get_banks(config):
     # Return non-empty paths.
     return [path for path in paths if path]
 
+def _get_cache(config):
+    """Get the parse cache's directory from configuration.
+
+    Setting an empty value caches parsed banks in the default directory.
+    """
+    if not config.has_option("paths", "cache"):
+        return None
+
+    return config.get("paths", "cache") or CACHE_PATH
+
+def _get_journal(config):
+    """Get the server's journal path from configuration.
+
+    Setting an empty value keeps the journal in the default path.
+    """
+    if not config.has_option("paths", "journal"):
+        return None
+
+    return config.get("paths", "journal") or JOURNAL_PATH
+
+def _get_catalog(config):
+    """Get the server's catalog path from configuration.
+
+    Setting an empty value keeps the catalog in the default path. Since the catalog records the
+    server's progress, it can't be used along with a journal.
+    """
+    if not config.has_option("paths", "catalog"):
+        return None
+
+    if config.has_option("paths", "journal"):
+        raise ConfigError("Can't keep a journal along with a catalog")
+
+    return config.get("paths", "catalog") or CATALOG_PATH
+
 def _get_tests(config):
     """get the test commands from configuration."""
     if not config.has_option("test", "run"):
@@ -70,6 +208,17 @@ def _get_tests(config):
     commands = config.get("test", "run").splitlines()
     return [command.split() for command in commands if command]
 
+def _get_workers(config):
+    """Get the number of processes to parse banks in from configuration."""
+    if not config.has_option("load", "workers"):
+        return 1
+
+    workers = config.getint("load", "workers")
+    if workers < 1:
+        raise ConfigError("Number of workers must be positive")
+
+    return workers
+
 def _get_host(config):
     """Get the server's hostname from configuration."""
     if not config.has_option("server", "host"):
@@ -85,3 +234,119 @@ def _get_port(config):
 
     port = config.getint("server", "port")
     return port
+
+def _get_lazy(config):
+    """Get whether the server should load banks lazily from configuration."""
+    if not config.has_option("server", "lazy"):
+        return False
+
+    return config.getboolean("server", "lazy")
+
+def _get_reload_interval(config):
+    """Get the interval between the server's checks for changed banks from configuration."""
+    if not config.has_option("server", "reload_interval"):
+        return None
+
+    interval = config.getfloat("server", "reload_interval")
+    if interval < 0:
+        raise ConfigError("Reload interval can't be negative")
+
+    return interval
+
+def _get_keep_alive(config):
+    """Get how long the server keeps idle connections open from configuration."""
+    if not config.has_option("server", "keep_alive"):
+        return KEEP_ALIVE
+
+    keep_alive = config.getfloat("server", "keep_alive")
+    if keep_alive < 0:
+        raise ConfigError("Keep-alive timeout can't be negative")
+
+    return keep_alive
+
+def _get_threads(config):
+    """Get the number of threads the server handles connections in from configuration."""
+    if not config.has_option("server", "threads"):
+        return 0
+
+    threads = config.getint("server", "threads")
+    if threads < 0:
+        raise ConfigError("Number of threads can't be negative")
+
+    return threads
+
+def _get_event_loop(config):
+    """Get whether the server should handle connections over an event loop from configuration."""
+    if not config.has_option("server", "event_loop"):
+        return False
+
+    return config.getboolean("server", "event_loop")
+
+def _get_group_commit(config):
+    """Get how long the server's journal waits before syncing records to disk from configuration."""
+    if not config.has_option("server", "group_commit"):
+        return GROUP_COMMIT
+
+    interval = config.getfloat("server", "group_commit")
+    if interval < 0:
+        raise ConfigError("Group commit interval can't be negative")
+
+    return interval
+
+def _get_compress_threshold(config):
+    """Get the size above which the server's requests and responses are compressed from
+    configuration."""
+    if not config.has_option("server", "compress_threshold"):
+        return COMPRESS_THRESHOLD
+
+    threshold = config.getint("server", "compress_threshold")
+    if threshold < 0:
+        raise ConfigError("Compression threshold can't be negative")
+
+    return threshold
+
+def _get_prefetch(config):
+    """Get whether to prefetch remote banks' scenarios from configuration."""
+    if not config.has_option("server", "prefetch"):
+        return False
+
+    return config.getboolean("server", "prefetch")
+
+def _get_timeout(config):
+    """Get how long to wait for the server's responses from configuration.
+
+    Setting an empty value waits forever.
+    """
+    if not config.has_option("server", "timeout"):
+        return TIMEOUT
+
+    if not config.get("server", "timeout"):
+        return None
+
+    timeout = config.getfloat("server", "timeout")
+    if timeout <= 0:
+        raise ConfigError("Timeout must be positive")
+
+    return timeout
+
+def _get_retries(config):
+    """Get the number of times to retry failed requests from configuration."""
+    if not config.has_option("server", "retries"):
+        return RETRIES
+
+    retries = config.getint("server", "retries")
+    if retries < 0:
+        raise ConfigError("Number of retries can't be negative")
+
+    return retries
+
+def _get_retry_backoff(config):
+    """Get how long to wait before retrying failed requests from configuration."""
+    if not config.has_option("server", "retry_backoff"):
+        return RETRY_BACKOFF
+
+    backoff = config.getfloat("server", "retry_backoff")
+    if backoff < 0:
+        raise ConfigError("Retry backoff can't be negative")
+
+    return backoff
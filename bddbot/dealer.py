@@ -9,66 +9,114 @@ feature file 'features/awesome.feature'.
 """
 from os.path import dirname
 from os import mkdir
+from collections import OrderedDict
+import socket
 from subprocess import Popen, PIPE
+from multiprocessing.pool import ThreadPool
 import logging
-import pickle
-from .bank import Bank, RemoteBank
+from .bank import Bank, RemoteBank, RemoteSession
+from .bank import COMPRESS_THRESHOLD, TIMEOUT, RETRIES, RETRY_BACKOFF
+from .pool import ParallelIndex
+from .transport import parse_address, format_address
+from .state import read_state, write_state
+from .state import get_local_entry, get_remote_entry, is_remote_entry
 from .errors import BotError, ParsingError
 
 STATE_PATH = ".bdd-dealer"
 
 class Dealer(object):
     """Manage banks of features to dispense whenever a scenario is implemented."""
-    def __init__(self, bank_paths, tests, name = ""):
+    def __init__(self, bank_paths, tests, name = "", cache = None, workers = 1,
+                 compress_threshold = COMPRESS_THRESHOLD, prefetch = False, timeout = TIMEOUT,
+                 retries = RETRIES, retry_backoff = RETRY_BACKOFF):
+        # pylint: disable=too-many-arguments
         self.name = name
         self.__bank_paths = bank_paths
         self.__tests = tests
+        self.__cache = cache
+        self.__workers = workers
+        self.__compress_threshold = compress_threshold
+        self.__prefetch = prefetch
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__retry_backoff = retry_backoff
         self.__is_loaded = False
         self.__is_done = False
         self.__banks = []
+        self.__entries = []
+        self.__sessions = OrderedDict()
+        self.__saved_entries = None
         self.__log = logging.getLogger(__name__)
 
+        # Only the saved entries are read here, banks are restored from them when loading.
         try:
             self.__log.debug("Loading state")
             with open(STATE_PATH, "rb") as state:
-                self.__banks.extend(pickle.load(state))
+                self.__saved_entries = read_state(state, bank_paths)
         except IOError:
             pass
-        else:
-            self.__is_loaded = True
 
     @property
     def is_done(self):
         """Return True if no more scenarios are left to deal."""
-        if not self.__is_loaded:
+        if self.__is_loaded:
+            self.__fetch_statuses()
+            return all(bank.is_done() for bank in self.__banks)
+
+        if self.__saved_entries is None:
             return False
 
-        return all(bank.is_done() for bank in self.__banks)
+        # Remote banks have to be asked.
+        if any(is_remote_entry(entry) for entry in self.__saved_entries):
+            self.load()
+            return self.is_done
+
+        return all(entry["total"] <= entry["dealt"] for entry in self.__saved_entries)
 
     def save(self):
         """Save the bot's state to file."""
         self.__log.debug("Saving state")
+
+        if self.__is_loaded or (self.__saved_entries is None):
+            entries = [
+                get_remote_entry(path, bank) if digest is None
+                else get_local_entry(path, digest, bank)
+                for ((path, digest), bank) in zip(self.__entries, self.__banks)]
+        else:
+            entries = self.__saved_entries
+
         with open(STATE_PATH, "wb") as state:
-            pickle.dump(self.__banks, state)
+            write_state(state, entries)
 
     def load(self):
         """Load a feature from the bank."""
         if self.__is_loaded:
             return
 
+        if self.__saved_entries is not None:
+            self.__restore()
+            self.__is_loaded = True
+            return
+
         self.__log.debug("Loading banks")
 
         if self.__bank_paths:
+            index = self.__index_banks(self.__bank_paths)
+
             for path in self.__bank_paths:
                 if path.startswith("@"):
-                    (address, port) = path[1:].split(":")
-                    self._connect_to_server(address, int(port))
+                    self._connect_to_server(*parse_address(path))
                 else:
-                    self._load_file(path)
+                    self._load_file(path, index)
 
         else:
             self.__log.warning("No banks")
 
+        if self.__cache:
+            self.__log.info(
+                "Parse cache: %d hit/s, %d miss/es",
+                self.__cache.hits, self.__cache.misses)
+
         self.__is_loaded = True
 
     def deal(self):
@@ -84,11 +132,35 @@ class Dealer(object):
         if not self.__is_loaded:
             self.load()
 
+        try:
+            self.__deal()
+        finally:
+            # Servers which aren't threaded aren't kept waiting on their connections until the
+            # next deal (see `RemoteSession.close_idle()`).
+            for bank in self.__banks:
+                bank.close()
+
+    def __deal(self):
+        """Deal a scenario from the first bank that isn't done (see `deal()`)."""
+        self.__fetch_statuses()
+
         # Unless it's the first scenario to be dealt, test all scenarios so far.
         if not all(bank.is_fresh() for bank in self.__banks):
+            # Fetch the next scenario while the tests run (it's released if they fail).
+            prefetched_bank = self.__prefetch_scenario() if self.__prefetch else None
+
+            # Connections are idle while the tests run (the prefetching bank's once it's reserved).
+            for (session, banks) in self.__sessions.itervalues():
+                if prefetched_bank not in banks:
+                    session.close_idle()
+
             if not self._are_tests_passing():
                 raise BotError("Can't deal while there are unimplemented scenarios")
 
+            # This doesn't wait for the server, which is told on the next deal (see `RemoteBank`).
+            if prefetched_bank:
+                prefetched_bank.commit()
+
         # Find the first bank that still has scenarios to deal.
         current_bank = next((bank for bank in self.__banks if not bank.is_done()), None)
 
@@ -101,12 +173,12 @@ class Dealer(object):
         else:
             self._deal_another(current_bank)
 
-    def _load_file(self, path):
-        """Load a bank file."""
+    def _load_file(self, path, cache = None):
+        """Load a bank file (using the given cache, if any, to look up its parsed offsets)."""
         self.__log.info("Loading features bank '%s'", path)
 
         try:
-            self.__banks.append(Bank(path))
+            self.__banks.append(Bank(path, cache = cache))
         except ParsingError as parsing_error:
             # Supply the bank path and re-raise.
             parsing_error.filename = path
@@ -116,10 +188,98 @@ class Dealer(object):
                 path, parsing_error.line, parsing_error.filename)
             raise
 
-    def _connect_to_server(self, host, port):
-        """Connect to remote bank server."""
-        self.__log.info("Connecting to remote server at %s:%d", host, port)
-        self.__banks.append(RemoteBank(self.name, host, port))
+        self.__entries.append((path, self.__banks[-1].digest))
+
+    def __restore(self):
+        """Restore the banks from the saved state's entries, re-reading local banks' files."""
+        self.__log.debug("Restoring banks")
+        local_paths = [
+            entry["path"] for entry in self.__saved_entries if not is_remote_entry(entry)]
+        index = self.__index_banks(local_paths)
+
+        for entry in self.__saved_entries:
+            path = entry["path"]
+            if is_remote_entry(entry):
+                self._connect_to_server(*parse_address(path))
+                self.__banks[-1].committed = entry.get("committed")
+                continue
+
+            self._load_file(path, index)
+            if entry["sha1"] not in (None, self.__entries[-1][1]):
+                self.__log.warning("Features bank '%s' changed since the state was saved", path)
+
+            self.__banks[-1].mark_dealt(entry["dealt"])
+
+    def __prefetch_scenario(self):
+        """Prefetch the next scenario from the first bank that isn't done, returning that bank."""
+        current_bank = next((bank for bank in self.__banks if not bank.is_done()), None)
+        if current_bank:
+            current_bank.prefetch()
+
+        return current_bank
+
+    def __fetch_statuses(self):
+        """Fetch remote banks' statuses from their servers concurrently.
+
+        Otherwise, each server is only asked once the previous one answered while going over the
+        banks, so querying them takes as long as all servers together instead of the slowest one.
+        Banks on the same server are queried together, in a single call.
+        """
+        sessions = self.__sessions.values()
+        if sum(len(banks) for (_, banks) in sessions) <= 1:
+            return
+
+        if 1 == len(sessions):
+            _fetch_statuses(sessions[0])
+            return
+
+        pool = ThreadPool(len(sessions))
+        try:
+            pool.map(_fetch_statuses, sessions)
+        finally:
+            pool.close()
+            pool.join()
+
+    def __index_banks(self, bank_paths):
+        """Index the bank files in advance in a pool of worker processes, if configured to.
+
+        Returns the index for banks to look up their offsets in (or the parse cache, if not).
+        """
+        local_paths = [path for path in bank_paths if not path.startswith("@")]
+        if (self.__workers <= 1) or (len(local_paths) <= 1):
+            return self.__cache
+
+        self.__log.debug("Parsing %d banks in %d processes", len(local_paths), self.__workers)
+        return ParallelIndex(local_paths, self.__workers, self.__cache)
+
+    def _connect_to_server(self, protocol, host, port):
+        """Connect to remote bank server.
+
+        Banks on the same server (even if it's listed under different host names) share a single
+        connection. Each is a separate slot on the server, dealt to a client of its own (see
+        `_get_slot_client()`).
+        """
+        endpoint = (protocol, _resolve_host(host), port)
+        if endpoint not in self.__sessions:
+            self.__log.info("Connecting to remote server at %s:%d (%s)", host, port, protocol)
+            session = RemoteSession(
+                host, port,
+                compress_threshold = self.__compress_threshold,
+                protocol = protocol,
+                timeout = self.__timeout,
+                retries = self.__retries,
+                retry_backoff = self.__retry_backoff)
+            self.__sessions[endpoint] = (session, [])
+
+        (session, banks) = self.__sessions[endpoint]
+        client = _get_slot_client(self.name, len(banks))
+        if banks:
+            self.__log.info("Sharing the connection to %s:%d as '%s'", host, port, client)
+
+        bank = RemoteBank(client, host, port, session = session)
+        banks.append(bank)
+        self.__banks.append(bank)
+        self.__entries.append((format_address(protocol, host, port), None))
 
     def _are_tests_passing(self):
         """Verify that all scenarios were implemented using `behave`.
@@ -191,3 +351,29 @@ class Dealer(object):
             output_path, scenario.splitlines()[0].lstrip())
 
         stream.write(scenario)
+
+def _fetch_statuses(server):
+    """Fetch the statuses of a server's banks (in one of the pool's threads)."""
+    (session, banks) = server
+    session.fetch_statuses(banks)
+
+def _resolve_host(host):
+    """Return the host's address, to tell whether different host names are the same server.
+
+    Hosts which can't be resolved (yet) are told apart by their names.
+    """
+    try:
+        return socket.gethostbyname(host)
+    except socket.error:
+        return host
+
+def _get_slot_client(name, slot):
+    """Return the client name a dealer deals a server's n-th bank to.
+
+    The first bank is dealt to the dealer's own name, the others to "name#2", "name#3", etc. so
+    the server assigns each its own bank.
+    """
+    if 0 == slot:
+        return name
+
+    return "{:s}#{:d}".format(name, slot + 1)
@@ -0,0 +1,339 @@
+"""Serve banks from a single thread, over an event loop.
+
+The `EventLoopServer` handles all of its connections at once in a single thread (using `asyncore`),
+instead of one at a time or a thread each. Idle connections cost next to nothing but a socket, so
+the server keeps thousands of clients' connections open on a single core.
+
+It's a `BankServer` in every other way: It serves the same methods, over the same protocols
+(XML-RPC over HTTP and length-prefixed JSON, see `bddbot.transport`) on the same port.
+"""
+
+import asyncore
+import errno
+import json
+import select
+import socket
+from BaseHTTPServer import BaseHTTPRequestHandler
+from threading import Event
+from timeit import default_timer
+from xmlrpclib import gzip_encode, gzip_decode
+import logging
+from .server import BankServer, KeepAliveRequestHandler
+from .transport import JSON_MARKER, MAX_MESSAGE_SIZE, HEADER, pack_message
+
+RECEIVE_SIZE = 0x10000
+MAX_HEADERS_SIZE = 0x10000
+
+# Seconds to stop accepting connections for, once the server runs out of file descriptors.
+ACCEPT_BACKOFF = 0.1
+
+# poll() isn't limited to a thousand or so connections, the way select() is.
+USE_POLL = hasattr(select, "poll")
+
+class _BadRequest(Exception):
+    """A request which can't be handled, closing its connection (along with the HTTP status)."""
+    def __init__(self, message, status = 400):
+        super(_BadRequest, self).__init__(message)
+        self.status = status
+
+class EventLoopServer(BankServer):
+    """A bank server which handles all connections in a single thread.
+
+    Idle connections are closed after the keep-alive timeout (and connections are closed after a
+    single request if it's zero), the same as the `BankServer`. Since connections don't hold up
+    each other, the timeout can be much longer.
+    """
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, *args, **kwargs):
+        super(EventLoopServer, self).__init__(*args, **kwargs)
+        self.__channels = {}
+        self.__is_serving = False
+        self.__is_stopped = Event()
+        self.__is_stopped.set()
+        self.__log = logging.getLogger(__name__)
+
+    @property
+    def connections(self):
+        """The number of open connections."""
+        return sum(1 for channel in self.__channels.values() if isinstance(channel, _Channel))
+
+    def serve_forever(self, poll_interval = 0.5):
+        """Start serving, until `shutdown()` is called."""
+        (address, port) = self.server_address
+        self.__log.info("Server started on %s:%d (event loop)", address, port)
+
+        self.__is_stopped.clear()
+        self.__is_serving = True
+        listener = _Listener(self, self.__channels)
+        next_check = default_timer() + poll_interval
+
+        try:
+            while self.__is_serving:
+                asyncore.loop(poll_interval, USE_POLL, self.__channels, count = 1)
+
+                # Checking every connection on every event would slow down busy servers.
+                if next_check <= default_timer():
+                    self.__close_idle()
+                    next_check = default_timer() + poll_interval
+        finally:
+            # The listening socket is the server's to close (see `server_close()`).
+            listener.del_channel()
+            for channel in self.__channels.values():
+                channel.close()
+
+            self.__is_stopped.set()
+
+    def shutdown(self):
+        """Stop serving, waiting for the event loop to stop."""
+        self.__log.info("Stopped serving")
+        self.__is_serving = False
+        self.__is_stopped.wait()
+
+    def __close_idle(self):
+        """Close connections which were idle for longer than the keep-alive timeout."""
+        if not self.keep_alive:
+            return
+
+        oldest = default_timer() - self.keep_alive
+        for channel in self.__channels.values():
+            if isinstance(channel, _Channel) and channel.is_idle_since(oldest):
+                channel.close()
+
+class _Listener(asyncore.dispatcher):
+    """Accept connections on the server's socket.
+
+    Once the server runs out of file descriptors, pending connections can't be accepted but the
+    socket stays readable. So the listener stops accepting for a while (until other connections are
+    closed, hopefully), instead of trying again on every event.
+    """
+    def __init__(self, server, channels):
+        asyncore.dispatcher.__init__(self, server.socket, channels)
+        self.accepting = True
+        self.__server = server
+        self.__channels = channels
+        self.__paused_until = 0
+
+    def readable(self):
+        return self.__paused_until <= default_timer()
+
+    def handle_accept(self):
+        # Accept all pending connections at once, so a burst of clients doesn't fill the backlog.
+        for _ in xrange(self.__server.request_queue_size):
+            try:
+                connection = self.accept()
+            except socket.error as error:
+                if error.errno not in (errno.EMFILE, errno.ENFILE):
+                    raise
+
+                logging.getLogger(__name__).warning(
+                    "Too many open files, not accepting connections for %.1fs (see 'ulimit -n')",
+                    ACCEPT_BACKOFF)
+                self.__paused_until = default_timer() + ACCEPT_BACKOFF
+                return
+
+            if connection is None:
+                return
+
+            (sock, _) = connection
+            _Channel(self.__server, sock, self.__channels)
+
+    def handle_error(self):
+        logging.getLogger(__name__).exception("Failed accepting a connection")
+
+class _Channel(asyncore.dispatcher):
+    """Handle requests on a connection, in whichever protocol the client speaks.
+
+    Requests are read into a buffer until they're complete, then handled and their responses sent
+    (a bit at a time, as the connection can take them) while the next requests are read.
+    """
+    def __init__(self, server, sock, channels):
+        asyncore.dispatcher.__init__(self, sock, channels)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__server = server
+        self.__input = ""
+        self.__output = ""
+        self.__handle_request = None
+        self.__is_closing = False
+        self.__last_active = default_timer()
+
+    def is_idle_since(self, oldest):
+        """Return True if there was no activity on the connection since the given time."""
+        return (self.__last_active < oldest) and (not self.__output)
+
+    def readable(self):
+        return not self.__is_closing
+
+    def writable(self):
+        return bool(self.__output)
+
+    def handle_read(self):
+        data = self.recv(RECEIVE_SIZE)
+        if not data:
+            return
+
+        self.__last_active = default_timer()
+        self.__input += data
+
+        # The first byte tells the protocols apart.
+        if self.__handle_request is None:
+            is_json = self.__input.startswith(JSON_MARKER)
+            self.__handle_request = self.__handle_json if is_json else self.__handle_http
+
+        try:
+            while self.__input and (not self.__is_closing) and self.__handle_request():
+                pass
+        except _BadRequest as error:
+            logging.getLogger(__name__).debug("Bad request from %s: %s", self.addr, error)
+            if self.__handle_request == self.__handle_http:
+                self.__respond_http(error.status, is_closing = True)
+
+            self.__close_when_sent()
+
+    def handle_write(self):
+        sent = self.send(self.__output)
+        self.__output = self.__output[sent:]
+        self.__last_active = default_timer()
+
+        if self.__is_closing and (not self.__output):
+            self.close()
+
+    def handle_close(self):
+        self.close()
+
+    def handle_error(self):
+        logging.getLogger(__name__).debug(
+            "Failed handling a connection from %s", self.addr, exc_info = True)
+        self.close()
+
+    def __handle_json(self):
+        """Handle a length-prefixed JSON request, if it was read in whole (see `handle_read()`)."""
+        if len(self.__input) < HEADER.size:
+            return False
+
+        (size, ) = HEADER.unpack_from(self.__input)
+        if MAX_MESSAGE_SIZE < size:
+            raise _BadRequest("Message too large ({:d} bytes)".format(size))
+
+        end = HEADER.size + size
+        if len(self.__input) < end:
+            return False
+
+        try:
+            request = json.loads(self.__input[HEADER.size:end])
+        except ValueError:
+            raise _BadRequest("Malformed message")
+
+        self.__input = self.__input[end:]
+
+        # pylint: disable=protected-access
+        self.__output += pack_message(self.__server._dispatch_json(request))
+        if not self.__server.keep_alive:
+            self.__close_when_sent()
+
+        return True
+
+    def __handle_http(self):
+        """Handle an XML-RPC request, if it was read in whole (see `handle_read()`)."""
+        headers_end = self.__input.find("\r\n\r\n")
+        if headers_end < 0:
+            if MAX_HEADERS_SIZE < len(self.__input):
+                raise _BadRequest("Headers too large")
+
+            return False
+
+        (method, path, version, headers) = _parse_headers(self.__input[:headers_end])
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise _BadRequest("Bad content length")
+
+        if MAX_MESSAGE_SIZE < length:
+            raise _BadRequest("Request too large ({:d} bytes)".format(length), 413)
+
+        body_start = headers_end + len("\r\n\r\n")
+        if len(self.__input) < body_start + length:
+            return False
+
+        body = self.__input[body_start:body_start + length]
+        self.__input = self.__input[body_start + length:]
+
+        if "POST" != method:
+            raise _BadRequest("Unsupported method '{:s}'".format(method), 501)
+
+        if path not in KeepAliveRequestHandler.rpc_paths:
+            raise _BadRequest("No such path '{:s}'".format(path), 404)
+
+        # HTTP/1.0 clients (and those which asked to) close the connection after a request.
+        connection = headers.get("connection", "").lower()
+        is_closing = (not self.__server.keep_alive) or ("close" == connection) or \
+                     (("HTTP/1.0" == version) and ("keep-alive" != connection))
+
+        self.__respond_xmlrpc(_decode_body(body, headers), headers, is_closing)
+        if is_closing:
+            self.__close_when_sent()
+
+        return True
+
+    def __respond_xmlrpc(self, body, headers, is_closing):
+        """Dispatch an XML-RPC request, responding compressed if it's large and the client accepts
+        it compressed."""
+        # pylint: disable=protected-access
+        response = self.__server._marshaled_dispatch(body)
+
+        response_headers = [("Content-Type", "text/xml"), ]
+        threshold = self.__server.compress_threshold
+        if (threshold is not None) and (threshold < len(response)) and \
+           ("gzip" in headers.get("accept-encoding", "")):
+            response = gzip_encode(response)
+            response_headers.append(("Content-Encoding", "gzip"))
+
+        self.__respond_http(200, is_closing, response_headers, response)
+
+    def __respond_http(self, status, is_closing, headers = (), body = ""):
+        """Queue an HTTP response to be sent."""
+        lines = ["HTTP/1.1 {:d} {:s}".format(status, BaseHTTPRequestHandler.responses[status][0])]
+        lines.extend("{:s}: {:s}".format(name, value) for (name, value) in headers)
+        lines.append("Content-Length: {:d}".format(len(body)))
+        if is_closing:
+            lines.append("Connection: close")
+
+        self.__output += "\r\n".join(lines) + "\r\n\r\n" + body
+
+    def __close_when_sent(self):
+        """Stop reading requests and close the connection once the responses were sent."""
+        self.__is_closing = True
+        if not self.__output:
+            self.close()
+
+def _parse_headers(text):
+    """Return an HTTP request's method, path, version and headers (with lowercase names)."""
+    lines = text.split("\r\n")
+    try:
+        (method, path, version) = lines[0].split()
+    except ValueError:
+        raise _BadRequest("Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        (name, separator, value) = line.partition(":")
+        if not separator:
+            raise _BadRequest("Malformed header")
+
+        headers[name.strip().lower()] = value.strip()
+
+    return (method, path, version, headers)
+
+def _decode_body(body, headers):
+    """Decode a request's body, if it was compressed."""
+    encoding = headers.get("content-encoding", "identity").lower()
+    if "identity" == encoding:
+        return body
+
+    if "gzip" != encoding:
+        raise _BadRequest("Unsupported encoding '{:s}'".format(encoding), 501)
+
+    try:
+        return gzip_decode(body)
+    except ValueError:
+        raise _BadRequest("Malformed compressed body")
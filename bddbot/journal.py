@@ -0,0 +1,220 @@
+"""Keep a server's progress in an append-only journal, so it survives restarts.
+
+The journal records which bank each client was assigned and how many scenarios were dealt from
+each bank, one JSON record per line. Records are written as they happen, but only synced to disk
+once every group-commit interval (so a burst of deals costs a single `fsync()`), which means a
+crash loses at most the last interval's deals (and those scenarios are dealt again).
+
+Replaying the journal gives back the progress it recorded. Since only the latest record of each
+client and bank matters, the journal is compacted once it grows much larger than the progress it
+records: It's rewritten with a record per client and bank, replacing the old one in a single rename.
+"""
+
+from os import fsync, rename
+from threading import Lock, Timer
+import json
+import logging
+from .errors import BotError
+
+JOURNAL_PATH = ".bdd-journal"
+JOURNAL_VERSION = 1
+
+# Seconds to wait for more records before syncing them to disk (0 syncs every record at once).
+GROUP_COMMIT = 0.05
+
+# Compact the journal once it has at least this many records, more than twice its live records.
+COMPACT_SIZE = 10000
+
+(EVENT_ASSIGN, EVENT_UNASSIGN, EVENT_DEAL, EVENT_REMOVE) = ("assign", "unassign", "deal", "remove")
+
+class JournalError(BotError):
+    # pylint: disable=missing-docstring
+    pass
+
+class DealJournal(object):
+    """Record clients' assignments and banks' dealt scenarios in a journal file.
+
+    Opening the journal replays it: `dealt` maps each bank's path to the number of scenarios dealt
+    from it, and `assigned` maps each client to its bank's path. Recording a change that doesn't
+    change either (assigning a client the bank it already has, for example) writes nothing.
+
+    Call `close()` to sync the last records and close the journal.
+    """
+    def __init__(self, path = JOURNAL_PATH, group_commit = GROUP_COMMIT,
+                 compact_size = COMPACT_SIZE):
+        self.path = path
+        self.group_commit = group_commit
+        self.compact_size = compact_size
+        self.dealt = {}
+        self.assigned = {}
+        self.__records = 0
+        self.__timer = None
+        self.__lock = Lock()
+        self.__log = logging.getLogger(__name__)
+
+        end = self.__replay()
+        self.__file = open(path, "r+b" if end else "wb")
+        if end:
+            # Drop whatever was half-written when the server stopped.
+            self.__file.truncate(end)
+            self.__file.seek(end)
+        else:
+            self.__write({"version": JOURNAL_VERSION, })
+            self.__sync()
+
+    def assign(self, client, path):
+        """Record the client's assignment to a bank."""
+        with self.__lock:
+            if path != self.assigned.get(client):
+                self.assigned[client] = path
+                self.__record({"event": EVENT_ASSIGN, "client": client, "bank": path, })
+
+    def unassign(self, client):
+        """Record that the client isn't assigned a bank anymore."""
+        with self.__lock:
+            if self.assigned.pop(client, None) is not None:
+                self.__record({"event": EVENT_UNASSIGN, "client": client, })
+
+    def deal(self, path, count):
+        """Record the number of scenarios dealt from a bank so far."""
+        with self.__lock:
+            if count != self.dealt.get(path, 0):
+                self.dealt[path] = count
+                self.__record({"event": EVENT_DEAL, "bank": path, "dealt": count, })
+
+    def remove(self, path):
+        """Forget a bank's progress (and its clients' assignments)."""
+        with self.__lock:
+            clients = [client for (client, bank) in self.assigned.iteritems() if path == bank]
+            for client in clients:
+                self.assigned.pop(client)
+
+            if (self.dealt.pop(path, None) is not None) or clients:
+                self.__record({"event": EVENT_REMOVE, "bank": path, })
+
+    def sync(self):
+        """Sync the records written so far to disk."""
+        with self.__lock:
+            self.__sync()
+
+    def compact(self):
+        """Rewrite the journal with only the records needed to replay it."""
+        with self.__lock:
+            self.__compact()
+
+    def close(self):
+        """Sync the journal and close it."""
+        with self.__lock:
+            self.__sync()
+            self.__file.close()
+
+    def __replay(self):
+        """Read the journal's records, returning the offset past the last complete one (or zero if
+        there's no journal yet)."""
+        try:
+            journal_file = open(self.path, "rb")
+        except IOError:
+            return 0
+
+        with journal_file:
+            end = 0
+            for line in journal_file:
+                # A record cut short (by a crash, for example) is the last one written.
+                try:
+                    record = json.loads(line) if line.endswith("\n") else None
+                except ValueError:
+                    record = None
+
+                if record is None:
+                    self.__log.warning("Ignoring a partial record in journal '%s'", self.path)
+                    break
+
+                if 0 == end:
+                    if JOURNAL_VERSION != record.get("version"):
+                        raise JournalError(
+                            "Unsupported journal version: {!r}".format(record.get("version")))
+                else:
+                    self.__apply(record)
+                    self.__records += 1
+
+                end += len(line)
+
+        self.__log.info("Replayed %d record/s from journal '%s'", self.__records, self.path)
+        return end
+
+    def __apply(self, record):
+        """Apply a record to the journal's progress."""
+        event = record["event"]
+        if EVENT_ASSIGN == event:
+            self.assigned[record["client"]] = record["bank"]
+        elif EVENT_UNASSIGN == event:
+            self.assigned.pop(record["client"], None)
+        elif EVENT_DEAL == event:
+            self.dealt[record["bank"]] = record["dealt"]
+        elif EVENT_REMOVE == event:
+            self.dealt.pop(record["bank"], None)
+            for (client, path) in self.assigned.items():
+                if record["bank"] == path:
+                    self.assigned.pop(client)
+        else:
+            raise JournalError("Unknown journal event: {!r}".format(event))
+
+    def __record(self, record):
+        """Write a record, syncing it along with the rest of its group (with the lock held)."""
+        self.__write(record)
+        self.__records += 1
+
+        if (self.compact_size <= self.__records) and \
+           (2 * (len(self.dealt) + len(self.assigned)) < self.__records):
+            self.__compact()
+        elif not self.group_commit:
+            self.__sync()
+        elif self.__timer is None:
+            # The first record of a group schedules the sync for all of them.
+            self.__timer = Timer(self.group_commit, self.sync)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def __write(self, record):
+        """Append a record to the journal file."""
+        self.__file.write(json.dumps(record, separators = (",", ":")) + "\n")
+
+    def __sync(self):
+        """Flush the journal file and sync it to disk (with the lock held)."""
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+        if not self.__file.closed:
+            self.__file.flush()
+            fsync(self.__file.fileno())
+
+    def __compact(self):
+        """Replace the journal with a new one, holding the records needed to replay it (with the
+        lock held)."""
+        self.__sync()
+
+        records = [{"version": JOURNAL_VERSION, }]
+        records.extend(
+            {"event": EVENT_DEAL, "bank": path, "dealt": count, }
+            for (path, count) in sorted(self.dealt.iteritems()))
+        records.extend(
+            {"event": EVENT_ASSIGN, "client": client, "bank": path, }
+            for (client, path) in sorted(self.assigned.iteritems()))
+
+        # Write to a temporary file first, so a failed write won't leave a broken journal.
+        with open(self.path + ".tmp", "wb") as compacted:
+            for record in records:
+                compacted.write(json.dumps(record, separators = (",", ":")) + "\n")
+
+            compacted.flush()
+            fsync(compacted.fileno())
+
+        rename(self.path + ".tmp", self.path)
+        self.__log.debug(
+            "Compacted journal '%s' from %d to %d record/s",
+            self.path, self.__records, len(records) - 1)
+
+        self.__file.close()
+        self.__file = open(self.path, "ab")
+        self.__records = len(records) - 1
@@ -3,10 +3,10 @@
 import re
 from .errors import ParsingError
 
-REGEX_FEATURE_START = re.compile(r"^\s*Feature:")
-REGEX_TAGS = re.compile(r"^\s*(?:@\w+(?:\s+@\w+)*)")
-REGEX_SCENARIO_START = re.compile(r"^\s*Scenario(?: Outline)?:")
-REGEX_MULTILINE_START = re.compile(r"^\s*(?:\"\"\"|''')")
+FEATURE_START = "Feature:"
+SCENARIO_START = ("Scenario:", "Scenario Outline:", )
+MULTILINE_START = ("\"\"\"", "'''", )
+REGEX_TAGS = re.compile(r"@\w")
 
 (STATE_HEADER,
  STATE_FEATURE_TAGS,
@@ -15,14 +15,113 @@ REGEX_MULTILINE_START = re.compile(r"^\s*(?:\"\"\"|''')")
  STATE_SCENARIO,
  STATE_MULTILINE) = range(6)
 
+(TOKEN_TEXT,
+ TOKEN_TAGS,
+ TOKEN_FEATURE,
+ TOKEN_SCENARIO,
+ TOKEN_MULTILINE) = range(5)
+
+(SECTION_HEADER,
+ SECTION_FEATURE,
+ SECTION_SCENARIO) = range(3)
+
+# For each state and token: The next state and the kind of section the line starts (or None if the
+# line belongs to the current section). Tokens without a transition leave the state as it is.
+TRANSITIONS = {
+    STATE_HEADER: {
+        TOKEN_TAGS: (STATE_FEATURE_TAGS, SECTION_FEATURE),
+        TOKEN_FEATURE: (STATE_FEATURE, SECTION_FEATURE),
+    },
+    STATE_FEATURE_TAGS: {
+        TOKEN_TAGS: (STATE_FEATURE_TAGS, None),
+        TOKEN_FEATURE: (STATE_FEATURE, None),
+    },
+    STATE_FEATURE: {
+        TOKEN_TAGS: (STATE_SCENARIO_TAGS, SECTION_SCENARIO),
+        TOKEN_SCENARIO: (STATE_SCENARIO, SECTION_SCENARIO),
+    },
+    STATE_SCENARIO_TAGS: {
+        TOKEN_TAGS: (STATE_SCENARIO_TAGS, None),
+        TOKEN_SCENARIO: (STATE_SCENARIO, None),
+    },
+    STATE_SCENARIO: {
+        TOKEN_TAGS: (STATE_SCENARIO_TAGS, SECTION_SCENARIO),
+        TOKEN_SCENARIO: (STATE_SCENARIO, SECTION_SCENARIO),
+        TOKEN_MULTILINE: (STATE_MULTILINE, None),
+    },
+}
+
+# States in which a token without a transition is an error.
+ERRORS = {
+    STATE_FEATURE_TAGS: "Invalid line (should be tags or feature): {:s}",
+    STATE_SCENARIO_TAGS: "Invalid line (should be tags or scenario): {:s}",
+}
+
 def parse_bank(contents):
     """Parse the contents of a bank file."""
-    parser = BankParser(contents)
+    parser = BankParser(contents.splitlines())
     return parser.parse()
 
+def index_bank(lines):
+    """Parse a bank from an iterable of lines (including line endings), returning its offsets.
+
+    Instead of the sections' texts, this returns a list of byte offsets: The beginning of the
+    feature, the beginning of each scenario and finally the end of the bank. This means the header
+    lies between the beginning of the file and the first offset, and each following section lies
+    between its offset and the next one. Use `normalize_section()` to get a section's text out of
+    the bank's contents.
+    """
+    parser = BankParser(lines)
+    return parser.index()
+
+def normalize_section(kind, contents, is_last):
+    """Normalize a section's contents, as sliced from a bank by its offsets, to its parsed text."""
+    return _normalize((kind, 0, contents.splitlines()), is_last)
+
+def read_bank(bank_file, offsets):
+    """Read a bank's sections from a file, given their offsets (see `index_bank()`).
+
+    Like `iter_bank()`, this generator yields the header, the feature and then each scenario.
+    """
+    bank_file.seek(0)
+    yield normalize_section(SECTION_HEADER, bank_file.read(offsets[0]), False)
+
+    kinds = [SECTION_FEATURE, ] + [SECTION_SCENARIO, ] * (len(offsets) - 2)
+    for (i, kind) in enumerate(kinds):
+        is_last = (len(kinds) - 1 == i)
+        yield normalize_section(kind, bank_file.read(offsets[i + 1] - offsets[i]), is_last)
+
+def iter_bank(lines):
+    """Parse a bank from an iterable of lines (an open file, for example).
+
+    This generator yields the header first, then the feature and then each of the scenarios in
+    order, each as soon as the beginning of the next section is seen. The header and feature are
+    always yielded, even if they're empty.
+    """
+    parser = BankParser(lines)
+    return parser.iter_parse()
+
+def classify_line(line):
+    """Return the token a line stands for, by the first characters after its indentation."""
+    text = line.lstrip()
+    first = text[:1]
+
+    if "@" == first:
+        return TOKEN_TAGS if REGEX_TAGS.match(text) else TOKEN_TEXT
+
+    if "F" == first:
+        return TOKEN_FEATURE if text.startswith(FEATURE_START) else TOKEN_TEXT
+
+    if "S" == first:
+        return TOKEN_SCENARIO if text.startswith(SCENARIO_START) else TOKEN_TEXT
+
+    if first and (first in "\"'") and text.startswith(MULTILINE_START):
+        return TOKEN_MULTILINE
+
+    return TOKEN_TEXT
+
 class BankParser(object):
     # pylint: disable=too-few-public-methods
-    # pylint: disable=too-many-instance-attributes
     """A simple feature parser.
 
     Since we only really need to know mostly when the feature/scenarios start we don't really
@@ -30,149 +129,119 @@ class BankParser(object):
     file to the header (anything before the beginning of the feature), the feature's body (including
     the description and background section), and the scenarios (including multiline texts, data
     tables and scenario outlines' examples).
+
+    Each line is classified only once (see `classify_line()`) and the resulting token drives the
+    parser's state machine (see `TRANSITIONS`).
     """
 
-    def __init__(self, contents):
-        self.header = []
-        self.feature = []
-        self.scenarios = []
-
-        self.__contents = contents.splitlines()
-        self.__state = STATE_HEADER
-        self.__line = 0
-        self.__multiline_start = 0
-        self.__multiline_delimiter = None
-        self.__tags = []
-        self.__callbacks = {
-            STATE_HEADER: self.__parse_header,
-            STATE_FEATURE_TAGS: self.__parse_feature_tags,
-            STATE_FEATURE: self.__parse_feature,
-            STATE_SCENARIO_TAGS: self.__parse_scenario_tags,
-            STATE_SCENARIO: self.__parse_scenario,
-            STATE_MULTILINE: self.__parse_multiline_text,
-        }
-
-    @property
-    def __parse_line(self):
-        """Return a parsing callback according to the current state."""
-        return self.__callbacks[self.__state]
+    def __init__(self, lines):
+        self.__lines = lines
+        self.__section = (SECTION_HEADER, 0, [])
+        self.__offset = 0
 
     def parse(self):
         """Parse the contents of a bank file."""
-        for line in self.__contents:
-            self.__line += 1
-            self.__parse_line(line)
+        sections = self.iter_parse()
+        header = next(sections)
+        feature = next(sections)
 
-        if STATE_MULTILINE == self.__state:
-            raise ParsingError("Multiline text has no end", self.__multiline_start)
+        return (header, feature, list(sections))
 
-        if self.__state in (STATE_FEATURE_TAGS, STATE_SCENARIO_TAGS, ):
-            raise ParsingError("Dangling tags", self.__line)
+    def iter_parse(self):
+        """Parse the bank's lines, yielding each section's text as soon as it's complete."""
+        for (section, is_last) in self.__iter_sections():
+            yield _normalize(section, is_last)
 
-        self.__normalize()
+        # The feature is always yielded, even if there isn't one.
+        if SECTION_HEADER == self.__section[0]:
+            yield ""
 
-        return (self.header, self.feature, self.scenarios)
+    def index(self):
+        """Parse the bank's lines, returning the offsets of its sections (see `index_bank()`)."""
+        offsets = [
+            start
+            for ((kind, start, _), _) in self.__iter_sections()
+            if SECTION_HEADER != kind]
 
-    def __parse_header(self, line):
-        """Add the beginning of a file up to the Feature section to the header part."""
-        if REGEX_TAGS.match(line):
-            self.__state = STATE_FEATURE_TAGS
-            self.__parse_line(line)
+        # If there isn't a feature, it starts (and ends) where the bank does.
+        if SECTION_HEADER == self.__section[0]:
+            offsets.append(self.__offset)
 
-        elif REGEX_FEATURE_START.match(line):
-            self.__state = STATE_FEATURE
-            self.__parse_line(line)
+        offsets.append(self.__offset)
+        return offsets
 
-        else:
-            self.header.append(line)
+    def __iter_sections(self):
+        """Parse the bank's lines, yielding each section along with whether it's the last one.
 
-    def __parse_feature_tags(self, line):
-        """Add tags before the beginning of a feature to the feature once it is reached."""
-        if REGEX_TAGS.match(line):
-            self.feature.append(line)
+        Sections are (kind, offset, lines) tuples. As this is the parser's inner loop, it keeps its
+        state in local variables.
+        """
+        state = STATE_HEADER
+        (kind, start, lines) = self.__section
+        (line_number, offset) = (0, 0)
+        (multiline_start, multiline_delimiter) = (0, None)
 
-        elif REGEX_FEATURE_START.match(line):
-            self.__state = STATE_FEATURE
-            self.__parse_line(line)
+        for line in self.__lines:
+            line_number += 1
+            line_start = offset
+            offset += len(line)
+            line = line.rstrip("\r\n")
 
-        else:
-            raise ParsingError(
-                "Invalid line (should be tags or feature): {:s}".format(line.lstrip()),
-                self.__line)
+            # Multiline texts might contain Feature/Scenario sections, so only look for their end.
+            if STATE_MULTILINE == state:
+                if line.lstrip().startswith(multiline_delimiter):
+                    state = STATE_SCENARIO
 
-    def __parse_feature(self, line):
-        """Add everything up to the beginning of the first scenario to the feature's body."""
-        if REGEX_TAGS.match(line):
-            self.__state = STATE_SCENARIO_TAGS
-            self.__tags = []
-            self.__parse_line(line)
+                lines.append(line)
+                continue
 
-        elif REGEX_SCENARIO_START.match(line):
-            self.__state = STATE_SCENARIO
-            self.__parse_line(line)
+            token = classify_line(line)
+            transition = TRANSITIONS[state].get(token)
 
-        else:
-            self.feature.append(line)
+            if not transition:
+                if state in ERRORS:
+                    raise ParsingError(ERRORS[state].format(line.lstrip()), line_number)
 
-    def __parse_scenario_tags(self, line):
-        """Add tags before the beginning of a scenario to the scenario once it is reached."""
-        if REGEX_TAGS.match(line):
-            self.__tags.append(line)
+                lines.append(line)
+                continue
 
-        elif REGEX_SCENARIO_START.match(line):
-            self.__state = STATE_SCENARIO
-            self.scenarios.append(self.__tags)
-            self.scenarios[-1].append(line)
+            (state, next_kind) = transition
 
-        else:
-            raise ParsingError(
-                "Invalid line (should be tags or scenario): {:s}".format(line.lstrip()),
-                self.__line)
+            if next_kind is not None:
+                yield ((kind, start, lines), False)
+                (kind, start, lines) = (next_kind, line_start, [])
 
-    def __parse_scenario(self, line):
-        """Add the body of the current scenario up till the next scenario starts.
+            if TOKEN_MULTILINE == token:
+                multiline_start = line_number
+                multiline_delimiter = line.lstrip()[:3]
 
-        We take care to notice multiline texts since those might have Feature/Scenario sections
-        in them that might confuse the parser.
-        """
-        if REGEX_TAGS.match(line):
-            self.__state = STATE_SCENARIO_TAGS
-            self.__tags = [line, ]
-            return
+            lines.append(line)
 
-        if REGEX_SCENARIO_START.match(line):
-            self.scenarios.append([])
+        self.__section = (kind, start, lines)
+        self.__offset = offset
 
-        if REGEX_MULTILINE_START.match(line):
-            self.__state = STATE_MULTILINE
-            self.__multiline_start = self.__line
-            self.__multiline_delimiter = line.lstrip()[:3]
+        if STATE_MULTILINE == state:
+            raise ParsingError("Multiline text has no end", multiline_start)
 
-        self.scenarios[-1].append(line)
+        if state in (STATE_FEATURE_TAGS, STATE_SCENARIO_TAGS, ):
+            raise ParsingError("Dangling tags", line_number)
 
-    def __parse_multiline_text(self, line):
-        """Until the end of the multiline text, add the line to the current scenario."""
-        if line.lstrip().startswith(self.__multiline_delimiter):
-            self.__state = STATE_SCENARIO
-            self.__multiline_start = 0
-            self.__multiline_delimiter = None
+        yield (self.__section, True)
 
-        self.scenarios[-1].append(line)
+def _normalize(section, is_last):
+    """Normalize a section from a list of lines to actual text.
 
-    def __normalize(self):
-        """Normalize values from lists of lines to actual texts.
+    Each section (header, feature or scenario) should end with a newline if there's anything
+    after it. The header always ends with a newline, unless it's empty.
+    """
+    (kind, _, lines) = section
+    text = "\n".join(lines)
 
-        Each section (header, feature of scenarios) should end with a newline if there's
-        anything after it.
-        """
-        self.header = "\n".join(self.header)
-        if self.header:
-            self.header += "\n"
+    if SECTION_HEADER == kind:
+        if text:
+            text += "\n"
 
-        self.feature = "\n".join(self.feature)
-        if self.scenarios:
-            self.feature += "\n"
+    elif not is_last:
+        text += "\n"
 
-            for (i, scenario) in enumerate(self.scenarios[:-1]):
-                self.scenarios[i] = "\n".join(scenario) + "\n"
-            self.scenarios[-1] = "\n".join(self.scenarios[-1])
+    return text
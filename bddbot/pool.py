@@ -0,0 +1,83 @@
+"""Parse banks in advance, in parallel, using a pool of worker processes."""
+
+from multiprocessing import Pool
+from .cache import ParseCache
+from .parser import index_bank
+from .errors import ParsingError
+
+class ParallelIndex(object):
+    """Index several banks at once in a pool of worker processes.
+
+    This has the same interface as a `ParseCache`, so it can be handed to banks instead of one to
+    give them their precomputed offsets. Banks' parsing errors are raised when their offsets are
+    requested, not while they're indexed in the pool.
+
+    If a parse cache is given, the workers use it as well (and the cache's hits and misses are
+    updated accordingly).
+    """
+    def __init__(self, bank_paths, workers, cache = None):
+        directory = cache.directory if cache else None
+        pool = Pool(workers)
+
+        try:
+            results = pool.map(_index_bank, [(path, directory) for path in bank_paths])
+        finally:
+            pool.close()
+            pool.join()
+
+        self.__cache = cache
+        self.__results = dict(zip(bank_paths, results))
+
+        if cache:
+            for (_, _, hit) in results:
+                if hit is not None:
+                    cache.hits += int(hit)
+                    cache.misses += int(not hit)
+
+    @property
+    def hits(self):
+        """The number of banks read from the parse cache (zero if there isn't one)."""
+        return self.__cache.hits if self.__cache else 0
+
+    @property
+    def misses(self):
+        """The number of banks missing from the parse cache (zero if there isn't one)."""
+        return self.__cache.misses if self.__cache else 0
+
+    def index(self, bank_path, bank_file):
+        """Return the offsets of a bank's sections, as indexed by the workers."""
+        (offsets, error, _) = self.__results.get(bank_path, (None, None, None))
+
+        if error:
+            raise ParsingError(*error)
+
+        if offsets is not None:
+            return offsets
+
+        # The bank wasn't indexed, fall back to doing so here.
+        if self.__cache:
+            return self.__cache.index(bank_path, bank_file)
+
+        bank_file.seek(0)
+        return index_bank(bank_file)
+
+def _index_bank(args):
+    """Index a bank file in a worker process.
+
+    Return the bank's offsets, a parsing error's arguments and whether the bank was found in the
+    parse cache. Exceptions don't always survive the trip back from the worker, so parsing errors
+    are passed back as arguments and other errors are left for the bank to handle.
+    """
+    (bank_path, directory) = args
+    cache = ParseCache(directory) if directory else None
+
+    try:
+        with open(bank_path, "rb") as bank_file:
+            if cache:
+                return (cache.index(bank_path, bank_file), None, 0 < cache.hits)
+
+            return (index_bank(bank_file), None, None)
+    except ParsingError as error:
+        return (None, (error.message, error.line), None)
+    except EnvironmentError:
+        return (None, None, None)
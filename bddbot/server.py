@@ -1,8 +1,27 @@
 """A server wrapper around dealer operations."""
 
 from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import StreamRequestHandler
+from collections import deque
+from threading import Thread, Lock, RLock
+from Queue import Queue
+from select import select
+import socket
+import sys
+from hashlib import sha1
+from timeit import default_timer
 import logging
-from .bank import Bank
+from .bank import Bank, LazyBank, BankChangedError, COMPRESS_THRESHOLD, _get_file_status
+from .pool import ParallelIndex
+from .transport import JSON_MARKER, pack_message, read_message
+from .errors import BotError
+
+# Seconds to keep idle connections open, waiting for the client's next request.
+KEEP_ALIVE = 1.0
+
+# Seconds between checks for connections waiting on a worker thread, while a worker's connection
+# is idle.
+IDLE_POLL_INTERVAL = 0.05
 
 QUERIES = {
     "is_done": (lambda bank: bank.is_done(), True),
@@ -11,21 +30,175 @@ QUERIES = {
     "get_feature": (lambda bank: bank.feature, ""),
 }
 
+# The fields of a client's status and the queries to get them with.
+STATUS = {
+    "is_fresh": "is_fresh",
+    "is_done": "is_done",
+}
+
+# The fields of a bank's metadata (sent as part of the status, unless the client already has them).
+METADATA = {
+    "output_path": "get_output_path",
+    "header": "get_header",
+    "feature": "get_feature",
+}
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    """Handle several requests over the same connection (HTTP/1.1 keep-alive).
+
+    Unless the server handles connections in threads, it handles a single connection at a time, so
+    idle connections are only kept open for the server's keep-alive timeout and other clients
+    aren't kept waiting for long. Threaded servers close idle connections as soon as other
+    connections are waiting for a worker (see `BankServer._wait_for_request()`). A timeout of zero
+    closes connections after each request (HTTP/1.0).
+
+    Responses larger than the server's compression threshold are gzip-compressed, but only for
+    clients which accept it (older clients don't).
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.encode_threshold = self.server.compress_threshold
+
+        if self.server.keep_alive:
+            self.timeout = self.server.keep_alive
+        else:
+            self.protocol_version = "HTTP/1.0"
+
+        SimpleXMLRPCRequestHandler.setup(self)
+
+    def handle(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.close_connection = 1
+        self.handle_one_request()
+
+        # pylint: disable=protected-access
+        while (not self.close_connection) and self.server._wait_for_request(self.connection):
+            self.handle_one_request()
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """Log through the server's logger (idle connections timing out is routine)."""
+        logging.getLogger(__name__).debug(format, *args)
+
+class JSONRequestHandler(StreamRequestHandler):
+    """Handle requests in length-prefixed JSON messages (see `bddbot.transport`).
+
+    Like XML-RPC connections, connections are kept open for the server's keep-alive timeout between
+    requests (or closed after a single request if it's zero).
+    """
+    def setup(self):
+        if self.server.keep_alive:
+            self.timeout = self.server.keep_alive
+
+        StreamRequestHandler.setup(self)
+
+    def handle(self):
+        while True:
+            try:
+                request = read_message(self.rfile)
+            except socket.timeout:
+                return
+            except (socket.error, ValueError):
+                logging.getLogger(__name__).debug(
+                    "Bad request from %s:%d", *self.client_address, exc_info = True)
+                return
+
+            if request is None:
+                return
+
+            # pylint: disable=protected-access
+            self.wfile.write(pack_message(self.server._dispatch_json(request)))
+            if not (self.server.keep_alive and self.server._wait_for_request(self.connection)):
+                return
+
 class BankServer(SimpleXMLRPCServer, object):
-    """RPC command server."""
+    """RPC command server.
+
+    The server speaks both XML-RPC and length-prefixed JSON on the same port, telling them apart by
+    the first byte of each connection.
+
+    By default connections are handled one at a time. Given a number of threads, connections are
+    handled concurrently by a pool of worker threads, so a slow client doesn't hold up the rest.
+    Clients' assignments (and reservations) are then guarded by a lock, and each bank by a lock of
+    its own while scenarios are dealt from it, so no two clients are ever assigned the same bank or
+    dealt the same scenario.
+
+    Given a journal (see `bddbot.journal`), the server records its progress in it and picks up
+    where the journal left off, so a restarted server doesn't deal scenarios from the start. The
+    journal is closed along with the server.
+
+    Given a catalog instead (see `bddbot.catalog`), banks are imported into it and dealt from its
+    database rather than kept in memory, and it records the server's progress the same way a
+    journal would.
+    """
     allow_reuse_address = True
 
-    def __init__(self, host, port, banks):
+    def __init__(self, host, port, banks, lazy = False, cache = None, workers = 1,
+                 reload_interval = None, keep_alive = KEEP_ALIVE,
+                 compress_threshold = COMPRESS_THRESHOLD, threads = 0, journal = None,
+                 catalog = None):
+        # pylint: disable=too-many-arguments
         super(BankServer, self).__init__(
             (host, port),
-            SimpleXMLRPCRequestHandler,
-            logRequests = False)
-        self.__banks = [Bank(path) for path in banks]
+            KeepAliveRequestHandler,
+            logRequests = False,
+            allow_none = True)
+
+        self.keep_alive = keep_alive
+        self.compress_threshold = compress_threshold
+        self.threads = threads
+
+        # Parse all banks in advance in a pool of worker processes, if configured to (banks in a
+        # catalog are only parsed when they're imported, so they're not parsed in advance).
+        index = cache
+        if (1 < workers) and (1 < len(banks)) and (not catalog):
+            index = ParallelIndex(banks, workers, cache)
+
+        # Lazy banks keep only their sections' offsets in memory, instead of their contents. Banks
+        # in a catalog keep nothing in memory, and the catalog records the progress (instead of a
+        # journal).
+        if catalog:
+            (self.__bank_class, journal) = (catalog.open, catalog)
+            catalog.retain(banks)
+        else:
+            self.__bank_class = LazyBank if lazy else Bank
+
+        self.__cache = cache
+        self.__paths = list(banks)
+        self.__status = dict((path, _get_file_status(path)) for path in banks)
+        self.__banks = dict((path, self.__bank_class(path, cache = index)) for path in banks)
+        self.__bank_locks = dict((bank, Lock()) for bank in self.__banks.itervalues())
+        self.__bank_paths = dict((bank, path) for (path, bank) in self.__banks.iteritems())
+        self.__lock = RLock()
+        self.__requests = Queue()
         self.__assigned = {}
+        self.__owners = {}
+        self.__free = deque(self.__paths)
+        self.__reserved = {}
+        self.__last_deals = {}
+        self.__tokens = {}
+        self.__journal = journal
+        self.__catalog = catalog
+        self.__reload_interval = reload_interval
+        self.__last_reload = default_timer()
         self.__log = logging.getLogger(__name__)
 
+        if cache:
+            self.__log.info("Parse cache: %d hit/s, %d miss/es", cache.hits, cache.misses)
+
+        if journal:
+            self.__replay()
+
         self.register_function(self.is_fresh, "is_fresh")
         self.register_function(self.get_next_scenario, "get_next_scenario")
+        self.register_function(self.get_status, "get_status")
+        self.register_function(self.get_statuses, "get_statuses")
+        self.register_function(self.deal, "deal")
+        self.register_function(self.reserve, "reserve")
+        self.register_function(self.commit, "commit")
+        self.register_function(self.release, "release")
         for (name, (callback, default)) in QUERIES.iteritems():
             self.register_function(self.__query_bank(callback, default), name)
 
@@ -34,57 +207,355 @@ class BankServer(SimpleXMLRPCServer, object):
         (address, port) = self.server_address
         self.__log.info("Server started on %s:%d", address, port)
 
-        super(BankServer, self).serve_forever(poll_interval)
+        workers = [Thread(target = self.__work) for _ in xrange(self.threads)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            super(BankServer, self).serve_forever(poll_interval)
+        finally:
+            # Let the workers finish the connections they were handed, then stop them.
+            for _ in workers:
+                self.__requests.put(None)
+
+            for worker in workers:
+                worker.join()
 
     def shutdown(self):
         """Stop serving."""
         self.__log.info("Stopped serving")
         super(BankServer, self).shutdown()
 
+    def server_close(self):
+        """Stop listening, closing the journal (if there's one)."""
+        super(BankServer, self).server_close()
+        if self.__journal:
+            self.__journal.close()
+
+    def process_request(self, request, client_address):
+        """Handle a connection, or hand it to the worker threads if there are any."""
+        if not self.threads:
+            super(BankServer, self).process_request(request, client_address)
+            return
+
+        self.__requests.put((request, client_address))
+
+    def finish_request(self, request, client_address):
+        """Handle a connection in the protocol the client speaks."""
+        if self.keep_alive:
+            request.settimeout(self.keep_alive)
+
+        try:
+            first = request.recv(len(JSON_MARKER), socket.MSG_PEEK)
+        except socket.timeout:
+            return
+
+        if JSON_MARKER == first:
+            JSONRequestHandler(request, client_address, self)
+        else:
+            super(BankServer, self).finish_request(request, client_address)
+
+    def _wait_for_request(self, connection):
+        """Wait for the next request on a kept-alive connection, returning whether it arrived.
+
+        A worker thread is tied to its connection even while it's idle, so a threaded server gives
+        up on an idle connection as soon as other connections are waiting for a worker, instead of
+        waiting out the keep-alive timeout (the client connects again for its next request).
+        """
+        deadline = default_timer() + self.keep_alive
+        interval = IDLE_POLL_INTERVAL if self.threads else self.keep_alive
+        while True:
+            remaining = deadline - default_timer()
+            if remaining <= 0:
+                return False
+
+            (readable, _, _) = select([connection, ], [], [], min(interval, remaining))
+            if readable:
+                return True
+
+            if not self.__requests.empty():
+                return False
+
+    def reload(self, banks = None):
+        """Reload bank files which changed since they were loaded.
+
+        Changed banks are re-parsed and replace their previous versions, keeping the number of
+        scenarios dealt from them and the clients assigned to them. Banks whose files were removed
+        are dropped, and added back once their files reappear. If `banks` is given, it replaces the
+        list of banks to serve.
+        """
+        with self.__lock:
+            if banks is not None:
+                self.__paths = list(banks)
+
+            for path in set(self.__status).difference(self.__paths):
+                self.__status.pop(path)
+                self.__remove_bank(path)
+
+            for path in self.__paths:
+                status = _get_file_status(path)
+                if (path in self.__status) and (status == self.__status[path]):
+                    continue
+
+                self.__status[path] = status
+                if status is None:
+                    self.__remove_bank(path)
+                else:
+                    self.__reload_bank(path)
+
+            # Reloaded (and added) banks might have scenarios to deal again.
+            self.__free = deque(self.__paths)
+            self.__last_reload = default_timer()
+
+    def _dispatch(self, method, params):
+        """Check for changed banks (at most once every reload interval) before each request.
+
+        Lazy banks can't be read once their files change, so if one did (even before the reload
+        interval passed), the banks are reloaded and the request is handled again.
+        """
+        if self.__reload_interval is not None:
+            if self.__last_reload + self.__reload_interval <= default_timer():
+                self.reload()
+
+        try:
+            return super(BankServer, self)._dispatch(method, params)
+        except BankChangedError as error:
+            self.__log.info("Features bank '%s' changed while serving it", error.bank_path)
+
+        self.reload()
+        return super(BankServer, self)._dispatch(method, params)
+
+    def _dispatch_json(self, request):
+        """Call a JSON request's method, returning its result or error (the way XML-RPC faults are).
+
+        This is the JSON protocol's equivalent of `_marshaled_dispatch()`.
+        """
+        try:
+            return {"result": self._dispatch(request["method"], request["params"]), }
+        except Exception:
+            # pylint: disable=broad-except
+            (exc_type, exc_value, _) = sys.exc_info()
+            return {"error": "{!s}:{!s}".format(exc_type, exc_value), }
+
     def is_fresh(self, client):
         """Returns whether the current bank is fresh.
 
         This functions always returns True as long as the client was not assigned a bank.
         """
-        if client not in self.__assigned:
-            return True
+        with self.__lock:
+            if client not in self.__assigned:
+                return True
 
-        else:
-            query = self.__query_bank(lambda bank: bank.is_fresh(), False)
-            return query(client)
+            else:
+                query = self.__query_bank(lambda bank: bank.is_fresh(), False)
+                return query(client)
 
-    def get_next_scenario(self, client):
+    def get_next_scenario(self, client, request_id = None, committed = None):
         """Returns the next scenario to deal to the client.
 
-        This functions also assigns the bank to the client.
+        This functions also assigns the bank to the client, and settles the client's reserved
+        scenario (if any, see `reserve()`): It's committed if the client took it, and released
+        otherwise (the client's dealer might've stopped before taking it).
+
+        Clients may identify their requests, so if a request is sent again (because its response
+        was lost, for example) the same scenario is returned instead of dealing another one.
         """
-        bank = self.__get_current_bank(client)
-        if not bank:
-            self.__log.debug("No more scenarios for '%s'", client)
-            return None
+        with self.__lock:
+            if self.__is_resent(client, request_id):
+                # The request reserved the scenario, but the reservation's response was lost.
+                self.__settle_reservation(client, request_id)
+
+        return self.__deal_next(client, request_id, committed)[1]
+
+    def get_status(self, client, token = None):
+        """Returns everything needed to deal to the client, in a single call.
+
+        This includes whether the client's current bank is fresh or done and a token identifying
+        the bank's metadata (its output path, header and feature). The metadata itself is included
+        only if the client's token (from a previous call) is different.
+        """
+        with self.__lock:
+            status = dict(
+                (field, self.funcs[name](client)) for (field, name) in STATUS.iteritems())
+
+            bank = self.__get_current_bank(client)
+            status["token"] = self.__get_token(bank) if bank else None
+            status["threaded"] = 0 < self.threads
+
+            if (token is None) or (token != status["token"]):
+                status.update(
+                    (field, self.funcs[name](client)) for (field, name) in METADATA.iteritems())
+
+        return status
+
+    def get_statuses(self, queries):
+        """Returns several clients' statuses, in a single call.
+
+        Each query is a (client, token) pair, as passed to `get_status()`. This lets a dealer with
+        several banks on the same server fetch all of their statuses at once.
+        """
+        return [self.get_status(client, token) for (client, token) in queries]
+
+    def deal(self, client, token = None, request_id = None, committed = None):
+        """Deals the next scenario to the client, along with its status for the next deal.
+
+        Requests sent again return the same scenario (see `get_next_scenario()`).
+        """
+        scenario = self.get_next_scenario(client, request_id, committed)
+
+        return {"scenario": scenario, "status": self.get_status(client, token), }
+
+    def reserve(self, client, token = None, request_id = None, committed = None):
+        """Deals the next scenario to the client, reserving it until it's committed or released.
+
+        Clients reserve a scenario in advance (while their tests run, for example) and release it
+        if they can't take it after all, so it's dealt again. Reserved scenarios are committed
+        either explicitly or by the client's next deal or reservation, given the reservation's
+        request ID (see `get_next_scenario()`).
+        """
+        with self.__lock:
+            is_resent = self.__is_resent(client, request_id)
+            (bank, scenario) = self.__deal_next(client, request_id, committed)
+
+            if (not is_resent) and (scenario is not None):
+                self.__reserved[client] = (bank, request_id)
+
+            return {"scenario": scenario, "status": self.get_status(client, token), }
+
+    def commit(self, client):
+        """Commits the client's reserved scenario, returning whether it had one."""
+        with self.__lock:
+            return self.__reserved.pop(client, None) is not None
+
+    def release(self, client):
+        """Returns the client's reserved scenario to its bank, returning whether it had one.
+
+        The bank is assigned to the client again (even if the scenario was its last one).
+        """
+        with self.__lock:
+            reservation = self.__reserved.pop(client, None)
+            if not reservation:
+                return False
+
+            self.__release(client, reservation[0])
+
+        return True
+
+    def __work(self):
+        """Handle the connections handed to the worker threads, until told to stop (by None)."""
+        while True:
+            connection = self.__requests.get()
+            if connection is None:
+                return
+
+            (request, client_address) = connection
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def __deal_next(self, client, request_id, committed):
+        """Deals the next scenario to the client, returning the bank and the scenario.
 
-        if client not in self.__assigned:
-            self.__log.info("Assigning '%s' to '%s'", bank.feature.splitlines()[0], client)
-            self.__assigned[client] = bank
+        See `get_next_scenario()`.
+        """
+        with self.__lock:
+            if self.__is_resent(client, request_id):
+                scenario = self.__last_deals[client][1]
+                self.__log.info("Sent '%s' to '%s' again", scenario.lstrip(), client)
+                return (self.__assigned.get(client), scenario)
+
+            self.__settle_reservation(client, committed)
+
+            bank = self.__get_current_bank(client)
+            if not bank:
+                self.__log.debug("No more scenarios for '%s'", client)
+                return (None, None)
+
+            if client not in self.__assigned:
+                self.__log.info("Assigning '%s' to '%s'", bank.feature.splitlines()[0], client)
+                self.__assign(client, bank)
+
+            # Lock the bank before unlocking the server, so it isn't reloaded while it's dealt from.
+            bank_lock = self.__bank_locks[bank]
+            bank_lock.acquire()
+
+        # Only the client's own requests deal from its bank, so other clients don't wait for it.
+        try:
+            if self.__is_resent(client, request_id):
+                # The request was sent again while it was being dealt.
+                scenario = self.__last_deals[client][1]
+                self.__log.info("Sent '%s' to '%s' again", scenario.lstrip(), client)
+                return (bank, scenario)
+
+            scenario = bank.get_next_scenario()
+            self.__record_dealt(bank)
+
+            # Record the deal before unlocking the bank, so the request can't be dealt twice.
+            if (scenario is not None) and (request_id is not None):
+                self.__last_deals[client] = (request_id, scenario)
+        finally:
+            bank_lock.release()
+
+        if scenario is None:
+            # Another of the client's requests dealt the bank's last scenario first.
+            self.__log.debug("No more scenarios for '%s'", client)
+            return (bank, None)
 
-        scenario = bank.get_next_scenario()
         self.__log.info("Sent '%s' to '%s'", scenario.lstrip(), client)
+        return (bank, scenario)
+
+    def __settle_reservation(self, client, committed):
+        """Commit the client's reserved scenario if it was taken (by the given request ID), release
+        it otherwise (with the lock held).
+        """
+        reservation = self.__reserved.pop(client, None)
+        if not reservation:
+            return
+
+        (bank, request_id) = reservation
+        if (request_id is not None) and (request_id == committed):
+            self.__log.debug("Committed the scenario reserved for '%s'", client)
+            return
+
+        self.__log.info("'%s' didn't take its reserved scenario", client)
+        self.__release(client, bank)
+
+    def __release(self, client, bank):
+        """Return a scenario reserved for the client to its bank (with the lock held)."""
+        with self.__bank_locks[bank]:
+            bank.return_scenario()
+            self.__record_dealt(bank)
+
+        self.__assign(client, bank)
+        self.__log.info(
+            "Released a scenario of '%s' from '%s'", bank.feature.splitlines()[0], client)
+
+    def __is_resent(self, client, request_id):
+        """Returns whether a request is the same as the client's last deal."""
+        if request_id is None:
+            return False
 
-        return scenario
+        return request_id == self.__last_deals.get(client, (None, None))[0]
 
     def __query_bank(self, get_value, default):
         """Returns a callback to query the current bank's property."""
         def query(client):
             # pylint: disable=missing-docstring
-            bank = self.__get_current_bank(client)
-            if not bank:
-                return default
+            with self.__lock:
+                bank = self.__get_current_bank(client)
+                if not bank:
+                    return default
 
-            return get_value(bank)
+                return get_value(bank)
         return query
 
     def __get_current_bank(self, client):
-        """Returns the first bank that isn't done yet, None otherwise."""
+        """Returns the first bank that isn't done yet, None otherwise (with the lock held)."""
         # If client was already assigned a bank, check it.
         if client in self.__assigned:
             bank = self.__assigned[client]
@@ -95,19 +566,148 @@ class BankServer(SimpleXMLRPCServer, object):
 
             # Bank is done. Unassign it and look for the next one.
             self.__log.info("Unassigning '%s' from '%s'", bank.feature.splitlines()[0], client)
-            self.__assigned.pop(client)
+            self.__unassign(client)
+
+        return self.__get_free_bank()
+
+    def __get_free_bank(self):
+        """Returns the first bank that isn't done or assigned, None if there's none.
+
+        Free banks are queued in order. Banks which were removed, finished or assigned since they
+        were queued are dropped from the queue as they're found, since they can't be free again
+        until the banks are reloaded (which queues them all again). So each bank is checked once,
+        instead of checking all banks on every request.
 
-        for bank in self.__banks:
-            # Skip finished banks.
-            if bank.is_done():
-                continue
+        Banks in a catalog are looked up in it instead, in a single query.
+        """
+        if self.__catalog:
+            return self.__banks.get(self.__catalog.get_free_bank())
 
-            # Skip banks which were already assigned.
-            if bank in self.__assigned.itervalues():
-                continue
+        while self.__free:
+            bank = self.__banks.get(self.__free[0])
+            if bank and (not bank.is_done()) and (bank not in self.__owners):
+                return bank
 
-            # Found a bank.
-            return bank
+            self.__free.popleft()
 
-        # No bank was found.
         return None
+
+    def __assign(self, client, bank):
+        """Assign a bank to the client, instead of the one it was assigned before (if any)."""
+        previous = self.__assigned.get(client)
+        if previous is not None:
+            self.__owners.pop(previous, None)
+
+        self.__assigned[client] = bank
+        self.__owners[bank] = client
+
+        if self.__journal:
+            self.__journal.assign(client, self.__bank_paths[bank])
+
+    def __unassign(self, client):
+        """Unassign the client's bank, if it has one."""
+        bank = self.__assigned.pop(client, None)
+        if bank is not None:
+            self.__owners.pop(bank, None)
+
+        if self.__journal:
+            self.__journal.unassign(client)
+
+    def __record_dealt(self, bank):
+        """Record the number of scenarios dealt from a bank (with the bank's lock held).
+
+        Banks in a catalog record it themselves.
+        """
+        if self.__journal and (not self.__catalog):
+            self.__journal.deal(self.__bank_paths[bank], bank.dealt_count)
+
+    def __replay(self):
+        """Pick up the progress recorded in the journal, forgetting banks which aren't served."""
+        journal = self.__journal
+        for path in set(journal.dealt).union(journal.assigned.itervalues()):
+            if path not in self.__banks:
+                journal.remove(path)
+
+        for (path, count) in journal.dealt.iteritems():
+            self.__banks[path].mark_dealt(count)
+
+        for (client, path) in sorted(journal.assigned.iteritems()):
+            bank = self.__banks[path]
+            if bank not in self.__owners:
+                self.__assign(client, bank)
+
+        self.__log.info(
+            "Resumed dealing: %d scenario/s dealt, %d client/s assigned",
+            sum(journal.dealt.itervalues()), len(self.__assigned))
+
+    def __get_token(self, bank):
+        """Returns the token identifying a bank's metadata (with the lock held).
+
+        Reading the metadata might take reading the bank's file (or database), so the token is only
+        computed once for each bank. Banks are replaced when they're reloaded, along with it.
+        """
+        token = self.__tokens.get(bank)
+        if token is None:
+            token = self.__tokens[bank] = _get_token(bank)
+
+        return token
+
+    def __reload_bank(self, path):
+        """Load a new or changed bank, carrying over the previous version's progress."""
+        previous = self.__banks.get(path)
+
+        try:
+            bank = self.__bank_class(path, cache = self.__cache)
+        except BotError:
+            # Keep serving the previous version until the bank is fixed.
+            self.__log.exception("Failed reloading features bank '%s'", path)
+            return
+
+        self.__bank_paths[bank] = path
+        if not previous:
+            self.__log.info("Added features bank '%s'", path)
+        else:
+            with self.__bank_locks.pop(previous):
+                bank.mark_dealt(previous.dealt_count)
+
+            self.__bank_paths.pop(previous)
+            self.__tokens.pop(previous, None)
+            self.__log.info(
+                "Reloaded features bank '%s' (%d scenario/s already dealt)",
+                path, bank.dealt_count)
+
+            if previous in self.__owners:
+                self.__assign(self.__owners[previous], bank)
+
+            for (client, (reserved_bank, request_id)) in self.__reserved.items():
+                if previous is reserved_bank:
+                    self.__reserved[client] = (bank, request_id)
+
+        self.__banks[path] = bank
+        self.__bank_locks[bank] = Lock()
+
+    def __remove_bank(self, path):
+        """Stop serving a bank, unassigning it from its clients."""
+        bank = self.__banks.pop(path, None)
+        if not bank:
+            return
+
+        # Wait for the bank to be dealt from first (like a reloaded bank does).
+        with self.__bank_locks.pop(bank):
+            self.__bank_paths.pop(bank)
+
+        self.__tokens.pop(bank, None)
+        self.__log.info("Removed features bank '%s'", path)
+        if bank in self.__owners:
+            self.__unassign(self.__owners[bank])
+
+        for (client, (reserved_bank, _)) in self.__reserved.items():
+            if bank is reserved_bank:
+                self.__reserved.pop(client)
+
+        if self.__journal:
+            self.__journal.remove(path)
+
+def _get_token(bank):
+    """Return a token identifying a bank's metadata."""
+    return sha1("\0".join([bank.output_path, bank.header, bank.feature])).hexdigest()
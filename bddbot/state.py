@@ -0,0 +1,88 @@
+"""Save and restore the dealer's progress.
+
+The state file only records where each bank came from and how far it was dealt: Local banks are
+recorded by their path, the hash of their contents and the number of scenarios dealt (and the total
+number of scenarios, so the dealer can tell whether it's done without reading the banks), remote
+banks by their address (and the last reservation taken, which their server is told about on the next
+deal). The banks' contents are read again from their files when restoring.
+"""
+
+from hashlib import sha1
+import json
+import pickle
+from .errors import BotError
+
+STATE_VERSION = 1
+CHUNK_SIZE = 0x10000
+
+class StateError(BotError):
+    # pylint: disable=missing-docstring
+    pass
+
+def read_state(state_file, bank_paths):
+    """Read the banks' entries from a state file.
+
+    State files written by older versions (a pickled list of banks) are converted to entries, using
+    the configured bank paths (the banks were pickled in the same order).
+    """
+    try:
+        state = json.load(state_file)
+    except ValueError:
+        state_file.seek(0)
+        return _convert_pickled_state(state_file, bank_paths)
+
+    if STATE_VERSION != state.get("version"):
+        raise StateError("Unsupported state version: {!r}".format(state.get("version")))
+
+    return state["banks"]
+
+def write_state(state_file, entries):
+    """Write the banks' entries to a state file."""
+    json.dump({"version": STATE_VERSION, "banks": entries, }, state_file)
+
+def get_local_entry(path, digest, bank):
+    """Return a local bank's entry."""
+    return {
+        "path": path,
+        "sha1": digest,
+        "dealt": bank.dealt_count,
+        "total": bank.total_count,
+    }
+
+def get_remote_entry(path, bank):
+    """Return a remote bank's entry."""
+    entry = {"path": path, }
+    if bank.committed is not None:
+        entry["committed"] = bank.committed
+
+    return entry
+
+def is_remote_entry(entry):
+    """Return whether an entry refers to a remote bank."""
+    return entry["path"].startswith("@")
+
+def hash_bank(path):
+    """Return the hash of a bank file's contents."""
+    contents_hash = sha1()
+
+    with open(path, "rb") as bank_file:
+        for chunk in iter(lambda: bank_file.read(CHUNK_SIZE), ""):
+            contents_hash.update(chunk)
+
+    return contents_hash.hexdigest()
+
+def _convert_pickled_state(state_file, bank_paths):
+    """Convert a pickled list of banks to entries.
+
+    Remote banks couldn't be pickled, so these are all local banks.
+    """
+    try:
+        banks = pickle.load(state_file)
+    except Exception:
+        # pylint: disable=broad-except
+        raise StateError("Couldn't read state")
+
+    if len(banks) != len(bank_paths):
+        raise StateError("Saved state doesn't match the configured banks")
+
+    return [get_local_entry(path, None, bank) for (path, bank) in zip(bank_paths, banks)]
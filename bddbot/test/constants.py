@@ -8,5 +8,6 @@ FEATURE_PATH_1 = BANK_PATH_1.replace("bank", "feature")
 FEATURE_PATH_2 = BANK_PATH_2.replace("bank", "feature")
 (HOST, PORT) = ("bank_server", 0xBDD)
 CLIENT = "client"
+BANK_HASH = "0123456789abcdef"
 
 DEFAULT_TEST_COMMANDS = [TEST_COMMAND, ]
@@ -1,13 +1,21 @@
 """Test the bank module."""
 
+import errno
 import socket
+import pickle
+from mmap import mmap
+from xmlrpclib import Fault
 from nose.tools import assert_equal, assert_multi_line_equal, assert_raises, assert_in
-from mock import patch
+from nose.tools import assert_true, assert_false, assert_is_instance, assert_not_equal
+from mock import MagicMock, patch, call, ANY
 from mock_open import MockOpen
-from bddbot.bank import Bank, RemoteBank, ConnectionError
-from bddbot.parser import parse_bank
+from bddbot.bank import Bank, LazyBank, RemoteBank, RemoteSession, ConnectionError
+from bddbot.bank import FileLimitError
+from bddbot.parser import parse_bank, iter_bank, index_bank, classify_line
+from bddbot.parser import TOKEN_TEXT, TOKEN_TAGS, TOKEN_FEATURE, TOKEN_SCENARIO, TOKEN_MULTILINE
 from bddbot.errors import BotError, ParsingError
-from bddbot.test.constants import BANK_PATH_1, FEATURE_PATH_1, HOST, PORT, CLIENT
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, FEATURE_PATH_1, FEATURE_PATH_2, HOST, PORT, CLIENT
 
 class TestBankParsing(object):
     """Test parsing of feature bank files."""
@@ -86,6 +94,91 @@ class TestBankParsing(object):
         assert_in("invalid line", error_context.exception.message.lower())
         assert_equal(4, error_context.exception.line)
 
+class TestLineClassification(object):
+    """Test classifying lines to the tokens driving the parser."""
+    CASES = [
+        ("",                                TOKEN_TEXT),
+        ("    ",                            TOKEN_TEXT),
+        ("# A comment",                     TOKEN_TEXT),
+        ("@tag",                            TOKEN_TAGS),
+        ("    @tag_1 @tag_2",               TOKEN_TAGS),
+        ("    @ not a tag",                 TOKEN_TEXT),
+        ("Feature: A feature",              TOKEN_FEATURE),
+        ("\tFeature:",                      TOKEN_FEATURE),
+        ("Features are nice",               TOKEN_TEXT),
+        ("    Scenario: A scenario",        TOKEN_SCENARIO),
+        ("    Scenario Outline: Outlines",  TOKEN_SCENARIO),
+        ("    Scenarios: Not a scenario",   TOKEN_TEXT),
+        ("    Given a step",                TOKEN_TEXT),
+        ("        \"\"\"",                   TOKEN_MULTILINE),
+        ("        \'\'\'",                   TOKEN_MULTILINE),
+        ("        \"quoted\"",              TOKEN_TEXT),
+        ("        | a | b |",               TOKEN_TEXT),
+    ]
+
+    def test_classify(self):
+        for (line, expected_token) in self.CASES:
+            yield (self._check_classify, line, expected_token)
+
+    @staticmethod
+    def _check_classify(line, expected_token):
+        assert_equal(expected_token, classify_line(line))
+
+class TestStreamingParser(object):
+    """Test parsing a bank lazily from an iterable of lines."""
+    def test_same_as_parse_bank(self):
+        for (contents, _, _, _, _) in TEST_CASES:
+            yield (self._check_same_as_parse_bank, contents)
+
+    @staticmethod
+    def test_yield_before_end():
+        # Each section is yielded as soon as the next one begins, before the input is exhausted.
+        lines = [
+            "# A header\n",
+            "Feature: A streamed feature\n",
+            "    Scenario: The first scenario\n",
+            "    @tagged\n",
+            "    Scenario: The second scenario\n",
+        ]
+        consumed = []
+        sections = iter_bank(consumed.append(line) or line for line in lines)
+
+        assert_equal("# A header\n", next(sections))
+        assert_equal(lines[:2], consumed)
+        assert_equal("Feature: A streamed feature\n", next(sections))
+        assert_equal(lines[:3], consumed)
+        assert_equal("    Scenario: The first scenario\n", next(sections))
+        assert_equal(lines[:4], consumed)
+        assert_equal("    @tagged\n    Scenario: The second scenario", next(sections))
+        assert_raises(StopIteration, next, sections)
+
+    @staticmethod
+    def test_error_after_yield():
+        lines = [
+            "Feature: A feature with a bad ending\n",
+            "    Scenario: A good scenario\n",
+            "    Scenario: A bad scenario\n",
+            "        \"\"\"\n",
+        ]
+        sections = iter_bank(lines)
+
+        assert_equal("", next(sections))
+        assert_equal("Feature: A feature with a bad ending\n", next(sections))
+        assert_equal("    Scenario: A good scenario\n", next(sections))
+
+        with assert_raises(ParsingError) as error_context:
+            next(sections)
+
+        assert_equal(4, error_context.exception.line)
+
+    @staticmethod
+    def _check_same_as_parse_bank(contents):
+        (header, feature, scenarios) = parse_bank(contents)
+
+        assert_equal(
+            [header, feature, ] + scenarios,
+            list(iter_bank(contents.splitlines(True))))
+
 class TestLocalBank(object):
     """Test local bank operations."""
     @staticmethod
@@ -103,13 +196,15 @@ class TestLocalBank(object):
     @staticmethod
     @patch("bddbot.bank.open", new_callable = MockOpen)
     def test_error_reading_file(mocked_open):
-        mocked_open[BANK_PATH_1].read.side_effect = IOError()
+        bank_file = MagicMock()
+        bank_file.__iter__.side_effect = IOError()
+        mocked_open[BANK_PATH_1] = bank_file
 
         with assert_raises(BotError) as error_context:
             Bank(BANK_PATH_1)
 
         mocked_open.assert_called_once_with(BANK_PATH_1, "r")
-        mocked_open[BANK_PATH_1].read.assert_called_once_with()
+        bank_file.__iter__.assert_called_once_with()
         assert_in("couldn't open features bank", error_context.exception.message.lower())
 
     def test_output_path(self):
@@ -137,6 +232,99 @@ class TestLocalBank(object):
                    "\n".join([header_text, contents, ]),
                    is_fresh, is_done)
 
+    @staticmethod
+    def test_compact_storage():
+        mocked_open = MockOpen()
+        mocked_open[BANK_PATH_1].read_data = "\n".join([
+            "Feature: Some feature",
+            "    Scenario: The first scenario",
+            "    Scenario: The second scenario",
+        ])
+        with patch("bddbot.bank.open", mocked_open):
+            bank = Bank(BANK_PATH_1)
+
+        assert_false(hasattr(bank, "__dict__"))
+
+        # Banks are pickled along with the scenarios dealt so far.
+        assert_equal("    Scenario: The first scenario\n", bank.get_next_scenario())
+        for protocol in (0, pickle.HIGHEST_PROTOCOL, ):
+            unpickled_bank = pickle.loads(pickle.dumps(bank, protocol))
+
+            assert_equal(FEATURE_PATH_1, unpickled_bank.output_path)
+            assert_multi_line_equal(bank.feature, unpickled_bank.feature)
+            assert_equal(1, unpickled_bank.dealt_count)
+            assert_equal("    Scenario: The second scenario", unpickled_bank.get_next_scenario())
+            assert_true(unpickled_bank.is_done())
+
+    @staticmethod
+    def test_progress_counters():
+        mocked_open = MockOpen()
+        mocked_open[BANK_PATH_1].read_data = "\n".join([
+            "Feature: Some feature",
+            "    Scenario: The first scenario",
+            "    Scenario: The second scenario",
+        ])
+        with patch("bddbot.bank.open", mocked_open):
+            bank = Bank(BANK_PATH_1)
+
+        for dealt_count in xrange(3):
+            assert_equal((dealt_count, 2), (bank.dealt_count, bank.total_count))
+            bank.get_next_scenario()
+
+        assert_equal((2, 2), (bank.dealt_count, bank.total_count))
+
+    @staticmethod
+    def test_return_scenario():
+        mocked_open = MockOpen()
+        mocked_open[BANK_PATH_1].read_data = "\n".join([
+            "Feature: Some feature",
+            "    Scenario: The first scenario",
+            "    Scenario: The second scenario",
+        ])
+        with patch("bddbot.bank.open", mocked_open):
+            bank = Bank(BANK_PATH_1)
+
+        # Returned scenarios are dealt again.
+        bank.return_scenario()
+        assert_true(bank.is_fresh())
+
+        assert_equal("    Scenario: The first scenario\n", bank.get_next_scenario())
+        assert_equal("    Scenario: The second scenario", bank.get_next_scenario())
+        assert_true(bank.is_done())
+
+        bank.return_scenario()
+        assert_false(bank.is_done())
+        assert_equal("    Scenario: The second scenario", bank.get_next_scenario())
+
+    @staticmethod
+    def test_migrate_state():
+        # Banks pickled by older versions kept their scenarios in a list along with dealt flags.
+        class OldBank(object):
+            # pylint: disable=too-few-public-methods
+            def __init__(self):
+                self._Bank__output_path = FEATURE_PATH_1
+                self._Bank__header = "# Some header\n"
+                self._Bank__feature = "Feature: Some feature\n"
+                self._Bank__scenarios = [
+                    (True, "    Scenario: The first scenario\n"),
+                    (False, "    Scenario: The second scenario"),
+                ]
+
+        (OldBank.__module__, OldBank.__name__) = ("bddbot.bank", "Bank")
+        with patch("bddbot.bank.Bank", OldBank):
+            state = pickle.dumps(OldBank())
+
+        bank = pickle.loads(state)
+
+        assert_is_instance(bank, Bank)
+        assert_equal(FEATURE_PATH_1, bank.output_path)
+        assert_equal("# Some header\n", bank.header)
+        assert_equal("Feature: Some feature\n", bank.feature)
+        assert_equal((1, 2), (bank.dealt_count, bank.total_count))
+        assert_false(bank.is_fresh())
+        assert_equal("    Scenario: The second scenario", bank.get_next_scenario())
+        assert_true(bank.is_done())
+
     @staticmethod
     def _check_bank_splitting(expected, contents, is_fresh, is_done):
         """Compare two bank splits by their structure."""
@@ -148,7 +336,7 @@ class TestLocalBank(object):
             bank = Bank(BANK_PATH_1)
 
         mocked_open.assert_called_once_with(BANK_PATH_1, "r")
-        mocked_open[BANK_PATH_1].read.assert_called_once_with()
+        mocked_open[BANK_PATH_1].read.assert_not_called()
 
         assert_equal(is_fresh, bank.is_fresh())
         assert_equal(is_done, bank.is_done())
@@ -169,65 +357,305 @@ class TestLocalBank(object):
 
         assert_equal(expected_output_path, bank.output_path)
 
+class TestLazyBank(SandboxTest):
+    """Test banks read lazily from memory-mapped files."""
+    @staticmethod
+    def test_index():
+        lines = [
+            "# A header\n",
+            "Feature: An indexed feature\n",
+            "\n",
+            "    Scenario: The first scenario\n",
+            "    @tagged\n",
+            "    Scenario: The second scenario\n",
+        ]
+        offsets = [sum(len(line) for line in lines[:i]) for i in (1, 3, 4, len(lines))]
+
+        assert_equal(offsets, index_bank(lines))
+
+    @staticmethod
+    def test_error_openning_file():
+        with assert_raises(BotError) as error_context:
+            LazyBank("/no/such/path.bank")
+
+        assert_in("couldn't open features bank", error_context.exception.message.lower())
+
+    def test_output_path(self):
+        bank = LazyBank(self.sandbox.write(BANK_PATH_1, ""))
+        assert_equal(self.sandbox.getpath(FEATURE_PATH_1), bank.output_path)
+
+    def test_same_as_bank(self):
+        for (contents, _, _, _, _) in TEST_CASES:
+            yield (self._check_same_as_bank, contents)
+            yield (self._check_same_as_bank, "\n".join(["Some header text.", contents, ]))
+
+    def _check_same_as_bank(self, contents):
+        path = self.sandbox.write(BANK_PATH_1, contents)
+        (bank, lazy_bank) = (Bank(path), LazyBank(path))
+
+        assert_equal(bank.is_fresh(), lazy_bank.is_fresh())
+        assert_equal(bank.is_done(), lazy_bank.is_done())
+        assert_multi_line_equal(bank.header, lazy_bank.header)
+        assert_multi_line_equal(bank.feature, lazy_bank.feature)
+
+        for expected_scenario in iter(bank.get_next_scenario, None):
+            assert_multi_line_equal(expected_scenario, lazy_bank.get_next_scenario())
+            assert_equal(bank.is_fresh(), lazy_bank.is_fresh())
+            assert_equal(bank.is_done(), lazy_bank.is_done())
+
+        assert_equal(None, lazy_bank.get_next_scenario())
+
+    def test_bounded_maps(self):
+        # Files stay mapped between reads, but only so many of them at once.
+        contents = "\n".join(["Feature: A lazy feature", "    Scenario: A", "    Scenario: B", ])
+        banks = [LazyBank(self.sandbox.write(path, contents)) for path in ("1.bank", "2.bank")]
+
+        with patch("bddbot.bank.MAPPED_BANKS", 1), \
+             patch("bddbot.bank.mmap", side_effect = mmap) as mocked_mmap:
+            assert_in("A", banks[0].get_next_scenario())
+            assert_in("B", banks[0].get_next_scenario())
+            assert_in("A", banks[1].get_next_scenario())
+            assert_in("Feature", banks[0].feature)
+
+        assert_equal(3, mocked_mmap.call_count)
+
+    def test_too_many_open_files(self):
+        path = self.sandbox.write(BANK_PATH_1, "Feature: A lazy feature\n    Scenario: A\n")
+        bank = LazyBank(path)
+
+        with patch("bddbot.bank.mmap", side_effect = EnvironmentError(errno.EMFILE, "")):
+            with assert_raises(FileLimitError) as error_context:
+                bank.get_next_scenario()
+
+        assert_in("too many open files", error_context.exception.message.lower())
+
+(FEATURE, SCENARIO) = ("Feature: A remote feature\n", "    Scenario: A remote scenario\n")
+
+TOKEN = "0123456789abcdef"
+
+STATUS = {
+    "is_fresh": True,
+    "is_done": False,
+    "token": TOKEN,
+    "output_path": FEATURE_PATH_1,
+    "header": "",
+    "feature": FEATURE,
+}
+NEXT_STATUS = {"is_fresh": False, "is_done": False, "token": TOKEN, }
+
 class TestRemoteBank(object):
     """Test connection to a remote bank."""
     def __init__(self):
         self.bank = None
         self.mocked_proxy = None
+        self.mocked_sleep = None
 
     def setup(self):
+        self.mocked_sleep = patch("bddbot.bank.sleep").start()
         with patch("bddbot.bank.ServerProxy") as mocked_proxy_class:
             self.bank = RemoteBank(CLIENT, HOST, PORT)
 
-        mocked_proxy_class.assert_called_once_with("http://{}:{:d}".format(HOST, PORT))
+        mocked_proxy_class.assert_called_once_with(
+            "http://{}:{:d}".format(HOST, PORT),
+            transport = ANY,
+            allow_none = True)
         self.mocked_proxy = mocked_proxy_class.return_value
 
+    @staticmethod
+    def teardown():
+        patch.stopall()
+
     def test_access(self):
-        self.bank.is_fresh()
-        self.mocked_proxy.is_fresh.assert_called_once_with(CLIENT)
+        self.mocked_proxy.get_status.return_value = STATUS
+        self.mocked_proxy.deal.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        # The status is fetched once.
+        assert_true(self.bank.is_fresh())
+        assert_false(self.bank.is_done())
+        assert_equal(FEATURE_PATH_1, self.bank.output_path)
+        assert_equal("", self.bank.header)
+        assert_equal(FEATURE, self.bank.feature)
+        self.mocked_proxy.get_status.assert_called_once_with(CLIENT, None)
+
+        # Dealing returns the status for the next deal (without the metadata, which didn't change).
+        assert_equal(SCENARIO, self.bank.get_next_scenario())
+        self.mocked_proxy.deal.assert_called_once_with(CLIENT, TOKEN, ANY)
+
+        assert_false(self.bank.is_fresh())
+        assert_false(self.bank.is_done())
+        assert_equal(FEATURE_PATH_1, self.bank.output_path)
+        assert_equal(FEATURE, self.bank.feature)
+        self.mocked_proxy.get_status.assert_called_once_with(CLIENT, None)
+
+    def test_fetch_status(self):
+        # Fetching the status in advance answers the following queries.
+        self.mocked_proxy.get_status.return_value = STATUS
+
+        self.bank.fetch_status()
+        self.bank.fetch_status()
+        assert_true(self.bank.is_fresh())
+        assert_equal(FEATURE, self.bank.feature)
+        self.mocked_proxy.get_status.assert_called_once_with(CLIENT, None)
+
+    def test_prefetch(self):
+        # The prefetched scenario is dealt without another request.
+        self.mocked_proxy.get_status.return_value = STATUS
+        self.mocked_proxy.reserve.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        assert_true(self.bank.is_fresh())
+        self.bank.prefetch()
+        assert_equal(SCENARIO, self.bank.get_next_scenario())
+        assert_false(self.bank.is_fresh())
+        self.bank.close()
+
+        self.mocked_proxy.reserve.assert_called_once_with(CLIENT, TOKEN, ANY)
+        self.mocked_proxy.deal.assert_not_called()
+        self.mocked_proxy.release.assert_not_called()
+
+    def test_release_prefetched(self):
+        # Prefetched scenarios that weren't taken are released.
+        self.mocked_proxy.reserve.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        self.bank.prefetch()
+        self.bank.close()
+
+        self.mocked_proxy.release.assert_called_once_with(CLIENT)
+
+    def test_commit_prefetched(self):
+        # Committed scenarios aren't released, even if they weren't taken (without calling the
+        # server, which is told by the next deal).
+        self.mocked_proxy.reserve.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        self.bank.prefetch()
+        self.bank.commit()
+        self.bank.close()
+
+        self.mocked_proxy.commit.assert_not_called()
+        self.mocked_proxy.release.assert_not_called()
+
+    def test_next_deal_commits(self):
+        # The next deal (or reservation) carries the request ID of the reservation taken.
+        self.mocked_proxy.get_status.return_value = STATUS
+        self.mocked_proxy.reserve.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+        self.mocked_proxy.deal.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        self.bank.prefetch()
+        self.bank.commit()
+        self.bank.get_next_scenario()
+        (_, _, request_id) = self.mocked_proxy.reserve.call_args[0]
+        assert_equal(request_id, self.bank.committed)
+
+        self.bank.prefetch()
+        self.bank.close()
+        self.mocked_proxy.reserve.assert_called_with(CLIENT, None, ANY, request_id)
+
+        self.bank.get_next_scenario()
+        self.mocked_proxy.deal.assert_called_once_with(CLIENT, None, ANY, request_id)
+
+    def test_reservation_lost(self):
+        # If the reservation's response is lost, the scenario might've been reserved anyway.
+        self.mocked_proxy.reserve.side_effect = socket.timeout()
+
+        self.bank.prefetch()
+        self.bank.close()
+
+        self.mocked_proxy.release.assert_called_once_with(CLIENT)
+
+    def test_prefetch_failed(self):
+        # Scenarios are dealt as usual if they can't be reserved.
+        self.mocked_proxy.reserve.side_effect = Fault(1, "reserve")
+        self.mocked_proxy.deal.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+
+        self.bank.prefetch()
+        assert_equal(SCENARIO, self.bank.get_next_scenario())
+        self.bank.close()
+
+        # The scenario might've been reserved anyway, so it's dealt by the same request.
+        (_, _, request_id) = self.mocked_proxy.reserve.call_args[0]
+        self.mocked_proxy.deal.assert_called_once_with(CLIENT, None, request_id)
+        self.mocked_proxy.release.assert_not_called()
 
-        self.bank.is_done()
-        self.mocked_proxy.is_done.assert_called_once_with(CLIENT)
+    def test_metadata_changed(self):
+        # Metadata is replaced once the server sends a different token.
+        other_status = dict(STATUS, token = TOKEN[::-1], output_path = FEATURE_PATH_2)
+        self.mocked_proxy.get_status.side_effect = [STATUS, other_status, ]
+        self.mocked_proxy.deal.return_value = {
+            "scenario": SCENARIO,
+            "status": dict(NEXT_STATUS, is_done = True),
+        }
 
-        _ = self.bank.output_path
-        self.mocked_proxy.get_output_path.assert_called_once_with(CLIENT)
+        assert_equal(FEATURE_PATH_1, self.bank.output_path)
+        self.bank.get_next_scenario()
+        assert_equal(FEATURE_PATH_2, self.bank.output_path)
 
-        _ = self.bank.header
-        self.mocked_proxy.get_header.assert_called_once_with(CLIENT)
+        self.mocked_proxy.get_status.assert_has_calls([call(CLIENT, None), call(CLIENT, TOKEN), ])
 
-        _ = self.bank.feature
-        self.mocked_proxy.get_feature.assert_called_once_with(CLIENT)
+    def test_bank_done(self):
+        # Once the bank is done the status is fetched again, the next bank might've changed.
+        done_status = dict(NEXT_STATUS, is_done = True)
+        self.mocked_proxy.get_status.return_value = done_status
+        self.mocked_proxy.deal.return_value = {"scenario": SCENARIO, "status": done_status, }
 
         self.bank.get_next_scenario()
-        self.mocked_proxy.get_next_scenario.assert_called_once_with(CLIENT)
+        assert_true(self.bank.is_done())
+        assert_true(self.bank.is_done())
+
+        self.mocked_proxy.get_status.assert_called_once_with(CLIENT, None)
 
     def test_access_error(self):
-        self.mocked_proxy.is_fresh.side_effect = socket.error()
-        with assert_raises(ConnectionError):
-            self.bank.is_fresh()
+        self.mocked_proxy.get_status.side_effect = socket.error()
+        for operation in ("is_fresh", "is_done", ):
+            with assert_raises(ConnectionError) as error_context:
+                getattr(self.bank, operation)()
 
-        self.mocked_proxy.is_done.side_effect = socket.error()
-        with assert_raises(ConnectionError):
-            self.bank.is_done()
+            assert_equal(operation, error_context.exception.operation)
 
-        self.mocked_proxy.get_output_path.side_effect = socket.error()
-        with assert_raises(ConnectionError):
-            _ = self.bank.output_path
+        for operation in ("output_path", "header", "feature", ):
+            with assert_raises(ConnectionError) as error_context:
+                getattr(self.bank, operation)
 
-        self.mocked_proxy.get_header.side_effect = socket.error()
-        with assert_raises(ConnectionError):
-            _ = self.bank.header
+            assert_equal(operation, error_context.exception.operation)
 
-        self.mocked_proxy.get_feature.side_effect = socket.error()
+        self.mocked_proxy.deal.side_effect = socket.error()
         with assert_raises(ConnectionError):
-            _ = self.bank.feature
+            self.bank.get_next_scenario()
+
+    def test_retry(self):
+        # Failed requests are retried, each after waiting twice as long.
+        self.mocked_proxy.get_status.side_effect = [socket.timeout(), socket.error(), STATUS, ]
+
+        assert_true(self.bank.is_fresh())
+        assert_equal(3, self.mocked_proxy.get_status.call_count)
+        self.mocked_sleep.assert_has_calls([call(0.5), call(1.0), ])
+
+    def test_retry_deal(self):
+        # Deals are retried with the same request ID, so the server deals the same scenario.
+        self.mocked_proxy.deal.side_effect = [
+            socket.timeout(),
+            {"scenario": SCENARIO, "status": NEXT_STATUS, },
+        ]
+
+        assert_equal(SCENARIO, self.bank.get_next_scenario())
+        (first, second) = self.mocked_proxy.deal.call_args_list
+        assert_equal(first, second)
+
+        # Further deals are sent by other requests.
+        self.mocked_proxy.deal.side_effect = None
+        self.mocked_proxy.deal.return_value = {"scenario": SCENARIO, "status": NEXT_STATUS, }
+        self.bank.get_next_scenario()
+        assert_not_equal(first, self.mocked_proxy.deal.call_args)
+
+    def test_retries_exhausted(self):
+        self.mocked_proxy.get_status.side_effect = socket.timeout()
 
-        self.mocked_proxy.get_next_scenario.side_effect = socket.error()
         with assert_raises(ConnectionError):
-            self.bank.get_next_scenario()
+            self.bank.is_done()
+
+        assert_equal(3, self.mocked_proxy.get_status.call_count)
+        assert_equal(2, self.mocked_sleep.call_count)
 
     def test_operation_error(self):
-        self.mocked_proxy.is_fresh.side_effect = socket.error()
+        self.mocked_proxy.get_status.side_effect = socket.error()
 
         with assert_raises(ConnectionError) as error_context:
             self.bank.is_fresh()
@@ -235,6 +663,56 @@ class TestRemoteBank(object):
         assert_in("failed on remote", error_context.exception.message.lower())
         assert_equal("is_fresh", error_context.exception.operation)
 
+class TestRemoteSession(object):
+    """Test sharing a connection between remote banks."""
+    def __init__(self):
+        self.session = None
+        self.banks = None
+        self.mocked_proxy = None
+
+    def setup(self):
+        with patch("bddbot.bank.ServerProxy") as mocked_proxy_class:
+            self.session = RemoteSession(HOST, PORT)
+
+        self.mocked_proxy = mocked_proxy_class.return_value
+        self.banks = [
+            RemoteBank(client, HOST, PORT, session = self.session)
+            for client in (CLIENT, CLIENT + "#2", )]
+
+    def test_shared_connection(self):
+        self.mocked_proxy.get_status.return_value = STATUS
+
+        for bank in self.banks:
+            bank.is_fresh()
+            bank.close()
+
+        self.mocked_proxy.get_status.assert_has_calls(
+            [call(CLIENT, None), call(CLIENT + "#2", None), ])
+        assert_equal(2, self.mocked_proxy.return_value.call_count)
+
+    def test_fetch_statuses(self):
+        # Banks' statuses are fetched in a single call, except for those already known.
+        other_status = dict(STATUS, output_path = FEATURE_PATH_2)
+        self.mocked_proxy.get_statuses.return_value = [STATUS, other_status, ]
+
+        self.session.fetch_statuses(self.banks)
+        self.session.fetch_statuses(self.banks)
+        assert_equal(
+            [FEATURE_PATH_1, FEATURE_PATH_2, ], [bank.output_path for bank in self.banks])
+
+        self.mocked_proxy.get_statuses.assert_called_once_with(
+            [[CLIENT, None], [CLIENT + "#2", None], ])
+        self.mocked_proxy.get_status.assert_not_called()
+
+    def test_fetch_statuses_unsupported(self):
+        # Older servers are asked for each bank's status on its own.
+        self.mocked_proxy.get_statuses.side_effect = Fault(1, "get_statuses")
+        self.mocked_proxy.get_status.return_value = STATUS
+
+        self.session.fetch_statuses(self.banks)
+        assert_true(all(bank.is_fresh() for bank in self.banks))
+        assert_equal(2, self.mocked_proxy.get_status.call_count)
+
 # pylint: disable=bad-continuation
 TEST_CASES = [
     # Empty file.
@@ -0,0 +1,121 @@
+"""Test caching parsed banks."""
+
+from os import utime, stat, listdir
+from os.path import join
+from nose.tools import assert_equal, assert_multi_line_equal
+from mock import patch
+from bddbot.bank import Bank, LazyBank
+from bddbot.cache import ParseCache
+from bddbot.parser import index_bank
+from bddbot.state import hash_bank
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2
+
+CACHE_DIRECTORY = "cache"
+
+class TestParseCache(SandboxTest):
+    def __init__(self):
+        super(TestParseCache, self).__init__()
+        self.cache = None
+
+    def setup(self):
+        super(TestParseCache, self).setup()
+        self.cache = ParseCache(self.sandbox.getpath(CACHE_DIRECTORY))
+
+    def test_miss_then_hit(self):
+        path = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        expected_offsets = index_bank(self.SAMPLE_BANK.splitlines(True))
+
+        assert_equal(expected_offsets, self.__index(path))
+        assert_equal((0, 1), (self.cache.hits, self.cache.misses))
+
+        with patch("bddbot.cache.index_bank") as mocked_index_bank:
+            assert_equal(expected_offsets, self.__index(path))
+
+        mocked_index_bank.assert_not_called()
+        assert_equal((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_persistent(self):
+        # A new cache instance uses entries stored by a previous one.
+        path = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        self.__index(path)
+
+        self.cache = ParseCache(self.sandbox.getpath(CACHE_DIRECTORY))
+        self.__index(path)
+
+        assert_equal((1, 0), (self.cache.hits, self.cache.misses))
+
+    def test_separate_banks(self):
+        path_1 = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        path_2 = self.sandbox.write(BANK_PATH_2, "Feature: Another feature")
+
+        self.__index(path_1)
+        self.__index(path_2)
+        assert_equal([0, 24], self.__index(path_2))
+        assert_equal((1, 2), (self.cache.hits, self.cache.misses))
+
+    def test_modified_contents(self):
+        # Changed contents invalidate the cache, even if the bank's size and time are the same.
+        path = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        status = stat(path)
+        self.__index(path)
+
+        modified_contents = self.SAMPLE_BANK.replace("@tagged", "@TAGGED")
+        self.sandbox.write(BANK_PATH_1, modified_contents)
+        utime(path, (status.st_atime, status.st_mtime))
+
+        assert_equal(index_bank(modified_contents.splitlines(True)), self.__index(path))
+        assert_equal((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_modified_time(self):
+        path = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        status = stat(path)
+        self.__index(path)
+
+        utime(path, (status.st_atime, status.st_mtime + 1))
+        self.__index(path)
+
+        assert_equal((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_corrupt_entry(self):
+        path = self.sandbox.write(BANK_PATH_1, self.SAMPLE_BANK)
+        self.__index(path)
+
+        for entry in listdir(self.sandbox.getpath(CACHE_DIRECTORY)):
+            self.sandbox.write(join(CACHE_DIRECTORY, entry), "This isn't JSON")
+
+        assert_equal(index_bank(self.SAMPLE_BANK.splitlines(True)), self.__index(path))
+        assert_equal((0, 2), (self.cache.hits, self.cache.misses))
+
+    def test_cached_banks(self):
+        for bank_class in (Bank, LazyBank):
+            yield (self._check_cached_bank, bank_class)
+
+    def _check_cached_bank(self, bank_class):
+        path = self.sandbox.write(BANK_PATH_1, "\n".join([self.SAMPLE_BANK, "", "", ]))
+
+        # Load the bank twice, the second time from the cache.
+        expected = bank_class(path)
+        bank_class(path, cache = self.cache)
+        bank = bank_class(path, cache = self.cache)
+
+        assert_equal((1, 1), (self.cache.hits, self.cache.misses))
+        assert_multi_line_equal(expected.header, bank.header)
+        assert_multi_line_equal(expected.feature, bank.feature)
+        for expected_scenario in iter(expected.get_next_scenario, None):
+            assert_multi_line_equal(expected_scenario, bank.get_next_scenario())
+        assert_equal(None, bank.get_next_scenario())
+
+    def test_bank_digest(self):
+        # Banks hash their files while reading them, whether they're parsed or read from the cache.
+        path = self.sandbox.write(BANK_PATH_1, "\n".join([self.SAMPLE_BANK, "", "", ]))
+
+        for cache in (None, self.cache, self.cache, ):
+            assert_equal(hash_bank(path), Bank(path, cache = cache).digest)
+
+        assert_equal((1, 1), (self.cache.hits, self.cache.misses))
+
+    def __index(self, path):
+        """Index a bank through the cache."""
+        with open(path, "rb") as bank_file:
+            return self.cache.index(path, bank_file)
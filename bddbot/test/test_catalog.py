@@ -0,0 +1,184 @@
+"""Test dealing banks from a catalog."""
+
+import sqlite3
+from nose.tools import assert_equal, assert_true, assert_false, assert_is_none, assert_raises
+from mock import Mock, patch, ANY
+from bddbot.bank import Bank
+from bddbot.catalog import BankCatalog, CatalogError
+from bddbot.parser import index_bank
+from bddbot.errors import BotError
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2, CLIENT
+
+CATALOG_PATH = "catalog"
+
+class TestBankCatalog(SandboxTest):
+    BANK_FILES = {
+        BANK_PATH_1: SandboxTest.SAMPLE_BANK,
+        BANK_PATH_2: SandboxTest.SAMPLE_BANK,
+    }
+
+    def __init__(self):
+        super(TestBankCatalog, self).__init__()
+        self.catalog = None
+
+    def setup(self):
+        super(TestBankCatalog, self).setup()
+        self.catalog = BankCatalog(self.sandbox.getpath(CATALOG_PATH))
+
+    def teardown(self):
+        self.catalog.close()
+        super(TestBankCatalog, self).teardown()
+
+    def test_same_as_bank(self):
+        # Banks in a catalog are dealt the same as banks read from their files.
+        bank = Bank(self.paths[BANK_PATH_1])
+        cataloged = self.catalog.open(self.paths[BANK_PATH_1])
+
+        assert_equal(bank.output_path, cataloged.output_path)
+        assert_equal(bank.header, cataloged.header)
+        assert_equal(bank.feature, cataloged.feature)
+        assert_equal(bank.total_count, cataloged.total_count)
+
+        while not bank.is_done():
+            assert_equal(bank.is_fresh(), cataloged.is_fresh())
+            assert_false(cataloged.is_done())
+            assert_equal(bank.get_next_scenario(), cataloged.get_next_scenario())
+
+        assert_true(cataloged.is_done())
+        assert_is_none(cataloged.get_next_scenario())
+
+    def test_imported_once(self):
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        bank.get_next_scenario()
+        self.__reopen()
+
+        with patch("bddbot.catalog.iter_bank") as mocked_iter_bank:
+            bank = self.catalog.open(self.paths[BANK_PATH_1])
+
+        mocked_iter_bank.assert_not_called()
+        assert_equal(1, bank.dealt_count)
+        assert_equal({self.paths[BANK_PATH_1]: 1, }, self.catalog.dealt)
+
+    def test_changed_bank(self):
+        # Changed banks are imported again, keeping as many dealt scenarios as they still have.
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        bank.get_next_scenario()
+        bank.get_next_scenario()
+
+        self._modify(BANK_PATH_1, "\n".join(self.SAMPLE_BANK.splitlines()[:3]))
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        assert_equal((1, 1), (bank.dealt_count, bank.total_count))
+        assert_true(bank.is_done())
+
+        self._modify(BANK_PATH_1, self.SAMPLE_BANK)
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        assert_equal((1, 2), (bank.dealt_count, bank.total_count))
+        assert_equal(Bank(self.paths[BANK_PATH_1]).feature, bank.feature)
+
+    def test_cache(self):
+        cache = Mock()
+        cache.index.side_effect = lambda path, bank_file: index_bank(bank_file)
+        bank = self.catalog.open(self.paths[BANK_PATH_1], cache = cache)
+
+        cache.index.assert_called_once_with(self.paths[BANK_PATH_1], ANY)
+        assert_equal(2, bank.total_count)
+
+    def test_return_scenario(self):
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        scenario = bank.get_next_scenario()
+        bank.return_scenario()
+        bank.return_scenario()
+
+        assert_true(bank.is_fresh())
+        assert_equal(scenario, bank.get_next_scenario())
+
+    def test_mark_dealt(self):
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        bank.mark_dealt(1)
+        assert_equal(1, bank.dealt_count)
+
+        bank.mark_dealt(0)
+        assert_equal(1, bank.dealt_count)
+
+        bank.mark_dealt(10)
+        assert_equal(2, bank.dealt_count)
+
+    def test_assignments(self):
+        (client_1, client_2) = (CLIENT + "_1", CLIENT + "_2")
+        for path in self.paths.itervalues():
+            self.catalog.open(path)
+
+        self.catalog.assign(client_1, self.paths[BANK_PATH_1])
+        self.catalog.assign(client_2, self.paths[BANK_PATH_1])
+        self.catalog.assign(client_1, self.paths[BANK_PATH_2])
+        self.__reopen()
+
+        assert_equal(
+            {client_1: self.paths[BANK_PATH_2], client_2: self.paths[BANK_PATH_1], },
+            self.catalog.assigned)
+
+        self.catalog.unassign(client_2)
+        assert_equal({client_1: self.paths[BANK_PATH_2], }, self.catalog.assigned)
+
+    def test_removed_bank(self):
+        bank = self.catalog.open(self.paths[BANK_PATH_1])
+        bank.get_next_scenario()
+        self.catalog.assign(CLIENT, self.paths[BANK_PATH_1])
+
+        self.catalog.remove(self.paths[BANK_PATH_1])
+        assert_equal({}, self.catalog.dealt)
+        assert_equal({}, self.catalog.assigned)
+
+        # Once the bank is back, it's dealt from the start.
+        assert_true(self.catalog.open(self.paths[BANK_PATH_1]).is_fresh())
+
+    def test_free_bank(self):
+        # Free banks are the ones which aren't assigned or done, in the order they were imported.
+        banks = [self.catalog.open(self.paths[path]) for path in (BANK_PATH_1, BANK_PATH_2, )]
+        assert_equal(self.paths[BANK_PATH_1], self.catalog.get_free_bank())
+
+        self.catalog.assign(CLIENT, self.paths[BANK_PATH_1])
+        assert_equal(self.paths[BANK_PATH_2], self.catalog.get_free_bank())
+
+        self.catalog.unassign(CLIENT)
+        banks[0].mark_dealt(banks[0].total_count)
+        assert_equal(self.paths[BANK_PATH_2], self.catalog.get_free_bank())
+
+        banks[1].mark_dealt(banks[1].total_count)
+        assert_is_none(self.catalog.get_free_bank())
+
+    def test_retain(self):
+        for path in self.paths.itervalues():
+            self.catalog.open(path)
+
+        self.catalog.retain([self.paths[BANK_PATH_2], ])
+        assert_equal(self.paths[BANK_PATH_2], self.catalog.get_free_bank())
+        assert_equal((1, ), self.catalog.fetch_one("SELECT COUNT(*) FROM banks"))
+
+    def test_older_version(self):
+        # Catalogs of older versions are upgraded.
+        self.catalog.open(self.paths[BANK_PATH_1])
+        self.catalog.execute("DROP INDEX free_banks")
+        self.catalog.execute("PRAGMA user_version = 1")
+        self.__reopen()
+
+        assert_equal(self.paths[BANK_PATH_1], self.catalog.get_free_bank())
+
+    def test_missing_bank(self):
+        with assert_raises(BotError):
+            self.catalog.open(self.sandbox.getpath("no_such.bank"))
+
+    def test_unsupported_version(self):
+        self.catalog.close()
+        connection = sqlite3.connect(self.sandbox.getpath(CATALOG_PATH))
+        connection.execute("PRAGMA user_version = 1000")
+        connection.close()
+
+        with assert_raises(CatalogError):
+            self.__reopen()
+
+    def __reopen(self):
+        """Close the catalog and open it again."""
+        self.catalog.close()
+        self.catalog = BankCatalog(self.sandbox.getpath(CATALOG_PATH))
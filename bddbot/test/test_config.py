@@ -1,9 +1,15 @@
 """Test configuration properties."""
 
 from nose.tools import assert_equal, assert_in, assert_is_none, assert_raises
+from nose.tools import assert_true, assert_false
 from mock import Mock, patch
 from bddbot.config import BotConfiguration, ConfigError
 from bddbot.config import CONFIG_FILENAME
+from bddbot.cache import CACHE_PATH
+from bddbot.journal import JOURNAL_PATH, GROUP_COMMIT
+from bddbot.catalog import CATALOG_PATH
+from bddbot.bank import COMPRESS_THRESHOLD, TIMEOUT, RETRIES, RETRY_BACKOFF
+from bddbot.server import KEEP_ALIVE
 from bddbot.test.constants import BANK_PATH_1, DEFAULT_TEST_COMMANDS, HOST, PORT
 
 class BaseConfigTest(object):
@@ -32,10 +38,18 @@ class BaseConfigTest(object):
         def _getint(section, value):
             return int(_get(section, value))
 
+        def _getfloat(section, value):
+            return float(_get(section, value))
+
+        def _getboolean(section, value):
+            return _get(section, value).lower() in ("1", "yes", "true", "on", )
+
         self.mocked_config_parser.read.return_value = [filename, ]
         self.mocked_config_parser.has_option.side_effect = _has_option
         self.mocked_config_parser.get.side_effect = _get
         self.mocked_config_parser.getint.side_effect = _getint
+        self.mocked_config_parser.getfloat.side_effect = _getfloat
+        self.mocked_config_parser.getboolean.side_effect = _getboolean
 
         with patch("bddbot.config.ConfigParser", self.mocked_config_parser_class):
             self.config = BotConfiguration(filename)
@@ -67,6 +81,9 @@ class TestConfigPath(BaseConfigTest):
         self._create_config({})
         assert_equal(DEFAULT_TEST_COMMANDS, self.config.tests)
         assert_equal([], self.config.banks)
+        assert_is_none(self.config.cache)
+        assert_is_none(self.config.journal)
+        assert_is_none(self.config.catalog)
 
     def test_custom_path(self):
         tests = ["behave", "--format=null", ]
@@ -111,6 +128,54 @@ class TestBankPath(BaseConfigTest):
 
         assert_equal(expected_paths, self.config.banks)
 
+class TestCachePath(BaseConfigTest):
+    def test_default_path(self):
+        self._create_config({"paths": {"cache": "", }, })
+        assert_equal(CACHE_PATH, self.config.cache)
+
+    def test_set_path(self):
+        self._create_config({"paths": {"cache": "/path/to/cache", }, })
+        assert_equal("/path/to/cache", self.config.cache)
+
+class TestJournalPath(BaseConfigTest):
+    def test_default_path(self):
+        self._create_config({"paths": {"journal": "", }, })
+        assert_equal(JOURNAL_PATH, self.config.journal)
+
+    def test_set_path(self):
+        self._create_config({"paths": {"journal": "/path/to/journal", }, })
+        assert_equal("/path/to/journal", self.config.journal)
+
+class TestCatalogPath(BaseConfigTest):
+    def test_default_path(self):
+        self._create_config({"paths": {"catalog": "", }, })
+        assert_equal(CATALOG_PATH, self.config.catalog)
+
+    def test_set_path(self):
+        self._create_config({"paths": {"catalog": "/path/to/catalog", }, })
+        assert_equal("/path/to/catalog", self.config.catalog)
+
+    def test_journal(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"paths": {"catalog": "", "journal": "", }, })
+
+        assert_in("journal", error_context.exception.message.lower())
+
+class TestWorkers(BaseConfigTest):
+    def test_default(self):
+        self._create_config({})
+        assert_equal(1, self.config.workers)
+
+    def test_set_workers(self):
+        self._create_config({"load": {"workers": "4", }, })
+        assert_equal(4, self.config.workers)
+
+    def test_invalid_value(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"load": {"workers": "0", }, })
+
+        assert_in("must be positive", error_context.exception.message.lower())
+
 class TestTestCommands(BaseConfigTest):
     CASES = [
         (["", ],                            []),
@@ -140,6 +205,17 @@ class TestServer(BaseConfigTest):
 
         assert_is_none(self.config.host)
         assert_is_none(self.config.port)
+        assert_false(self.config.lazy)
+        assert_false(self.config.prefetch)
+        assert_equal(TIMEOUT, self.config.timeout)
+        assert_equal(RETRIES, self.config.retries)
+        assert_equal(RETRY_BACKOFF, self.config.retry_backoff)
+        assert_is_none(self.config.reload_interval)
+        assert_equal(KEEP_ALIVE, self.config.keep_alive)
+        assert_equal(0, self.config.threads)
+        assert_false(self.config.event_loop)
+        assert_equal(GROUP_COMMIT, self.config.group_commit)
+        assert_equal(COMPRESS_THRESHOLD, self.config.compress_threshold)
 
     def test_set_host(self):
         self._create_config({
@@ -158,3 +234,110 @@ class TestServer(BaseConfigTest):
         })
 
         assert_equal(PORT, self.config.port)
+
+    def test_set_lazy(self):
+        self._create_config({
+            "server": {
+                "lazy": "yes",
+            },
+        })
+
+        assert_true(self.config.lazy)
+
+    def test_set_prefetch(self):
+        self._create_config({"server": {"prefetch": "yes", }, })
+        assert_true(self.config.prefetch)
+
+    def test_set_reload_interval(self):
+        self._create_config({
+            "server": {
+                "reload_interval": "2.5",
+            },
+        })
+
+        assert_equal(2.5, self.config.reload_interval)
+
+    def test_negative_reload_interval(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"reload_interval": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_set_keep_alive(self):
+        self._create_config({"server": {"keep_alive": "2.5", }, })
+        assert_equal(2.5, self.config.keep_alive)
+
+    def test_disable_keep_alive(self):
+        self._create_config({"server": {"keep_alive": "0", }, })
+        assert_equal(0, self.config.keep_alive)
+
+    def test_negative_keep_alive(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"keep_alive": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_set_threads(self):
+        self._create_config({"server": {"threads": "8", }, })
+        assert_equal(8, self.config.threads)
+
+    def test_negative_threads(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"threads": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_set_event_loop(self):
+        self._create_config({"server": {"event_loop": "yes", }, })
+        assert_true(self.config.event_loop)
+
+    def test_set_group_commit(self):
+        self._create_config({"server": {"group_commit": "0", }, })
+        assert_equal(0, self.config.group_commit)
+
+    def test_negative_group_commit(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"group_commit": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_set_timeout(self):
+        self._create_config({"server": {"timeout": "2.5", }, })
+        assert_equal(2.5, self.config.timeout)
+
+    def test_disable_timeout(self):
+        self._create_config({"server": {"timeout": "", }, })
+        assert_is_none(self.config.timeout)
+
+    def test_invalid_timeout(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"timeout": "0", }, })
+
+        assert_in("positive", error_context.exception.message.lower())
+
+    def test_set_retries(self):
+        self._create_config({"server": {"retries": "5", "retry_backoff": "0.1", }, })
+        assert_equal(5, self.config.retries)
+        assert_equal(0.1, self.config.retry_backoff)
+
+    def test_negative_retries(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"retries": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_negative_retry_backoff(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"retry_backoff": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
+
+    def test_set_compress_threshold(self):
+        self._create_config({"server": {"compress_threshold": "0", }, })
+        assert_equal(0, self.config.compress_threshold)
+
+    def test_negative_compress_threshold(self):
+        with assert_raises(ConfigError) as error_context:
+            self._create_config({"server": {"compress_threshold": "-1", }, })
+
+        assert_in("negative", error_context.exception.message.lower())
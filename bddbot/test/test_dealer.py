@@ -1,18 +1,29 @@
 """Test the Dealer class."""
 
 from subprocess import Popen
+from functools import partial
+from threading import Event
 from os.path import dirname
 from nose.tools import assert_true, assert_false, assert_equal, assert_in, assert_raises
-from mock import Mock, patch, call, create_autospec, ANY
+from mock import Mock, patch, call, create_autospec, ANY, DEFAULT
 from mock_open import MockOpen
 from bddbot.dealer import Dealer, STATE_PATH
 from bddbot.config import TEST_COMMAND
+from bddbot.bank import COMPRESS_THRESHOLD, TIMEOUT, RETRIES, RETRY_BACKOFF
+from bddbot.transport import parse_address, PROTOCOL_XMLRPC
 from bddbot.errors import BotError
 from bddbot.test.utils import BankMockerTest
 from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2, FEATURE_PATH_1, FEATURE_PATH_2
-from bddbot.test.constants import DEFAULT_TEST_COMMANDS, CLIENT
+from bddbot.test.constants import DEFAULT_TEST_COMMANDS, CLIENT, BANK_HASH
 
 FEATURES_DIRECTORY = "features"
+SESSION_OPTIONS = {
+    "compress_threshold": COMPRESS_THRESHOLD,
+    "protocol": PROTOCOL_XMLRPC,
+    "timeout": TIMEOUT,
+    "retries": RETRIES,
+    "retry_backoff": RETRY_BACKOFF,
+}
 
 (FEATURE_1, SCENARIO_1_1, SCENARIO_1_2) = (
     "Feature: First feature",
@@ -54,18 +65,19 @@ class BaseDealerTest(BankMockerTest):
             open = self.mocked_open,
             Bank = self.mock_bank_class,
             RemoteBank = self.mock_bank_class,
+            RemoteSession = self.mock_session_class,
             Popen = self.mocked_popen,
             mkdir = self.mocked_mkdir)
 
         patcher.start()
 
-    def _create_dealer(self, banks, tests, name = ""):
+    def _create_dealer(self, banks, tests, name = "", **kwargs):
         """Create a new dealer instance without loading state."""
         if tests is None:
             tests = DEFAULT_TEST_COMMANDS
 
         self.mocked_open[STATE_PATH].side_effect = IOError()
-        self.dealer = Dealer(banks, tests, name = name)
+        self.dealer = Dealer(banks, tests, name = name, **kwargs)
 
         self.mocked_open.assert_called_once_with(STATE_PATH, "rb")
 
@@ -84,7 +96,8 @@ class BaseDealerTest(BankMockerTest):
         # pylint: disable=bad-continuation
         with patch.multiple("bddbot.dealer",
              Bank = self.mock_bank_class,
-             RemoteBank = self.mock_bank_class):
+             RemoteBank = self.mock_bank_class,
+             RemoteSession = self.mock_session_class):
             self.dealer.load()
 
         # Verify calls to mocks.
@@ -93,10 +106,13 @@ class BaseDealerTest(BankMockerTest):
 
         for path in banks:
             if not path.startswith("@"):
-                self.mock_bank_class.assert_any_call(path)
+                self.mock_bank_class.assert_any_call(path, cache = None)
             else:
-                (host, port) = path[1:].split(":")
-                self.mock_bank_class.assert_called_with(name, host, int(port))
+                (protocol, host, port) = parse_address(path)
+                options = dict(SESSION_OPTIONS)
+                options["protocol"] = protocol
+                self.mock_bank_class.assert_any_call(ANY, host, port, session = ANY)
+                self.mock_session_class.assert_any_call(ANY, port, **options)
 
         self._reset_mocks()
 
@@ -191,9 +207,38 @@ class TestConfiguration(BaseDealerTest):
         self._load_dealer(banks = ["@host:3037", ], name = CLIENT)
         assert_true(self.mock_banks["@host:3037"].is_remote)
 
+    def test_set_remote_json_bank(self):
+        self._load_dealer(banks = ["@json://host:3037", ], name = CLIENT)
+        assert_true(self.mock_banks["@json://host:3037"].is_remote)
+
     def test_set_multiple_banks(self):
         self._load_dealer(banks = [BANK_PATH_1, BANK_PATH_2, ])
 
+    def test_shared_server(self):
+        # Banks on the same server (and protocol) share its session, each in a slot of its own.
+        paths = ["@host:3037", "@host:3037", "@json://host:3037", "@host:3037", ]
+        self._load_dealer(banks = paths, name = CLIENT)
+        banks = [
+            self.mock_banks[key]
+            for key in ("@host:3037", "@host:3037#2", "@json://host:3037", "@host:3037#3", )]
+
+        assert_equal(
+            [CLIENT, CLIENT + "#2", CLIENT, CLIENT + "#3", ], [bank.client for bank in banks])
+        sessions = [bank.session for bank in banks]
+        assert_equal([0, 0, 2, 0, ], [sessions.index(session) for session in sessions])
+
+    def test_server_aliases(self):
+        # Host names are resolved to tell whether they're the same server.
+        addresses = {"host": "10.0.0.1", "alias": "10.0.0.1", "other": "10.0.0.2", }
+        with patch("bddbot.dealer.socket.gethostbyname", side_effect = addresses.get):
+            self._load_dealer(banks = ["@host:3037", "@alias:3037", "@other:3037", ])
+
+        (first, alias, other) = (
+            self.mock_banks[key] for key in ("@host:3037", "@alias:3037#2", "@other:3037", ))
+        assert_equal(("host", "#2"), (first.session.host, alias.client))
+        assert_true(first.session is alias.session)
+        assert_false(first.session is other.session)
+
     def test_set_test_command(self):
         test_command_1 = ["some_test", ]
         test_command_2 = ["another_test", "--awesome", ]
@@ -268,6 +313,39 @@ class TestLoading(BaseDealerTest):
         self.mock_bank_class.assert_not_called()
         self.mocked_popen.assert_not_called()
 
+    def test_remote_statuses(self):
+        # Remote banks' statuses are fetched concurrently, local banks don't need to fetch theirs.
+        remote_paths = ["@host:3037", "@json://other:3037", ]
+        self._load_dealer(banks = [BANK_PATH_1, ] + remote_paths)
+        events = dict((path, Event()) for path in remote_paths)
+        seen = []
+
+        def fetch_status(path, other_path):
+            # pylint: disable=missing-docstring
+            events[path].set()
+            if events[other_path].wait(1.0):
+                seen.append(path)
+
+        for (path, other_path) in zip(remote_paths, reversed(remote_paths)):
+            self.mock_banks[path].is_done.return_value = True
+            self.mock_banks[path].fetch_status.side_effect = partial(fetch_status, path, other_path)
+
+        self.mock_banks[BANK_PATH_1].is_done.return_value = True
+        assert_true(self.dealer.is_done)
+
+        assert_equal(set(remote_paths), set(seen))
+        self.mock_banks[BANK_PATH_1].fetch_status.assert_not_called()
+
+    def test_shared_server_statuses(self):
+        # Banks on the same server have their statuses fetched together.
+        self._load_dealer(banks = ["@host:3037", "@host:3037", ])
+        banks = [self.mock_banks[path] for path in ("@host:3037", "@host:3037#2", )]
+        for bank in banks:
+            bank.is_done.return_value = True
+
+        assert_true(self.dealer.is_done)
+        banks[0].session.fetch_statuses.assert_called_once_with(banks)
+
 class TestDealFirst(BaseDealerTest):
     def setup(self):
         self._mock_dealer_functions()
@@ -330,7 +408,7 @@ class TestDealFirst(BaseDealerTest):
         with patch("bddbot.dealer.Bank", self.mock_bank_class):
             self.dealer.deal()
 
-        self.mock_bank_class.assert_called_once_with(BANK_PATH_1)
+        self.mock_bank_class.assert_called_once_with(BANK_PATH_1, cache = None)
         self.mocked_open.assert_called_once_with(FEATURE_PATH_1, "w")
         self.mocked_popen.assert_not_called()
         self._assert_writes(["", FEATURE_1 + "\n", SCENARIO_1_1, ])
@@ -389,6 +467,22 @@ class TestDealNext(BaseDealerTest):
         popen_calls = self._deal(None, SCENARIO_1_2)
         assert_equal(DEFAULT_TEST_COMMANDS, popen_calls)
 
+    def test_sessions_closed_while_testing(self):
+        # Servers aren't kept waiting on the client's idle connections while the tests run.
+        (self.dealer, closed_sessions) = (None, [])
+        self._load_dealer(banks = ["@host:3037", ])
+        bank = self.mock_banks["@host:3037"]
+        bank.is_fresh.return_value = False
+        bank.is_done.return_value = True
+        self.mocked_popen.side_effect = lambda *args, **kwargs: \
+            closed_sessions.append(bank.session.close_idle.call_count) or DEFAULT
+        self.mocked_popen.return_value.returncode = 0
+        self.mocked_popen.return_value.communicate.return_value = ("", "")
+
+        self.dealer.deal()
+
+        assert_equal([1] * len(DEFAULT_TEST_COMMANDS), closed_sessions)
+
     def test_failed_write(self):
         self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_2)
         self.mocked_open[FEATURE_PATH_1].write.side_effect = IOError()
@@ -400,6 +494,50 @@ class TestDealNext(BaseDealerTest):
         self.mocked_open.assert_called_once_with(FEATURE_PATH_1, "ab")
         self.mocked_open[FEATURE_PATH_1].write.assert_called_once_with(SCENARIO_1_2)
 
+class TestPrefetch(BaseDealerTest):
+    def setup(self):
+        self._mock_dealer_functions()
+        self._create_dealer([BANK_PATH_1, BANK_PATH_2, ], None, prefetch = True)
+        self._load_dealer(banks = [BANK_PATH_1, BANK_PATH_2, ])
+
+    def test_prefetch_while_testing(self):
+        # The next scenario is prefetched from the current bank before the tests run.
+        self._setup_bank(BANK_PATH_1, False, True, None)
+        self._setup_bank(BANK_PATH_2, False, False, SCENARIO_2_1)
+        self.mock_banks[BANK_PATH_2].prefetch.side_effect = \
+            lambda: self.mocked_popen.assert_not_called()
+        self.mocked_popen.return_value.returncode = 0
+        self.mocked_popen.return_value.communicate.return_value = ("", "")
+
+        self.dealer.deal()
+
+        self.mock_banks[BANK_PATH_1].prefetch.assert_not_called()
+        self.mock_banks[BANK_PATH_2].prefetch.assert_called_once_with()
+        self.mock_banks[BANK_PATH_2].commit.assert_called_once_with()
+        self.mock_banks[BANK_PATH_2].get_next_scenario.assert_called_once_with()
+        self.mocked_popen.assert_any_call(TEST_COMMAND, stdout = ANY, stderr = ANY)
+
+    def test_tests_failing(self):
+        # The prefetched scenario isn't committed, so it's released along with the bank.
+        self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_2)
+        self.mocked_popen.return_value.returncode = 1
+        self.mocked_popen.return_value.communicate.return_value = ("", "")
+
+        with assert_raises(BotError):
+            self.dealer.deal()
+
+        self.mock_banks[BANK_PATH_1].prefetch.assert_called_once_with()
+        self.mock_banks[BANK_PATH_1].commit.assert_not_called()
+        self.mock_banks[BANK_PATH_1].close.assert_called_once_with()
+
+    def test_first_deal(self):
+        # Nothing is prefetched when the tests aren't run.
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        self._setup_bank(BANK_PATH_2, True, False, SCENARIO_2_1)
+
+        self._deal(FEATURE_1, SCENARIO_1_1)
+        self.mock_banks[BANK_PATH_1].prefetch.assert_not_called()
+
 class TestDealFromMultipleBanks(BaseDealerTest):
     SCENARIO_COUNTS = [3, 2, 1, 1, 5, ]
     BANKS = ["banks/{:d}.bank".format(i + 1) for i in xrange(len(SCENARIO_COUNTS))]
@@ -496,12 +634,11 @@ class TestPersistency(BaseDealerTest):
             yield (self._check_save, False, banks, [])
             yield (self._check_save, True, banks, banks)
 
-    def test_error_unpickling(self):
+    def test_error_reading_state(self):
         self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_2)
 
-        mocked_load = Mock(side_effect = IOError())
-        with patch("bddbot.dealer.pickle.load", mocked_load):
-            self.dealer = Dealer([BANK_PATH_1, ], DEFAULT_TEST_COMMANDS)
+        self.mocked_open[STATE_PATH].side_effect = IOError()
+        self.dealer = Dealer([BANK_PATH_1, ], DEFAULT_TEST_COMMANDS)
 
         self.mocked_open.assert_called_once_with(STATE_PATH, "rb")
         self._reset_mocks()
@@ -510,38 +647,92 @@ class TestPersistency(BaseDealerTest):
         with patch("bddbot.dealer.Bank", self.mock_bank_class):
             self.dealer.load()
 
-        self.mock_bank_class.assert_called_once_with(BANK_PATH_1)
+        self.mock_bank_class.assert_called_once_with(BANK_PATH_1, cache = None)
 
     def test_resume(self):
         self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_2)
 
         # Load a dealer's state.
-        with patch("bddbot.dealer.pickle.load") as mocked_load:
-            mocked_load.return_value = self.mock_banks.values()
+        with patch("bddbot.dealer.read_state") as mocked_read_state:
+            mocked_read_state.return_value = [
+                {"path": BANK_PATH_1, "sha1": BANK_HASH, "dealt": 1, "total": 2, },
+            ]
             self.dealer = Dealer([], DEFAULT_TEST_COMMANDS)
 
         self.mocked_open.assert_called_once_with(STATE_PATH, "rb")
-        mocked_load.assert_called_once_with(ANY)
+        mocked_read_state.assert_called_once_with(self.mocked_open[STATE_PATH], [])
+        self.mock_bank_class.assert_not_called()
         self.mocked_popen.assert_not_called()
 
+        # Banks are restored from their files, along with their progress.
+        self.dealer.load()
+        self.mock_bank_class.assert_called_once_with(BANK_PATH_1, cache = None)
+        self.mock_banks[BANK_PATH_1].mark_dealt.assert_called_once_with(1)
+
         # Reset the open mock before calling `_deal`, required for assertions.
-        self.mocked_open.reset_mock()
+        self._reset_mocks()
 
         # Verify successful loading by dealing from the bank.
         popen_calls = self._deal(None, SCENARIO_1_2, BANK_PATH_1)
         assert_equal(DEFAULT_TEST_COMMANDS, popen_calls)
 
+    def test_done_from_state(self):
+        # Whether the dealer is done is answered from the state, without reading the banks.
+        for (dealt, is_done) in ((1, False), (2, True)):
+            with patch("bddbot.dealer.read_state") as mocked_read_state:
+                mocked_read_state.return_value = [
+                    {"path": BANK_PATH_1, "sha1": BANK_HASH, "dealt": 2, "total": 2, },
+                    {"path": BANK_PATH_2, "sha1": BANK_HASH, "dealt": dealt, "total": 2, },
+                ]
+                self.dealer = Dealer([], DEFAULT_TEST_COMMANDS)
+
+            assert_equal(is_done, self.dealer.is_done)
+            self.mock_bank_class.assert_not_called()
+
+    def test_save_unloaded_state(self):
+        # Saving before the banks were restored keeps the state as it was.
+        entries = [{"path": BANK_PATH_1, "sha1": BANK_HASH, "dealt": 1, "total": 2, }, ]
+        with patch("bddbot.dealer.read_state", return_value = entries):
+            self.dealer = Dealer([], DEFAULT_TEST_COMMANDS)
+
+        self._reset_mocks()
+        with patch("bddbot.dealer.write_state") as mocked_write_state:
+            self.dealer.save()
+
+        mocked_write_state.assert_called_once_with(self.mocked_open[STATE_PATH], entries)
+        self.mock_bank_class.assert_not_called()
+
+    def test_committed_reservation(self):
+        # Remote banks' last reservations taken are saved, to be committed by their next deal.
+        remote_path = "@host:3037"
+        entries = [{"path": remote_path, "committed": "request", }, ]
+        with patch("bddbot.dealer.read_state", return_value = entries):
+            self.dealer = Dealer([], DEFAULT_TEST_COMMANDS)
+
+        self.dealer.load()
+        assert_equal("request", self.mock_banks[remote_path].committed)
+
+        with patch("bddbot.dealer.write_state") as mocked_write_state:
+            self.dealer.save()
+
+        mocked_write_state.assert_called_once_with(self.mocked_open[STATE_PATH], entries)
+
     def _check_save(self, should_load, bank_paths, expected_banks):
         if not should_load:
             self._create_dealer(bank_paths, None)
         else:
             self._load_dealer(banks = bank_paths)
 
-        with patch("bddbot.dealer.pickle.dump") as mocked_dump:
+        with patch("bddbot.dealer.write_state") as mocked_write_state:
             self.dealer.save()
 
         self.mocked_open.assert_called_once_with(STATE_PATH, "wb")
-        mocked_dump.assert_called_once_with(
-            [self.mock_banks[path] for path in expected_banks],
-            self.mocked_open[STATE_PATH])
+        mocked_write_state.assert_called_once_with(
+            self.mocked_open[STATE_PATH],
+            [{
+                "path": path,
+                "sha1": BANK_HASH,
+                "dealt": self.mock_banks[path].dealt_count,
+                "total": self.mock_banks[path].total_count,
+            } for path in expected_banks])
         self.mocked_popen.assert_not_called()
@@ -0,0 +1,184 @@
+"""Test serving banks over an event loop."""
+
+import errno
+import resource
+import socket
+from threading import Thread
+from time import sleep
+from httplib import HTTPConnection
+from xmlrpclib import Fault, ServerProxy
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises, assert_in
+from nose.tools import assert_less
+from nose.plugins.skip import SkipTest
+from mock import patch
+from bddbot.eventloop import EventLoopServer, ACCEPT_BACKOFF
+from bddbot.bank import RemoteBank
+from bddbot.transport import JSONProxy, RemoteError, PROTOCOL_JSON, HEADER
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, CLIENT
+
+(FEATURE, SCENARIO_1, SCENARIO_2) = (
+    "Feature: A feature",
+    "    Scenario: The first scenario",
+    "    Scenario: The second scenario",
+)
+
+IDLE_CONNECTIONS = 1100
+
+# Descriptors the test process needs besides the connections' (both ends of each take one).
+SPARE_FILES = 100
+
+class TestEventLoop(SandboxTest):
+    def __init__(self):
+        super(TestEventLoop, self).__init__()
+        self.server = None
+        self.thread = None
+
+    def teardown(self):
+        if self.server:
+            self.server.shutdown()
+            self.thread.join()
+            self.server.server_close()
+
+        super(TestEventLoop, self).teardown()
+
+    def test_protocols(self):
+        # Both protocols deal over a single connection each, which is kept open.
+        self._start_server(1.0)
+        port = self.server.server_address[1]
+        json_bank = RemoteBank(CLIENT, "localhost", port, protocol = PROTOCOL_JSON)
+        xmlrpc_bank = RemoteBank("other", "localhost", port)
+
+        assert_true(json_bank.is_fresh())
+        assert_equal(SCENARIO_1 + "\n", json_bank.get_next_scenario())
+        assert_equal(FEATURE, json_bank.feature.rstrip("\n"))
+        assert_true(xmlrpc_bank.is_done())
+        assert_equal(2, self.server.connections)
+
+        json_bank.close()
+        xmlrpc_bank.close()
+
+    def test_compression(self):
+        self._start_server(1.0, compress_threshold = 0)
+        port = self.server.server_address[1]
+        bank = RemoteBank(CLIENT, "localhost", port, compress_threshold = 0)
+
+        assert_equal(SCENARIO_1 + "\n", bank.get_next_scenario())
+        assert_equal(FEATURE, bank.feature.rstrip("\n"))
+        bank.close()
+
+    def test_errors(self):
+        # Errors are returned the same way as by the threaded server.
+        self._start_server(1.0)
+        port = self.server.server_address[1]
+        (json_proxy, xmlrpc_proxy) = (
+            JSONProxy("localhost", port),
+            ServerProxy("http://localhost:{:d}".format(port)))
+
+        with assert_raises(RemoteError):
+            json_proxy.no_such_method()
+
+        with assert_raises(Fault):
+            xmlrpc_proxy.no_such_method()
+
+        assert_false(json_proxy.is_done(CLIENT))
+        assert_false(xmlrpc_proxy.is_done(CLIENT))
+        json_proxy("close")()
+        xmlrpc_proxy("close")()
+
+    def test_bad_requests(self):
+        self._start_server(1.0)
+        port = self.server.server_address[1]
+
+        connection = HTTPConnection("localhost", port)
+        try:
+            connection.request("GET", "/RPC2")
+            assert_equal(501, connection.getresponse().status)
+        finally:
+            connection.close()
+
+        # Messages which are too large close the connection.
+        sock = socket.create_connection(("localhost", port))
+        try:
+            sock.sendall(HEADER.pack(0xffffffff >> 8) + "{")
+            assert_equal("", sock.recv(1))
+        finally:
+            sock.close()
+
+    def test_idle_connections(self):
+        # Clients are served while many other connections are idle, until they time out.
+        _raise_file_limit(2 * IDLE_CONNECTIONS + SPARE_FILES)
+        self._start_server(1.0)
+        port = self.server.server_address[1]
+        idle = [socket.create_connection(("localhost", port)) for _ in xrange(IDLE_CONNECTIONS)]
+
+        try:
+            assert_true(self._wait_for_connections(IDLE_CONNECTIONS))
+
+            proxy = JSONProxy("localhost", port, timeout = 1.0)
+            assert_true(proxy.is_fresh(CLIENT))
+            proxy("close")()
+
+            assert_true(self._wait_for_connections(0))
+        finally:
+            for sock in idle:
+                sock.close()
+
+    def test_too_many_open_files(self):
+        # The server stops accepting connections for a while, instead of trying again right away.
+        self._start_server(1.0)
+        error = socket.error(errno.EMFILE, "Too many open files")
+
+        with patch("asyncore.dispatcher.accept", side_effect = error) as mocked_accept:
+            sock = socket.create_connection(self.server.server_address)
+            sleep(3 * ACCEPT_BACKOFF)
+
+        try:
+            assert_less(mocked_accept.call_count, 10)
+
+            # Pending connections are accepted once descriptors are available again.
+            assert_true(self._wait_for_connections(1))
+        finally:
+            sock.close()
+
+    def test_disabled_keep_alive(self):
+        self._start_server(0)
+        port = self.server.server_address[1]
+        sock = socket.create_connection(("localhost", port))
+
+        try:
+            sock.sendall(HEADER.pack(2) + "{}")
+            response = sock.recv(0x1000)
+            assert_in("error", response)
+            assert_equal("", sock.recv(1))
+        finally:
+            sock.close()
+
+    def _wait_for_connections(self, count, timeout = 5.0):
+        """Wait for the server to have a number of open connections, returning whether it did."""
+        for _ in xrange(int(timeout / 0.01)):
+            if count == self.server.connections:
+                return True
+
+            sleep(0.01)
+
+        return False
+
+    def _start_server(self, keep_alive, **kwargs):
+        """Start serving a bank on an arbitrary port."""
+        path = self.sandbox.write(BANK_PATH_1, "\n".join([FEATURE, SCENARIO_1, SCENARIO_2, ]))
+
+        self.server = EventLoopServer("localhost", 0, [path, ], keep_alive = keep_alive, **kwargs)
+        self.thread = Thread(target = self.server.serve_forever, kwargs = {"poll_interval": 0.01})
+        self.thread.start()
+
+def _raise_file_limit(count):
+    """Allow the process to open as many files as the test needs, skipping it if it can't."""
+    (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if count <= soft:
+        return
+
+    if (resource.RLIM_INFINITY != hard) and (hard < count):
+        raise SkipTest("Can't open {:d} files (see 'ulimit -n')".format(count))
+
+    resource.setrlimit(resource.RLIMIT_NOFILE, (count, hard))
@@ -0,0 +1,138 @@
+"""Test recording the server's progress in a journal."""
+
+from time import sleep
+from nose.tools import assert_equal, assert_raises, assert_less
+from mock import patch, ANY
+from bddbot.journal import DealJournal, JournalError
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2, CLIENT
+
+JOURNAL_PATH = "journal"
+
+class TestDealJournal(SandboxTest):
+    def __init__(self):
+        super(TestDealJournal, self).__init__()
+        self.path = None
+
+    def setup(self):
+        super(TestDealJournal, self).setup()
+        self.path = self.sandbox.getpath(JOURNAL_PATH)
+
+    def test_new_journal(self):
+        journal = DealJournal(self.path)
+        journal.close()
+
+        assert_equal(["{\"version\":1}"], self.__read_lines())
+        self.__check_replay({}, {})
+
+    def test_replay(self):
+        (client_1, client_2) = (CLIENT + "_1", CLIENT + "_2")
+        journal = DealJournal(self.path)
+        journal.assign(client_1, BANK_PATH_1)
+        journal.deal(BANK_PATH_1, 1)
+        journal.assign(client_2, BANK_PATH_2)
+        journal.deal(BANK_PATH_2, 1)
+        journal.deal(BANK_PATH_1, 2)
+        journal.unassign(client_1)
+        journal.close()
+
+        self.__check_replay({BANK_PATH_1: 2, BANK_PATH_2: 1, }, {client_2: BANK_PATH_2, })
+
+    def test_removed_bank(self):
+        journal = DealJournal(self.path)
+        journal.assign(CLIENT, BANK_PATH_1)
+        journal.deal(BANK_PATH_1, 1)
+        journal.deal(BANK_PATH_2, 1)
+        journal.remove(BANK_PATH_1)
+        journal.close()
+
+        self.__check_replay({BANK_PATH_2: 1, }, {})
+
+    def test_unchanged_records(self):
+        # Records which don't change anything aren't written.
+        journal = DealJournal(self.path)
+        journal.assign(CLIENT, BANK_PATH_1)
+        journal.assign(CLIENT, BANK_PATH_1)
+        journal.deal(BANK_PATH_1, 0)
+        journal.unassign(CLIENT + "_2")
+        journal.remove(BANK_PATH_2)
+        journal.close()
+
+        assert_equal(2, len(self.__read_lines()))
+
+    def test_partial_record(self):
+        # A record cut short by a crash is dropped, and new records are written in its place.
+        journal = DealJournal(self.path)
+        journal.deal(BANK_PATH_1, 1)
+        journal.close()
+
+        with open(self.path, "ab") as journal_file:
+            journal_file.write("{\"event\":\"deal\",\"ba")
+
+        journal = DealJournal(self.path)
+        assert_equal({BANK_PATH_1: 1, }, journal.dealt)
+        journal.deal(BANK_PATH_1, 2)
+        journal.close()
+
+        self.__check_replay({BANK_PATH_1: 2, }, {})
+
+    def test_unsupported_version(self):
+        self.sandbox.write(JOURNAL_PATH, "{\"version\":0}\n")
+
+        with assert_raises(JournalError):
+            DealJournal(self.path)
+
+    def test_group_commit(self):
+        # Records are synced together, once the group commit interval passes (or when closed).
+        journal = DealJournal(self.path, group_commit = 60)
+        with patch("bddbot.journal.fsync") as mocked_fsync:
+            for count in xrange(1, 10):
+                journal.deal(BANK_PATH_1, count)
+
+            mocked_fsync.assert_not_called()
+            journal.close()
+
+        mocked_fsync.assert_called_once_with(ANY)
+
+    def test_group_commit_interval(self):
+        journal = DealJournal(self.path, group_commit = 0.01)
+        with patch("bddbot.journal.fsync") as mocked_fsync:
+            journal.deal(BANK_PATH_1, 1)
+            journal.deal(BANK_PATH_1, 2)
+            sleep(0.1)
+
+        mocked_fsync.assert_called_once_with(ANY)
+        journal.close()
+
+    def test_no_group_commit(self):
+        journal = DealJournal(self.path, group_commit = 0)
+        with patch("bddbot.journal.fsync") as mocked_fsync:
+            for count in xrange(1, 10):
+                journal.deal(BANK_PATH_1, count)
+
+        assert_equal(9, mocked_fsync.call_count)
+        journal.close()
+
+    def test_compaction(self):
+        journal = DealJournal(self.path, compact_size = 10)
+        journal.assign(CLIENT, BANK_PATH_1)
+        for count in xrange(1, 100):
+            journal.deal(BANK_PATH_1, count)
+
+        journal.close()
+
+        assert_less(len(self.__read_lines()), 10)
+        self.__check_replay({BANK_PATH_1: 99, }, {CLIENT: BANK_PATH_1, })
+
+    def __check_replay(self, dealt, assigned):
+        """Replay the journal and check its progress."""
+        journal = DealJournal(self.path)
+        journal.close()
+
+        assert_equal(dealt, journal.dealt)
+        assert_equal(assigned, journal.assigned)
+
+    def __read_lines(self):
+        """Return the journal file's lines."""
+        with open(self.path, "r") as journal_file:
+            return journal_file.read().splitlines()
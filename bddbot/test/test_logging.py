@@ -3,13 +3,16 @@
 from os import chdir
 from time import sleep
 from threading import Thread
-import pickle
+import json
 from contextlib import contextmanager
 from nose.tools import assert_equal, assert_raises
 from testfixtures import TempDirectory
 from mock import patch, call, ANY
 from bddbot.dealer import Dealer, STATE_PATH
+from bddbot.cache import ParseCache
+from bddbot.state import STATE_VERSION
 from bddbot.config import TEST_COMMAND
+from bddbot.transport import PROTOCOL_XMLRPC
 from bddbot.errors import BotError, ParsingError
 from bddbot.test.test_server import BaseServerTest
 from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2, FEATURE_PATH_1, FEATURE_PATH_2
@@ -63,7 +66,7 @@ class TestDealerLogging(LoggingTestMixin):
         self.dealer = None
 
     def test_state(self):
-        self.sandbox.write(STATE_PATH, pickle.dumps({}))
+        self.sandbox.write(STATE_PATH, json.dumps({"version": STATE_VERSION, "banks": [], }))
 
         self._create_dealer()
 
@@ -104,13 +107,43 @@ class TestDealerLogging(LoggingTestMixin):
             ])
         self.mocked_log.warning.assert_not_called()
 
+    def test_load_cached(self):
+        self._write_banks()
+        cache = ParseCache(self.sandbox.getpath(".bdd-cache"))
+
+        # Load the dealer twice, the second time the banks are already cached.
+        for expected_counts in ((0, 2), (2, 2)):
+            self._create_dealer(cache = cache)
+            self.dealer.load()
+
+            self.mocked_log.info.assert_called_with(
+                "Parse cache: %d hit/s, %d miss/es", *expected_counts)
+
+    def test_changed_bank(self):
+        self._write_banks()
+        self._create_dealer()
+        self.dealer.load()
+        self.dealer.save()
+
+        self.sandbox.write(BANK_PATH_2, "\n".join([FEATURE_2, SCENARIO_2_1, ]))
+        self._create_dealer()
+        self.dealer.load()
+
+        self.mocked_log.assert_has_calls([
+            call.debug("Restoring banks"),
+            call.info("Loading features bank '%s'", BANK_PATH_1),
+            call.info("Loading features bank '%s'", BANK_PATH_2),
+            call.warning("Features bank '%s' changed since the state was saved", BANK_PATH_2),
+            ])
+        self.mocked_log.warning.assert_called_once_with(ANY, ANY)
+
     def test_remote_bank(self):
         self._create_dealer(["@{:s}:{:d}".format(HOST, PORT), ])
         self.dealer.load()
 
         self.mocked_log.assert_has_calls([
             call.debug("Loading banks"),
-            call.info("Connecting to remote server at %s:%d", HOST, PORT),
+            call.info("Connecting to remote server at %s:%d (%s)", HOST, PORT, PROTOCOL_XMLRPC),
             ])
         self.mocked_log.warning.assert_not_called()
 
@@ -136,6 +169,34 @@ class TestDealerLogging(LoggingTestMixin):
             call.exception("Parsing error in %s:%d:%s", bad_bank_path, 3, ANY),
             ])
 
+    def test_parallel_parsing_error(self):
+        # Errors are reported the same when parsing banks in parallel.
+        bad_bank_path = "banks/bad.bank"
+        self._write_banks()
+        self.sandbox.write(
+            bad_bank_path,
+            "\n".join([
+                FEATURE_1,
+                SCENARIO_1_1,
+                "        \"\"\"",
+                "        THIS IS AN UNFINISHED MULTILINE TEXT",
+            ]))
+
+        self._create_dealer([BANK_PATH_1, bad_bank_path, BANK_PATH_2, ], workers = 2)
+
+        with assert_raises(ParsingError) as error_context:
+            self.dealer.load()
+
+        assert_equal(bad_bank_path, error_context.exception.filename)
+        assert_equal(3, error_context.exception.line)
+        self.mocked_log.assert_has_calls([
+            call.debug("Loading banks"),
+            call.debug("Parsing %d banks in %d processes", 3, 2),
+            call.info("Loading features bank '%s'", BANK_PATH_1),
+            call.info("Loading features bank '%s'", bad_bank_path),
+            call.exception("Parsing error in %s:%d:%s", bad_bank_path, 3, ANY),
+            ])
+
     @patch("bddbot.dealer.Popen")
     def test_deal(self, mocked_popen):
         self._write_banks()
@@ -201,13 +262,13 @@ class TestDealerLogging(LoggingTestMixin):
 
         self.mocked_log.reset_mock()
 
-    def _create_dealer(self, banks = None):
+    def _create_dealer(self, banks = None, cache = None, workers = 1):
         """Create a new dealer and logger mock."""
         if banks is None:
             banks = [BANK_PATH_1, BANK_PATH_2, ]
 
         with self._mock_log():
-            self.dealer = Dealer(banks, DEFAULT_TEST_COMMANDS)
+            self.dealer = Dealer(banks, DEFAULT_TEST_COMMANDS, cache = cache, workers = workers)
 
     def _write_banks(self):
         # pylint: disable=missing-docstring
@@ -0,0 +1,83 @@
+"""Test parsing banks in a pool of worker processes."""
+
+from nose.tools import assert_equal, assert_raises, assert_multi_line_equal
+from bddbot.bank import Bank, LazyBank
+from bddbot.cache import ParseCache
+from bddbot.pool import ParallelIndex
+from bddbot.parser import index_bank
+from bddbot.errors import ParsingError
+from bddbot.test.utils import SandboxTest
+
+WORKERS = 2
+
+BANKS = [
+    ("banks/{:d}.bank".format(i), "\n".join(
+        ["Feature: Feature #{:d}".format(i), ] +
+        ["    Scenario: Scenario #{:d}-{:d}".format(i, j) for j in xrange(i)]))
+    for i in xrange(5)
+]
+
+class TestParallelIndex(SandboxTest):
+    def setup(self):
+        super(TestParallelIndex, self).setup()
+
+        # Banks are indexed in order, so their paths are kept in a list.
+        self.paths = [self.sandbox.write(path, contents) for (path, contents) in BANKS]
+
+    def test_index(self):
+        index = ParallelIndex(self.paths, WORKERS)
+
+        for (path, (_, contents)) in zip(self.paths, BANKS):
+            with open(path, "rb") as bank_file:
+                assert_equal(index_bank(contents.splitlines(True)), index.index(path, bank_file))
+
+    def test_banks(self):
+        for bank_class in (Bank, LazyBank):
+            yield (self._check_banks, bank_class)
+
+    def test_parsing_error(self):
+        bad_path = self.sandbox.write("banks/bad.bank", "\n".join([
+            "Feature: A bad feature",
+            "    @dangling",
+        ]))
+
+        index = ParallelIndex(self.paths + [bad_path, ], WORKERS)
+
+        with assert_raises(ParsingError) as error_context:
+            Bank(bad_path, cache = index)
+
+        assert_equal("Dangling tags", error_context.exception.message)
+        assert_equal(2, error_context.exception.line)
+
+    def test_missing_bank(self):
+        # Banks which couldn't be indexed are indexed when they're loaded.
+        missing_path = self.sandbox.getpath("banks/missing.bank")
+        index = ParallelIndex(self.paths + [missing_path, ], WORKERS)
+
+        (path, contents) = BANKS[-1]
+        path = self.sandbox.write(path.replace("4", "missing"), contents)
+        bank = Bank(path, cache = index)
+
+        assert_equal(4, len(list(iter(bank.get_next_scenario, None))))
+
+    def test_cache(self):
+        cache = ParseCache(self.sandbox.getpath("cache"))
+
+        ParallelIndex(self.paths, WORKERS, cache)
+        assert_equal((0, len(self.paths)), (cache.hits, cache.misses))
+
+        index = ParallelIndex(self.paths, WORKERS, cache)
+        assert_equal((len(self.paths), len(self.paths)), (cache.hits, cache.misses))
+        assert_equal((cache.hits, cache.misses), (index.hits, index.misses))
+
+    def _check_banks(self, bank_class):
+        index = ParallelIndex(self.paths, WORKERS)
+
+        for path in self.paths:
+            (expected, bank) = (bank_class(path), bank_class(path, cache = index))
+
+            assert_multi_line_equal(expected.header, bank.header)
+            assert_multi_line_equal(expected.feature, bank.feature)
+            for expected_scenario in iter(expected.get_next_scenario, None):
+                assert_multi_line_equal(expected_scenario, bank.get_next_scenario())
+            assert_equal(None, bank.get_next_scenario())
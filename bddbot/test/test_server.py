@@ -1,10 +1,24 @@
 """Test serving scenarios from a remote bot server."""
 
+from os import remove
 from threading import Thread
-from nose.tools import assert_equal, assert_items_equal
+from collections import Counter, defaultdict
+import socket
+import sys
+from time import sleep
+from httplib import HTTPConnection
+from xmlrpclib import dumps
+from nose.tools import assert_equal, assert_items_equal, assert_true, assert_false
+from nose.tools import assert_not_equal, assert_is_none, assert_raises, assert_in
 from mock import Mock, call, patch, ANY
 from bddbot.server import BankServer
-from bddbot.test.utils import BankMockerTest
+from bddbot.dealer import Dealer
+from bddbot.bank import Bank, LazyBank, RemoteBank, RemoteSession
+from bddbot.transport import JSONProxy, RemoteError, PROTOCOL_XMLRPC, PROTOCOL_JSON
+from bddbot.parser import index_bank
+from bddbot.journal import DealJournal
+from bddbot.catalog import BankCatalog
+from bddbot.test.utils import BankMockerTest, SandboxTest
 from bddbot.test.constants import BANK_PATH_1, BANK_PATH_2, FEATURE_PATH_1, FEATURE_PATH_2
 from bddbot.test.constants import HOST, PORT, CLIENT
 
@@ -15,6 +29,12 @@ QUERIES = {
     "get_header",
     "get_feature",
     "get_next_scenario",
+    "get_status",
+    "get_statuses",
+    "deal",
+    "reserve",
+    "commit",
+    "release",
 }
 
 (HEADER_1, FEATURE_1, SCENARIO_1_1, SCENARIO_1_2) = (
@@ -43,14 +63,15 @@ class BaseServerTest(BankMockerTest):
         super(BaseServerTest, self).__init__()
         self.server = None
 
-    def _create_server(self, banks):
+    def _create_server(self, banks, **kwargs):
         """Create a new server instance."""
         with patch("bddbot.server.Bank", self.mock_bank_class), \
+             patch("bddbot.server.LazyBank", self.mock_bank_class), \
              patch("socket.socket", return_value = self.mock_socket), \
              patch("fcntl.fcntl"):
-            self.server = BankServer(HOST, PORT, banks)
+            self.server = BankServer(HOST, PORT, banks, **kwargs)
 
-        self.mock_bank_class.assert_has_calls([call(path) for path in banks])
+        self.mock_bank_class.assert_has_calls([call(path, cache = None) for path in banks])
 
 class TestBankServer(BaseServerTest):
     FEATURES = {
@@ -69,6 +90,12 @@ class TestBankServer(BaseServerTest):
         for banks in ([], [BANK_PATH_1, ], [BANK_PATH_1, BANK_PATH_2, ]):
             yield (self._check_serving, banks)
 
+    def test_lazy_banks(self):
+        with patch("bddbot.server.Bank") as mocked_bank_class:
+            self._create_server([BANK_PATH_1, BANK_PATH_2, ], lazy = True)
+
+        mocked_bank_class.assert_not_called()
+
     def test_single_client(self):
         self._create_server([BANK_PATH_1, BANK_PATH_2, ])
 
@@ -139,10 +166,191 @@ class TestBankServer(BaseServerTest):
         self.__verify_properties(client_1, False, True, None, None)
         self.__verify_properties(client_2, False, True, None, None)
 
+    def test_deal(self):
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        self._setup_bank(BANK_PATH_2, True, False, SCENARIO_2_1)
+
+        status = self.server.funcs["get_status"](CLIENT)
+        assert_equal(
+            {
+                "is_fresh": True,
+                "is_done": False,
+                "token": ANY,
+                "threaded": False,
+                "output_path": FEATURE_PATH_1,
+                "header": HEADER_1,
+                "feature": FEATURE_1,
+            },
+            status)
+
+        # Dealing returns the status after the deal, without the metadata the client already has.
+        self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_1)
+        response = self.server.funcs["deal"](CLIENT, status["token"])
+
+        assert_equal(SCENARIO_1_1, response["scenario"])
+        assert_equal(
+            {"is_fresh": False, "is_done": False, "token": status["token"], "threaded": False, },
+            response["status"])
+        self.mock_banks[BANK_PATH_1].get_next_scenario.assert_called_once_with()
+        self.mock_banks[BANK_PATH_2].get_next_scenario.assert_not_called()
+
+    def test_statuses(self):
+        # Several clients' statuses are returned together, the same as one by one.
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        self._setup_bank(BANK_PATH_2, True, False, SCENARIO_2_1)
+        get_status = self.server.funcs["get_status"]
+        token = get_status(CLIENT)["token"]
+
+        statuses = self.server.funcs["get_statuses"]([[CLIENT, token], ["other", None], ])
+        assert_equal([get_status(CLIENT, token), get_status("other"), ], statuses)
+        assert_equal(FEATURE_1, statuses[1]["feature"])
+
+    def test_reserve(self):
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        self._setup_bank(BANK_PATH_2, True, False, SCENARIO_2_1)
+        (reserve, commit, release) = (
+            self.server.funcs[name] for name in ("reserve", "commit", "release", ))
+
+        # Reserved scenarios are dealt, and the bank is assigned to the client.
+        assert_equal(SCENARIO_1_1, reserve(CLIENT)["scenario"])
+        assert_equal(FEATURE_2, self.server.funcs["get_feature"]("other"))
+
+        # Released scenarios are returned to their bank.
+        assert_true(release(CLIENT))
+        assert_false(release(CLIENT))
+        self.mock_banks[BANK_PATH_1].return_scenario.assert_called_once_with()
+
+        # Reservations are committed explicitly, or by the client's next deal (given the
+        # reservation's request ID).
+        reserve(CLIENT)
+        assert_true(commit(CLIENT))
+        assert_false(commit(CLIENT))
+
+        reserve(CLIENT, None, "first")
+        self.server.funcs["deal"](CLIENT, None, "second", "first")
+        assert_false(release(CLIENT))
+        self.mock_banks[BANK_PATH_1].return_scenario.assert_called_once_with()
+
+    def test_reservation_not_taken(self):
+        # If the client's dealer stopped before taking its reservation, its next deal releases it.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        (reserve, deal) = (self.server.funcs[name] for name in ("reserve", "deal", ))
+
+        reserve(CLIENT, None, "first")
+        deal(CLIENT, None, "second")
+        self.mock_banks[BANK_PATH_1].return_scenario.assert_called_once_with()
+        assert_false(self.server.funcs["release"](CLIENT))
+
+        # So do reservations which were taken by another request.
+        reserve(CLIENT, None, "third", "first")
+        reserve(CLIENT, None, "fourth", "second")
+        assert_equal(2, self.mock_banks[BANK_PATH_1].return_scenario.call_count)
+
+    def test_reservation_response_lost(self):
+        # Dealing by the request which reserved the scenario takes the reservation.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+
+        self.server.funcs["reserve"](CLIENT, None, "first")
+        assert_equal(SCENARIO_1_1, self.server.funcs["deal"](CLIENT, None, "first")["scenario"])
+        assert_false(self.server.funcs["release"](CLIENT))
+        self.mock_banks[BANK_PATH_1].get_next_scenario.assert_called_once_with()
+        self.mock_banks[BANK_PATH_1].return_scenario.assert_not_called()
+
+    def test_resent_deal(self):
+        # Deals sent again by the same request return the same scenario.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        deal = self.server.funcs["deal"]
+
+        assert_equal(SCENARIO_1_1, deal(CLIENT, None, "first")["scenario"])
+        self._setup_bank(BANK_PATH_1, False, False, SCENARIO_1_2)
+        assert_equal(SCENARIO_1_1, deal(CLIENT, None, "first")["scenario"])
+        assert_equal(1, self.mock_banks[BANK_PATH_1].get_next_scenario.call_count)
+
+        # Other requests are dealt as usual.
+        assert_equal(SCENARIO_1_2, deal(CLIENT, None, "second")["scenario"])
+        assert_equal(2, self.mock_banks[BANK_PATH_1].get_next_scenario.call_count)
+
+    def test_resent_while_dealing(self):
+        # Deals sent again while the first request is still dealing wait for it to finish.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        deal = self.server.funcs["deal"]
+        resent = []
+        resender = Thread(target = lambda: resent.append(deal(CLIENT, None, "first")["scenario"]))
+
+        def get_next_scenario():
+            # pylint: disable=missing-docstring
+            resender.start()
+            resender.join(0.1)
+            return SCENARIO_1_1
+
+        self.mock_banks[BANK_PATH_1].get_next_scenario.side_effect = get_next_scenario
+        assert_equal(SCENARIO_1_1, deal(CLIENT, None, "first")["scenario"])
+        resender.join()
+
+        assert_equal([SCENARIO_1_1, ], resent)
+        assert_equal(1, self.mock_banks[BANK_PATH_1].get_next_scenario.call_count)
+
+    def test_resent_reservation(self):
+        # Reservations sent again don't reserve another scenario.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        (reserve, release) = (self.server.funcs[name] for name in ("reserve", "release", ))
+
+        reserve(CLIENT, None, "first")
+        assert_equal(SCENARIO_1_1, reserve(CLIENT, None, "first")["scenario"])
+        assert_true(release(CLIENT))
+        assert_false(release(CLIENT))
+        self.mock_banks[BANK_PATH_1].get_next_scenario.assert_called_once_with()
+
+    def test_reserve_nothing(self):
+        # Nothing is reserved once there are no more scenarios.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, False, True, None)
+
+        assert_is_none(self.server.funcs["reserve"](CLIENT)["scenario"])
+        assert_false(self.server.funcs["release"](CLIENT))
+
+    def test_token(self):
+        # Tokens change along with the bank's metadata.
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+        self._setup_bank(BANK_PATH_2, True, False, SCENARIO_2_1)
+        token = self.server.funcs["get_status"](CLIENT)["token"]
+
+        assert_equal(token, self.server.funcs["get_status"](CLIENT)["token"])
+
+        self._setup_bank(BANK_PATH_1, False, True, None)
+        status = self.server.funcs["get_status"](CLIENT, token)
+        assert_not_equal(token, status["token"])
+        assert_equal(FEATURE_2, status["feature"])
+
+        # No bank, no token.
+        self._setup_bank(BANK_PATH_2, False, True, None)
+        assert_is_none(self.server.funcs["get_status"](CLIENT)["token"])
+
+    def test_token_computed_once(self):
+        # The bank's metadata isn't read again to compute its token on every call.
+        self._create_server([BANK_PATH_1, ])
+        self._setup_bank(BANK_PATH_1, True, False, SCENARIO_1_1)
+
+        with patch("bddbot.server._get_token", return_value = "token") as mocked_get_token:
+            self.server.funcs["get_status"](CLIENT)
+            self.server.funcs["get_statuses"]([[CLIENT, "token"], ])
+            self.server.funcs["deal"](CLIENT, "token")
+
+        mocked_get_token.assert_called_once_with(self.mock_banks[BANK_PATH_1])
+
     def _check_serving(self, banks):
         self._create_server(banks)
 
-        self.mock_bank_class.assert_has_calls([call(path) for path in banks])
+        self.mock_bank_class.assert_has_calls([call(path, cache = None) for path in banks])
         assert_items_equal(banks, self.mock_banks.keys())
         assert_items_equal(QUERIES, self.server.funcs.keys())
         self.mock_socket.bind.assert_called_once_with((HOST, PORT))
@@ -167,3 +375,526 @@ class TestBankServer(BaseServerTest):
         assert_equal(header, self.server.funcs["get_header"](client))
         assert_equal(feature, self.server.funcs["get_feature"](client))
         assert_equal(scenario, self.server.funcs["get_next_scenario"](client))
+
+class TestReload(SandboxTest):
+    BANK_FILES = {
+        BANK_PATH_1: "\n".join([FEATURE_1, SCENARIO_1_1, SCENARIO_1_2, ]),
+        BANK_PATH_2: "\n".join([FEATURE_2, SCENARIO_2_1, ]),
+    }
+
+    def __init__(self):
+        super(TestReload, self).__init__()
+        self.server = None
+
+    def teardown(self):
+        super(TestReload, self).teardown()
+        self.server = None
+
+    def test_changed_bank(self):
+        for bank_class in (Bank, LazyBank):
+            yield (self._check_changed_bank, bank_class)
+
+    def test_reloaded_token(self):
+        # Reloaded banks' tokens change along with their metadata.
+        self._create_server([BANK_PATH_1, ])
+        token = self.server.funcs["get_status"](CLIENT)["token"]
+
+        self._modify(BANK_PATH_1, self.BANK_FILES[BANK_PATH_1].replace("#1", "#3"))
+        self.server.reload()
+
+        status = self.server.funcs["get_status"](CLIENT, token)
+        assert_not_equal(token, status["token"])
+        assert_equal("Feature: Feature #3", status["feature"].rstrip("\n"))
+
+    def test_unchanged_banks(self):
+        cache = Mock(hits = 0, misses = 0)
+        cache.index.side_effect = lambda path, bank_file: index_bank(bank_file)
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ], cache = cache)
+        cache.index.reset_mock()
+
+        self._modify(BANK_PATH_2, self.BANK_FILES[BANK_PATH_2])
+        self.server.reload()
+
+        cache.index.assert_called_once_with(self.paths[BANK_PATH_2], ANY)
+
+    def test_removed_bank(self):
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        # The client is assigned the next bank once its bank is removed.
+        remove(self.paths[BANK_PATH_1])
+        self.server.reload()
+        self.__deal(CLIENT, SCENARIO_2_1)
+        self.__deal(CLIENT, None)
+
+        # Once the file is back, the bank is served again (from the start).
+        self.sandbox.write(BANK_PATH_1, self.BANK_FILES[BANK_PATH_1])
+        self.server.reload()
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+    def test_added_bank(self):
+        self._create_server([BANK_PATH_1, ])
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+        self.__deal(CLIENT, SCENARIO_1_2)
+
+        self.server.reload([self.paths[BANK_PATH_1], self.paths[BANK_PATH_2], ])
+        self.__deal(CLIENT, SCENARIO_2_1)
+
+    def test_reassigned_bank(self):
+        # A changed bank stays assigned to its client, so other clients are dealt other banks.
+        (client_1, client_2) = (CLIENT + "_1", CLIENT + "_2")
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self.__deal(client_1, SCENARIO_1_1 + "\n")
+
+        self._modify(BANK_PATH_1, "\n".join([FEATURE_1, SCENARIO_1_1, SCENARIO_1_2, ]))
+        self.server.reload()
+
+        self.__deal(client_2, SCENARIO_2_1)
+        self.__deal(client_1, SCENARIO_1_2)
+        self.__deal(client_2, None)
+
+    def test_refilled_bank(self):
+        # Once a finished bank has new scenarios, it's free to be dealt again.
+        (client_1, client_2) = (CLIENT + "_1", CLIENT + "_2")
+        self._create_server([BANK_PATH_1, BANK_PATH_2, ])
+        self.__deal(client_1, SCENARIO_1_1 + "\n")
+        self.__deal(client_1, SCENARIO_1_2)
+        self.__deal(client_1, SCENARIO_2_1)
+        self.__deal(client_2, None)
+
+        self._modify(BANK_PATH_1, "\n".join([FEATURE_1, SCENARIO_1_1, SCENARIO_1_2, SCENARIO_2_1]))
+        self.server.reload()
+
+        self.__deal(client_2, SCENARIO_2_1)
+        self.__deal(client_1, None)
+
+    def test_broken_bank(self):
+        # Banks that fail parsing keep being served as they were.
+        self._create_server([BANK_PATH_1, ])
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        self._modify(BANK_PATH_1, "\n".join([self.BANK_FILES[BANK_PATH_1], "    @dangling", ]))
+        self.server.reload()
+
+        self.__deal(CLIENT, SCENARIO_1_2)
+
+    def test_lazy_bank_edited_in_place(self):
+        # A lazy bank's file edited before it's reloaded is reloaded by the request reading it.
+        self._create_server([BANK_PATH_1, ], lazy = True)
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        # The sections move, so the old offsets would read garbage from the mapped file.
+        contents = "\n".join(["# A new header", FEATURE_1, SCENARIO_1_1, SCENARIO_2_1, ])
+        self._modify(BANK_PATH_1, contents)
+        assert_equal(SCENARIO_2_1, self.server._dispatch("get_next_scenario", (CLIENT, )))
+
+    def test_removed_while_dealing(self):
+        # A bank removed while it's dealt from is only removed once the deal is recorded.
+        journal = DealJournal(self.sandbox.getpath("journal"))
+        self._create_server([BANK_PATH_1, ], journal = journal)
+        remover = Thread(target = self.server.reload, args = ([], ))
+        get_next_scenario = Bank.get_next_scenario
+
+        def deal_while_removing(bank):
+            # pylint: disable=missing-docstring
+            remover.start()
+            remover.join(0.1)
+            return get_next_scenario(bank)
+
+        with patch.object(Bank, "get_next_scenario", autospec = True,
+                          side_effect = deal_while_removing):
+            self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        remover.join()
+        journal.close()
+
+        self.__deal(CLIENT, None)
+        assert_equal({}, journal.dealt)
+
+    def test_reload_interval(self):
+        for (reload_interval, expected_scenario) in ((None, SCENARIO_1_2), (0, SCENARIO_2_1)):
+            yield (self._check_reload_interval, reload_interval, expected_scenario)
+
+    def _check_changed_bank(self, bank_class):
+        self._create_server([BANK_PATH_1, ], lazy = LazyBank is bank_class)
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        # Fix a dealt scenario and add another one.
+        self._modify(BANK_PATH_1, "\n".join([
+            FEATURE_1,
+            SCENARIO_1_1 + " (fixed)",
+            SCENARIO_1_2,
+            SCENARIO_2_1,
+        ]))
+        self.server.reload()
+
+        assert_false(self.server.funcs["is_fresh"](CLIENT))
+        self.__deal(CLIENT, SCENARIO_1_2 + "\n")
+        self.__deal(CLIENT, SCENARIO_2_1)
+        assert_true(self.server.funcs["is_done"](CLIENT))
+
+    def _check_reload_interval(self, reload_interval, expected_scenario):
+        self._create_server([BANK_PATH_1, ], reload_interval = reload_interval)
+        self.__deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        self._modify(BANK_PATH_1, "\n".join([FEATURE_1, SCENARIO_1_1, SCENARIO_2_1, ]))
+        assert_equal(expected_scenario, self.server._dispatch("get_next_scenario", (CLIENT, )))
+
+    def _create_server(self, banks, **kwargs):
+        """Create a new server instance, serving banks from the sandbox."""
+        with patch("socket.socket"), patch("fcntl.fcntl"):
+            self.server = BankServer(HOST, PORT, [self.paths[bank] for bank in banks], **kwargs)
+
+    def __deal(self, client, expected_scenario):
+        """Deal a scenario to the client and check it's the expected one."""
+        assert_equal(expected_scenario, self.server.funcs["get_next_scenario"](client))
+
+class TestJournal(SandboxTest):
+    BANK_FILES = TestReload.BANK_FILES
+
+    def __init__(self):
+        super(TestJournal, self).__init__()
+        self.server = None
+
+    def teardown(self):
+        self.server.server_close()
+        super(TestJournal, self).teardown()
+
+    def test_restart(self):
+        # A restarted server keeps dealing where it stopped, to the same clients.
+        (client_1, client_2) = (CLIENT + "_1", CLIENT + "_2")
+        self._start_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._deal(client_1, SCENARIO_1_1 + "\n")
+        self._deal(client_2, SCENARIO_2_1)
+
+        self._start_server([BANK_PATH_1, BANK_PATH_2, ])
+        assert_false(self.server.funcs["is_fresh"](client_1))
+        self._deal(client_1, SCENARIO_1_2)
+        self._deal(client_2, None)
+
+    def test_released_scenario(self):
+        self._start_server([BANK_PATH_1, ])
+        self._deal(CLIENT, SCENARIO_1_1 + "\n")
+        self.server.funcs["reserve"](CLIENT)
+        self.server.funcs["release"](CLIENT)
+
+        self._start_server([BANK_PATH_1, ])
+        self._deal(CLIENT, SCENARIO_1_2)
+
+    def test_removed_bank(self):
+        # Banks which aren't served anymore are dropped from the journal.
+        self._start_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        self._start_server([BANK_PATH_2, ])
+        self._deal(CLIENT, SCENARIO_2_1)
+
+        self._start_server([BANK_PATH_1, BANK_PATH_2, ])
+        self._deal(CLIENT, SCENARIO_1_1 + "\n")
+
+    def _start_server(self, banks):
+        """Start a new server instance, replaying the journal (stopping the previous instance)."""
+        if self.server:
+            self.server.server_close()
+
+        with patch("socket.socket"), patch("fcntl.fcntl"):
+            self.server = BankServer(
+                HOST, PORT, [self.paths[bank] for bank in banks], **self._get_storage())
+
+    def _get_storage(self):
+        """Return the server's arguments to record its progress with."""
+        return {"journal": DealJournal(self.sandbox.getpath("journal")), }
+
+    def _deal(self, client, expected_scenario):
+        """Deal a scenario to the client and check it's the expected one."""
+        assert_equal(expected_scenario, self.server.funcs["get_next_scenario"](client))
+
+class TestCatalog(TestJournal):
+    def test_changed_bank(self):
+        self._start_server([BANK_PATH_1, ])
+        self._deal(CLIENT, SCENARIO_1_1 + "\n")
+
+        self._modify(BANK_PATH_1, "\n".join([FEATURE_1, SCENARIO_1_1, SCENARIO_2_1, ]))
+        self.server.reload()
+
+        self._deal(CLIENT, SCENARIO_2_1)
+        self._start_server([BANK_PATH_1, ])
+        self._deal(CLIENT, None)
+
+    def _get_storage(self):
+        return {"catalog": BankCatalog(self.sandbox.getpath("catalog")), }
+
+class TestKeepAlive(SandboxTest):
+    def __init__(self):
+        super(TestKeepAlive, self).__init__()
+        self.server = None
+        self.thread = None
+        self.connections = None
+
+    def setup(self):
+        super(TestKeepAlive, self).setup()
+        self.connections = []
+
+    def teardown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        super(TestKeepAlive, self).teardown()
+
+    def test_single_connection(self):
+        # Consecutive calls share a connection, until the client closes it.
+        self._start_server(1.0)
+        bank = RemoteBank(CLIENT, "localhost", self.server.server_address[1])
+
+        bank.is_done()
+        bank.get_next_scenario()
+        bank.get_next_scenario()
+        assert_equal(1, len(self.connections))
+
+        bank.close()
+        bank.get_next_scenario()
+        assert_equal(2, len(self.connections))
+
+    def test_connections_between_deals(self):
+        # Threaded servers keep the dealer's connection open between deals, the others are only
+        # connected to while dealing.
+        yield (self._check_deals, 2, 1)
+        yield (self._check_deals, 0, 2)
+
+    def test_disabled(self):
+        self._start_server(0)
+        bank = RemoteBank(CLIENT, "localhost", self.server.server_address[1])
+
+        bank.is_done()
+        bank.get_next_scenario()
+        assert_equal(2, len(self.connections))
+
+    def test_compression(self):
+        # Responses are only compressed for clients that accept them compressed.
+        self._start_server(1.0, compress_threshold = 0)
+        connection = HTTPConnection("localhost", self.server.server_address[1])
+        request = dumps((CLIENT, ), "get_status")
+
+        try:
+            connection.request("POST", "/RPC2", request, {"Accept-Encoding": "gzip", })
+            response = connection.getresponse()
+            response.read()
+            assert_equal("gzip", response.getheader("Content-Encoding"))
+
+            connection.request("POST", "/RPC2", request)
+            response = connection.getresponse()
+            response.read()
+            assert_is_none(response.getheader("Content-Encoding"))
+        finally:
+            connection.close()
+
+    def test_compressed_calls(self):
+        self._start_server(1.0, compress_threshold = 0)
+        port = self.server.server_address[1]
+        bank = RemoteBank(CLIENT, "localhost", port, compress_threshold = 0)
+
+        assert_true(bank.is_fresh())
+        assert_equal(SCENARIO_1_1 + "\n", bank.get_next_scenario())
+        assert_equal(FEATURE_1, bank.feature.rstrip("\n"))
+        bank.close()
+
+    def test_json_protocol(self):
+        # The same server deals over both protocols, keeping JSON connections alive as well.
+        self._start_server(1.0)
+        port = self.server.server_address[1]
+        json_bank = RemoteBank(CLIENT, "localhost", port, protocol = PROTOCOL_JSON)
+        xmlrpc_bank = RemoteBank("other", "localhost", port)
+
+        assert_true(json_bank.is_fresh())
+        assert_equal(SCENARIO_1_1 + "\n", json_bank.get_next_scenario())
+        assert_equal(SCENARIO_1_2 + "\n", json_bank.get_next_scenario())
+        assert_equal(FEATURE_1, json_bank.feature.rstrip("\n"))
+        json_bank.close()
+        assert_equal(1, len(self.connections))
+
+        assert_true(xmlrpc_bank.is_done())
+        xmlrpc_bank.close()
+        assert_equal(2, len(self.connections))
+
+    def test_shared_session(self):
+        # Banks sharing a session deal over a single connection, fetching their statuses together.
+        self._start_server(1.0)
+        session = RemoteSession("localhost", self.server.server_address[1])
+        banks = [RemoteBank(client, None, None, session = session) for client in (CLIENT, "other")]
+
+        session.fetch_statuses(banks)
+        assert_true(all(bank.is_fresh() for bank in banks))
+        assert_equal(SCENARIO_1_1 + "\n", banks[0].get_next_scenario())
+
+        for bank in banks:
+            bank.close()
+
+        assert_equal(1, len(self.connections))
+
+    def test_json_disabled_keep_alive(self):
+        self._start_server(0)
+        port = self.server.server_address[1]
+        bank = RemoteBank(CLIENT, "localhost", port, protocol = PROTOCOL_JSON)
+
+        bank.is_done()
+        bank.get_next_scenario()
+        assert_equal(2, len(self.connections))
+
+    def test_json_error(self):
+        self._start_server(1.0)
+        proxy = JSONProxy("localhost", self.server.server_address[1])
+
+        with assert_raises(RemoteError) as error_context:
+            proxy.no_such_method()
+
+        assert_in("no_such_method", error_context.exception.message)
+
+        # The connection is still usable.
+        assert_false(proxy.is_done(CLIENT))
+        proxy("close")()
+        assert_equal(1, len(self.connections))
+
+    def _check_deals(self, threads, connections):
+        self._start_server(1.0, threads = threads)
+        dealer = Dealer(["@localhost:{:d}".format(self.server.server_address[1]), ], [])
+
+        dealer.deal()
+        dealer.deal()
+        assert_equal(connections, len(self.connections))
+
+    def _start_server(self, keep_alive, **kwargs):
+        """Start serving a bank on an arbitrary port, counting incoming connections."""
+        path = self.sandbox.write(BANK_PATH_1, "\n".join([
+            FEATURE_1,
+            SCENARIO_1_1,
+            SCENARIO_1_2,
+            "    Scenario: Scenario #1-3",
+        ]))
+
+        self.server = BankServer("localhost", 0, [path, ], keep_alive = keep_alive, **kwargs)
+        self.server.process_request = Mock(side_effect = self.__process_request)
+        self.thread = Thread(target = self.server.serve_forever, kwargs = {"poll_interval": 0.01})
+        self.thread.start()
+
+    def __process_request(self, request, client_address):
+        """Count connections and process them as usual."""
+        self.connections.append(client_address)
+        BankServer.process_request(self.server, request, client_address)
+
+class TestThreaded(SandboxTest):
+    """Test handling connections concurrently, in worker threads."""
+    BANKS = 8
+    SCENARIOS = 25
+    CLIENTS = 8
+    THREADS_PER_CLIENT = 2
+
+    def __init__(self):
+        super(TestThreaded, self).__init__()
+        self.server = None
+        self.thread = None
+
+    def setup(self):
+        super(TestThreaded, self).setup()
+        paths = []
+        for i in xrange(self.BANKS):
+            lines = ["Feature: Bank #{:d}".format(i), ]
+            lines.extend(
+                "    Scenario: Bank #{:d}, scenario #{:d}".format(i, j)
+                for j in xrange(self.SCENARIOS))
+            paths.append(self.sandbox.write("banks/{:d}.bank".format(i), "\n".join(lines)))
+
+        self.server = BankServer("localhost", 0, paths, keep_alive = 5.0, threads = 2)
+
+    def teardown(self):
+        if self.thread:
+            self.server.shutdown()
+            self.thread.join()
+
+        self.server.server_close()
+        super(TestThreaded, self).teardown()
+
+    def test_stalled_client(self):
+        # A client that never finishes its request doesn't hold up the others.
+        self.thread = Thread(target = self.server.serve_forever, kwargs = {"poll_interval": 0.01})
+        self.thread.start()
+
+        stalled = socket.create_connection(self.server.server_address)
+        try:
+            stalled.sendall("POST /RPC2 HTTP/1.1\r\n")
+            proxy = JSONProxy("localhost", self.server.server_address[1], timeout = 1.0)
+            assert_true(proxy.is_fresh(CLIENT))
+            proxy("close")()
+        finally:
+            stalled.close()
+
+    def test_more_clients_than_workers(self):
+        # Clients keeping their connections alive don't hold on to the workers while they're idle,
+        # so the other clients are served long before the idle connections would time out.
+        for protocol in (PROTOCOL_XMLRPC, PROTOCOL_JSON, ):
+            yield (self._check_idle_clients, protocol)
+
+    def test_concurrent_deals(self):
+        # Many clients dealing at once (each from several threads) are dealt every scenario
+        # exactly once, and every bank to a single client.
+        dealt = defaultdict(list)
+
+        def deal(client):
+            # pylint: disable=missing-docstring
+            while True:
+                scenario = self.server._dispatch("get_next_scenario", (client, ))
+                if scenario is None:
+                    return
+
+                dealt[client].append(scenario)
+                self.server._dispatch("is_done", (client, ))
+
+        threads = [
+            Thread(target = deal, args = ("client #{:d}".format(i), ))
+            for i in xrange(self.CLIENTS)
+            for _ in xrange(self.THREADS_PER_CLIENT)]
+
+        # Switch between threads as often as possible, especially while checking banks.
+        is_done = Bank.is_done
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            with patch.object(Bank, "is_done", autospec = True,
+                              side_effect = lambda bank: sleep(0) or is_done(bank)):
+                for thread in threads:
+                    thread.start()
+
+                for thread in threads:
+                    thread.join()
+        finally:
+            sys.setcheckinterval(check_interval)
+
+        counts = Counter(scenario for scenarios in dealt.itervalues() for scenario in scenarios)
+        assert_equal(self.BANKS * self.SCENARIOS, len(counts))
+        assert_equal({1, }, set(counts.itervalues()))
+
+        owners = defaultdict(set)
+        for (client, scenarios) in dealt.iteritems():
+            for scenario in scenarios:
+                owners[scenario.split(",")[0]].add(client)
+
+        assert_equal(self.BANKS, len(owners))
+        assert_true(all(1 == len(clients) for clients in owners.itervalues()))
+
+    def _check_idle_clients(self, protocol):
+        self.thread = Thread(target = self.server.serve_forever, kwargs = {"poll_interval": 0.01})
+        self.thread.start()
+
+        port = self.server.server_address[1]
+        banks = [
+            RemoteBank("client #{:d}".format(i), "localhost", port,
+                       protocol = protocol, timeout = 1.0, retries = 0)
+            for i in xrange(self.CLIENTS)]
+
+        # Deal twice to each client in turn, the second time after the others were dealt to.
+        try:
+            for _ in xrange(2):
+                for bank in banks:
+                    assert_in("Scenario:", bank.get_next_scenario())
+        finally:
+            for bank in banks:
+                bank.close()
@@ -0,0 +1,79 @@
+"""Test saving and restoring the dealer's state."""
+
+import json
+import pickle
+from StringIO import StringIO
+from nose.tools import assert_equal, assert_not_equal, assert_raises, assert_in, assert_less
+from bddbot.bank import Bank
+from bddbot.state import read_state, write_state, hash_bank, StateError, STATE_VERSION
+from bddbot.test.utils import SandboxTest
+from bddbot.test.constants import BANK_PATH_1, HOST, PORT
+
+REMOTE_PATH = "@{:s}:{:d}".format(HOST, PORT)
+
+CONTENTS = "\n".join([
+    "Feature: Some feature",
+    "    Scenario: The first scenario",
+    "    Scenario: The second scenario",
+])
+
+ENTRIES = [
+    {"path": BANK_PATH_1, "sha1": "0123456789abcdef", "dealt": 1, "total": 2, },
+    {"path": REMOTE_PATH, },
+]
+
+class TestState(SandboxTest):
+    @staticmethod
+    def test_round_trip():
+        state_file = StringIO()
+        write_state(state_file, ENTRIES)
+
+        state_file.seek(0)
+        assert_equal(ENTRIES, read_state(state_file, []))
+
+    @staticmethod
+    def test_unsupported_version():
+        state_file = StringIO(json.dumps({"version": STATE_VERSION + 1, "banks": [], }))
+
+        with assert_raises(StateError) as error_context:
+            read_state(state_file, [])
+
+        assert_in("unsupported state version", error_context.exception.message.lower())
+
+    def test_compact(self):
+        # The state doesn't grow with the banks' contents.
+        path = self.sandbox.write(BANK_PATH_1, "\n".join([CONTENTS, ] * 1000))
+        (state_file, bank) = (StringIO(), Bank(path))
+        write_state(state_file, [{"path": path, "sha1": hash_bank(path), "dealt": 0, "total": 0}])
+
+        assert_less(len(state_file.getvalue()), 200)
+        assert_equal(2000, bank.total_count)
+
+    def test_pickled_state(self):
+        # State files written by older versions are converted to entries.
+        path = self.sandbox.write(BANK_PATH_1, CONTENTS)
+        bank = Bank(path)
+        bank.get_next_scenario()
+        state_file = StringIO(pickle.dumps([bank, ]))
+
+        assert_equal(
+            [{"path": path, "sha1": None, "dealt": 1, "total": 2, }, ],
+            read_state(state_file, [path, ]))
+
+    def test_mismatching_pickled_state(self):
+        bank = Bank(self.sandbox.write(BANK_PATH_1, CONTENTS))
+        state_file = StringIO(pickle.dumps([bank, ]))
+
+        with assert_raises(StateError) as error_context:
+            read_state(state_file, [])
+
+        assert_in("doesn't match", error_context.exception.message.lower())
+
+    def test_hash_bank(self):
+        path_1 = self.sandbox.write("banks/1.bank", CONTENTS)
+        path_2 = self.sandbox.write("banks/2.bank", CONTENTS)
+        path_3 = self.sandbox.write("banks/3.bank", CONTENTS.upper())
+
+        assert_equal(hash_bank(path_1), hash_bank(path_2))
+        assert_equal(40, len(hash_bank(path_1)))
+        assert_not_equal(hash_bank(path_1), hash_bank(path_3))
@@ -0,0 +1,163 @@
+"""Test the protocols to talk to a bank server with."""
+
+import socket
+from threading import Thread
+from StringIO import StringIO
+from xmlrpclib import ServerProxy
+from nose.tools import assert_equal, assert_is_none, assert_raises, assert_in
+from bddbot.transport import parse_address, format_address, pack_message, read_message
+from bddbot.transport import JSON_MARKER, MAX_MESSAGE_SIZE, HEADER
+from bddbot.transport import JSONProxy, XMLRPCTransport
+from bddbot.transport import PROTOCOL_XMLRPC, PROTOCOL_JSON
+from bddbot.errors import BotError
+from bddbot.test.constants import HOST, PORT
+
+ADDRESSES = [
+    ("@{:s}:{:d}".format(HOST, PORT), PROTOCOL_XMLRPC),
+    ("@xmlrpc://{:s}:{:d}".format(HOST, PORT), PROTOCOL_XMLRPC),
+    ("@json://{:s}:{:d}".format(HOST, PORT), PROTOCOL_JSON),
+]
+
+def test_parse_address():
+    for (address, protocol) in ADDRESSES:
+        yield (_check_parse_address, address, protocol)
+
+def _check_parse_address(address, protocol):
+    assert_equal((protocol, HOST, PORT), parse_address(address))
+
+def test_unknown_protocol():
+    with assert_raises(BotError) as error_context:
+        parse_address("@smoke://{:s}:{:d}".format(HOST, PORT))
+
+    assert_in("unknown protocol", error_context.exception.message.lower())
+
+def test_format_address():
+    assert_equal("@{:s}:{:d}".format(HOST, PORT), format_address(PROTOCOL_XMLRPC, HOST, PORT))
+    assert_equal("@json://{:s}:{:d}".format(HOST, PORT), format_address(PROTOCOL_JSON, HOST, PORT))
+
+def test_messages():
+    messages = [
+        {"method": "deal", "params": ["client", None, ], },
+        {"result": {"scenario": "Scenario: A scenario\n", }, },
+    ]
+    stream = StringIO("".join(pack_message(message) for message in messages))
+
+    for message in messages:
+        assert_equal(message, read_message(stream))
+
+    assert_is_none(read_message(stream))
+
+def test_marker():
+    # Messages start with the marker the server recognizes them by.
+    assert_equal(JSON_MARKER, pack_message({"result": "x" * 0x10000, })[0])
+
+def test_message_cut_off():
+    message = pack_message({"result": None, })
+
+    for size in (2, len(message) - 1, ):
+        with assert_raises(socket.error):
+            read_message(StringIO(message[:size]))
+
+def test_message_too_large():
+    with assert_raises(socket.error):
+        read_message(StringIO(HEADER.pack(MAX_MESSAGE_SIZE + 1)))
+
+    with assert_raises(ValueError):
+        pack_message({"result": "x" * MAX_MESSAGE_SIZE, })
+
+def test_timeout():
+    # A server which never answers.
+    server = socket.socket()
+    server.bind(("localhost", 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+
+    try:
+        proxies = [
+            JSONProxy("localhost", port, timeout = 0.05),
+            ServerProxy(
+                "http://localhost:{:d}".format(port),
+                transport = XMLRPCTransport(timeout = 0.05)),
+        ]
+
+        for proxy in proxies:
+            with assert_raises(socket.timeout):
+                proxy.is_done("client")
+
+            proxy("close")()
+    finally:
+        server.close()
+
+def test_idle_connection_closed():
+    # A kept-alive connection the server closed before answering is replaced, sending the request
+    # again.
+    requests = []
+    (listener, thread) = _start_server(requests, [1, 1, ])
+
+    try:
+        proxy = JSONProxy("localhost", listener.getsockname()[1], timeout = 1.0)
+        assert_equal("result", proxy.is_done("client"))
+        assert_equal("result", proxy.is_done("client"))
+        proxy("close")()
+        thread.join()
+    finally:
+        listener.close()
+
+    assert_equal(2, len(requests))
+
+def test_no_resend_after_timeout():
+    # Requests which timed out might've been handled already, so they aren't sent again.
+    requests = []
+    (listener, thread) = _start_server(requests, [None, ])
+
+    try:
+        proxy = JSONProxy("localhost", listener.getsockname()[1], timeout = 0.05)
+        assert_equal("result", proxy.is_done("client"))
+        with assert_raises(socket.timeout):
+            proxy.is_done("client")
+
+        proxy("close")()
+        thread.join()
+
+        # Nor over a new connection.
+        listener.settimeout(0.1)
+        with assert_raises(socket.timeout):
+            listener.accept()
+    finally:
+        listener.close()
+
+    assert_equal(2, len(requests))
+
+def _start_server(requests, connections):
+    """Start a JSON server (in a thread) accepting a connection for each of the given counts.
+
+    Each connection answers that many requests and is then closed, or if the count is None it
+    answers a single request and ignores the rest until the client closes it. Requests are
+    collected into the given list.
+    """
+    listener = socket.socket()
+    listener.bind(("localhost", 0))
+    listener.listen(1)
+
+    def serve():
+        # pylint: disable=missing-docstring
+        for count in connections:
+            (connection, _) = listener.accept()
+            stream = connection.makefile("rb")
+            for (received, request) in enumerate(iter(lambda: read_message(stream), None), 1):
+                requests.append(request)
+                if (count is None) and (1 < received):
+                    continue
+
+                connection.sendall(pack_message({"result": "result", }))
+                if (count is not None) and (count <= received):
+                    break
+
+            stream.close()
+            connection.close()
+
+    thread = Thread(target = serve)
+    thread.daemon = True
+    thread.start()
+
+    return (listener, thread)
@@ -1,7 +1,11 @@
 """Utility constructs for testing purposes."""
 
+from os import stat, utime
 from collections import defaultdict
 from mock import Mock
+from testfixtures import TempDirectory
+from bddbot.transport import format_address, PROTOCOL_XMLRPC
+from bddbot.test.constants import BANK_HASH
 
 class BankMockerTest(object):
     # pylint: disable=too-few-public-methods
@@ -9,9 +13,11 @@ class BankMockerTest(object):
     def __init__(self):
         self.mock_banks = defaultdict(Mock)
         self.mock_bank_class = Mock(side_effect = self.__create_bank)
+        self.mock_session_class = Mock(side_effect = _create_session)
 
     def teardown(self):
         self.mock_bank_class.reset_mock()
+        self.mock_session_class.reset_mock()
         self.mock_banks.clear()
 
     def _setup_bank(self, bank, is_fresh, is_done, scenario):
@@ -26,14 +32,73 @@ class BankMockerTest(object):
         self.mock_banks[bank].feature = feature
         self.mock_banks[bank].get_next_scenario.return_value = scenario
 
-    def __create_bank(self, *args):
+    def __create_bank(self, *args, **kwargs):
         """Return a mock Bank instance, or creates a new one and adds it to the map."""
+        (client, session, digest) = (None, None, BANK_HASH)
         if 1 == len(args):
             is_remote = False
             (key, ) = args
         else:
             is_remote = True
-            (_, host, port) = args
-            key = "@{host}:{port:d}".format(host = host, port = port)
+            (client, host, port) = args
+            digest = None
+            session = kwargs.get("session")
+            protocol = session.protocol if session else kwargs.get("protocol", PROTOCOL_XMLRPC)
+            key = format_address(protocol, host, port)
 
-        return self.mock_banks.setdefault(key, Mock(is_remote = is_remote))
+            # Further banks on the same server are keyed by their slot (e.g. "@host:3037#2").
+            (_, separator, slot) = client.rpartition("#")
+            if separator:
+                key += separator + slot
+
+        return self.mock_banks.setdefault(
+            key, Mock(is_remote = is_remote, client = client, session = session, digest = digest))
+
+class SandboxTest(object):
+    """A base test case class running each test in a temporary directory (the sandbox).
+
+    The bank files in `BANK_FILES` (a mapping of their paths to their contents) are written to the
+    sandbox before each test, and `paths` maps them to their full paths.
+    """
+    # A bank with a header, tags and a multiline text that looks like a scenario.
+    SAMPLE_BANK = "\n".join([
+        "# Some header",
+        "Feature: A sample feature",
+        "    Scenario: The first scenario",
+        "    @tagged",
+        "    Scenario: The second scenario",
+        "        Given some multiline text:",
+        "            \"\"\"",
+        "            Scenario: Not really a scenario",
+        "            \"\"\"",
+    ])
+
+    BANK_FILES = {}
+
+    def __init__(self):
+        self.sandbox = None
+        self.paths = None
+
+    def setup(self):
+        self.sandbox = TempDirectory()
+        self.paths = dict(
+            (bank, self.sandbox.write(bank, contents))
+            for (bank, contents) in self.BANK_FILES.iteritems())
+
+    def teardown(self):
+        self.sandbox.cleanup()
+
+    def _modify(self, bank, contents):
+        """Rewrite a bank file in the sandbox, making sure its modification time changes."""
+        path = self.sandbox.write(bank, contents)
+        status = stat(path)
+        utime(path, (status.st_atime, status.st_mtime + 10))
+
+        return path
+
+def _create_session(host, port, protocol = PROTOCOL_XMLRPC, **_):
+    """Return a mock remote session, which fetches its banks' statuses one by one."""
+    session = Mock(host = host, port = port, protocol = protocol)
+    session.fetch_statuses.side_effect = lambda banks: [bank.fetch_status() for bank in banks]
+
+    return session
@@ -0,0 +1,186 @@
+"""Protocols to talk to a bank server with.
+
+Besides XML-RPC (over HTTP), the server speaks a compact protocol of length-prefixed JSON messages
+over a raw TCP connection: Each message is a 4-byte (big-endian) length followed by that many
+bytes of JSON. Requests are `{"method": ..., "params": [...]}` objects, responses either
+`{"result": ...}` or `{"error": ...}`.
+
+Messages are limited in size so their first byte is always zero, which is how the server tells
+them apart from HTTP requests on the same port.
+
+Remote banks' addresses choose the protocol: `@json://host:port` for JSON, and either
+`@xmlrpc://host:port` or just `@host:port` for XML-RPC.
+"""
+
+import errno
+import json
+import socket
+from functools import partial
+from struct import Struct
+from xmlrpclib import Transport
+from .errors import BotError
+
+PROTOCOL_XMLRPC = "xmlrpc"
+PROTOCOL_JSON = "json"
+PROTOCOLS = (PROTOCOL_XMLRPC, PROTOCOL_JSON, )
+
+# The first byte of JSON messages (their length's most significant byte).
+JSON_MARKER = "\0"
+MAX_MESSAGE_SIZE = 0xffffff
+HEADER = Struct("!I")
+
+class RemoteError(BotError):
+    """An error raised by the server while handling a request."""
+    pass
+
+def parse_address(path):
+    """Return the protocol, host and port of a remote bank's address (see above)."""
+    (protocol, separator, address) = path[1:].rpartition("://")
+    if not separator:
+        protocol = PROTOCOL_XMLRPC
+
+    if protocol not in PROTOCOLS:
+        raise BotError("Unknown protocol '{:s}' in '{:s}'".format(protocol, path))
+
+    (host, port) = address.split(":")
+    return (protocol, host, int(port))
+
+def format_address(protocol, host, port):
+    """Return a remote bank's address (XML-RPC addresses are kept in the shorter form)."""
+    if PROTOCOL_XMLRPC == protocol:
+        return "@{:s}:{:d}".format(host, port)
+
+    return "@{:s}://{:s}:{:d}".format(protocol, host, port)
+
+def pack_message(message):
+    """Encode a JSON message, prefixed by its length."""
+    body = json.dumps(message, separators = (",", ":"))
+    if MAX_MESSAGE_SIZE < len(body):
+        raise ValueError("Message too large ({:d} bytes)".format(len(body)))
+
+    return HEADER.pack(len(body)) + body
+
+def read_message(stream):
+    """Read a JSON message from a file-like object.
+
+    Returns None if the stream ended before the message started. Messages which are cut off or too
+    large raise a `socket.error`, the same as the connection failing.
+    """
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+
+    if HEADER.size != len(header):
+        raise socket.error(errno.ECONNRESET, "Message cut off")
+
+    (size, ) = HEADER.unpack(header)
+    if MAX_MESSAGE_SIZE < size:
+        raise socket.error(errno.EPROTO, "Message too large ({:d} bytes)".format(size))
+
+    body = stream.read(size)
+    if size != len(body):
+        raise socket.error(errno.ECONNRESET, "Message cut off")
+
+    return json.loads(body)
+
+class XMLRPCTransport(Transport):
+    """An XML-RPC transport with a connection timeout and a compression threshold.
+
+    Requests larger than the threshold are sent gzip-compressed (None never compresses them).
+    """
+    def __init__(self, encode_threshold = None, timeout = None):
+        Transport.__init__(self)
+        self.encode_threshold = encode_threshold
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = Transport.make_connection(self, host)
+        connection.timeout = self.timeout
+
+        return connection
+
+class JSONProxy(object):
+    """Call a server's methods with length-prefixed JSON messages.
+
+    This has the same interface as an XML-RPC `ServerProxy`: Methods are called as the proxy's
+    attributes and `proxy("close")()` closes the connection. The connection is kept open between
+    calls and opened again as needed.
+
+    Server errors raise a `RemoteError`, connection failures (and timeouts) raise a `socket.error`.
+    """
+    def __init__(self, host, port, timeout = None):
+        self.__address = (host, port)
+        self.__timeout = timeout
+        self.__socket = None
+        self.__file = None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return partial(self.__request, name)
+
+    def __call__(self, attribute):
+        if "close" == attribute:
+            return self.__close
+
+        raise AttributeError(attribute)
+
+    def __request(self, method, *params):
+        """Send a request and return its result."""
+        request = pack_message({"method": method, "params": params, })
+
+        # The server closes connections which were idle for a while, so a kept-alive connection
+        # might not be there anymore. If it's closed (or reset) before the server answered at all,
+        # the server never got the request, so it's sent again over a new connection. Anything else
+        # (a timeout, for example) might've been handled by the server, so it's up to the caller.
+        while True:
+            is_reused = self.__socket is not None
+            if not is_reused:
+                self.__connect()
+
+            try:
+                self.__socket.sendall(request)
+                is_closed = not self.__socket.recv(1, socket.MSG_PEEK)
+            except socket.timeout:
+                self.__close()
+                raise
+            except socket.error as error:
+                self.__close()
+                if (not is_reused) or (error.errno not in (errno.ECONNRESET, errno.EPIPE)):
+                    raise
+
+                continue
+
+            if not is_closed:
+                break
+
+            self.__close()
+            if not is_reused:
+                raise socket.error(errno.ECONNRESET, "Connection closed by the server")
+
+        try:
+            response = read_message(self.__file)
+        except socket.error:
+            self.__close()
+            raise
+
+        if "error" in response:
+            raise RemoteError(response["error"])
+
+        return response["result"]
+
+    def __connect(self):
+        """Open a connection to the server."""
+        self.__socket = socket.create_connection(self.__address, self.__timeout)
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__file = self.__socket.makefile("rb")
+
+    def __close(self):
+        """Close the connection to the server, if it's open."""
+        if self.__socket is None:
+            return
+
+        self.__file.close()
+        self.__socket.close()
+        (self.__socket, self.__file) = (None, None)
@@ -0,0 +1 @@
+"""Performance benchmarks for the package (these aren't part of the test suite)."""
@@ -0,0 +1,97 @@
+"""Measure how the bank server scales with the number of banks and clients.
+
+Run with `python -m benchmarks.bench_assignment [OPTIONS]` (see `--help`). The server serves many
+small banks and is called directly (without a network), so the results show only the time spent
+finding each client's bank. Clients are assigned banks one after the other, then each client asks
+for its status again, so a server which scans its banks would slow down as more are assigned. The
+results are written as JSON so they can be compared between releases.
+"""
+
+import json
+import platform
+from argparse import ArgumentParser
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+from bddbot.server import BankServer
+from .bench_parser import _get_version
+from .generator import generate_bank
+
+BANKS = 10000
+CLIENTS = 500
+BUCKETS = 5
+OUTPUT_PATH = "bench_assignment.json"
+
+def run(banks = BANKS, clients = CLIENTS, buckets = BUCKETS):
+    """Assign banks to clients, returning the per-request latency as more clients are assigned."""
+    directory = mkdtemp()
+
+    try:
+        contents = generate_bank(scenarios = 2)
+        paths = []
+        for i in xrange(banks):
+            paths.append(join(directory, "benchmark_{:d}.bank".format(i)))
+            with open(paths[-1], "w") as bank_file:
+                bank_file.write(contents)
+
+        # The server is called directly, it never accepts connections.
+        server = BankServer("localhost", 0, paths, lazy = True)
+        names = ["client_{:d}".format(i) for i in xrange(clients)]
+        try:
+            assign = _measure(server, "get_next_scenario", names)
+            lookup = _measure(server, "get_status", names)
+        finally:
+            server.server_close()
+    finally:
+        rmtree(directory)
+
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "banks": banks,
+        "clients": clients,
+        "assign_seconds": _split(assign, buckets),
+        "lookup_seconds": _split(lookup, buckets),
+    }
+
+def _measure(server, method, clients):
+    """Call the server once per client, returning each call's latency."""
+    # pylint: disable=protected-access
+    latencies = []
+    for client in clients:
+        start = default_timer()
+        server._dispatch(method, (client, ))
+        latencies.append(default_timer() - start)
+
+    return latencies
+
+def _split(latencies, buckets):
+    """Return the mean latency of each consecutive group of calls."""
+    size = max(1, len(latencies) // buckets)
+    groups = [latencies[i:i + size] for i in xrange(0, len(latencies), size)]
+    return [sum(group) / len(group) for group in groups]
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark assigning banks to many clients.")
+    parser.add_argument("--banks", type = int, default = BANKS)
+    parser.add_argument("--clients", type = int, default = CLIENTS)
+    parser.add_argument("--buckets", type = int, default = BUCKETS,
+                        help = "Groups of clients to report the latency of")
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    report = run(args.banks, args.clients, args.buckets)
+
+    print "Mean latency per group of clients (in order of assignment):"
+    for name in ("assign", "lookup", ):
+        print "{:<8s}".format(name) + " ".join(
+            "{:9.6f}s".format(seconds) for seconds in report[name + "_seconds"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
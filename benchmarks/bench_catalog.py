@@ -0,0 +1,127 @@
+"""Measure the bank server's startup time and memory use with a large number of banks.
+
+Run with `python -m benchmarks.bench_catalog [OPTIONS]` (see `--help`). Each server is started in a
+separate process (so its memory use is its own), loading the banks in memory, lazily or from a
+catalog. The catalog is measured twice: When it imports the banks and when it's restarted over
+them. Each server then deals a scenario to each of a few clients. The results are written as JSON
+so they can be compared between releases.
+"""
+
+import json
+import platform
+import resource
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+from bddbot.server import BankServer
+from bddbot.catalog import BankCatalog
+from bddbot.errors import BotError
+from .bench_parser import _get_version
+from .generator import generate_bank
+
+BANKS = 10000
+SCENARIOS = 20
+CLIENTS = 100
+OUTPUT_PATH = "bench_catalog.json"
+
+# Each kind of server, in the order they're measured (the catalog's restart reuses its import).
+SERVERS = ["memory", "lazy", "catalog_import", "catalog_restart", ]
+
+def run(banks = BANKS, scenarios = SCENARIOS, clients = CLIENTS):
+    """Start each kind of server over the same banks, returning the results."""
+    directory = mkdtemp()
+
+    try:
+        contents = generate_bank(scenarios = scenarios)
+        paths = []
+        for i in xrange(banks):
+            paths.append(join(directory, "benchmark_{:d}.bank".format(i)))
+            with open(paths[-1], "w") as bank_file:
+                bank_file.write(contents)
+
+        catalog_path = join(directory, "catalog")
+        results = {}
+        for name in SERVERS:
+            results[name] = _run_server(name, paths, catalog_path, clients)
+    finally:
+        rmtree(directory)
+
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "banks": banks,
+        "scenarios": scenarios,
+        "clients": clients,
+        "results": results,
+    }
+
+def _run_server(name, paths, catalog_path, clients):
+    """Measure a kind of server in a separate process."""
+    results = Queue()
+    process = Process(target = _measure, args = (name, paths, catalog_path, clients, results))
+    process.start()
+    result = results.get()
+    process.join()
+
+    return result
+
+def _measure(name, paths, catalog_path, clients, results):
+    """Start a server and deal to its clients, reporting how long it took and the memory used."""
+    # pylint: disable=protected-access
+    # The process starts out with its parent's memory, so only what's added to it is counted.
+    initial_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = default_timer()
+    try:
+        if name.startswith("catalog"):
+            server = BankServer("localhost", 0, paths, catalog = BankCatalog(catalog_path))
+        else:
+            server = BankServer("localhost", 0, paths, lazy = ("lazy" == name))
+    except BotError as error:
+        # Running out of file descriptors (for example) is reported rather than measured.
+        results.put({"failed": str(error), })
+        return
+
+    startup = default_timer() - start
+
+    start = default_timer()
+    for i in xrange(clients):
+        server._dispatch("get_next_scenario", ("client_{:d}".format(i), ))
+
+    dealing = default_timer() - start
+    server.server_close()
+
+    results.put({
+        "startup_seconds": startup,
+        "deal_seconds": dealing / clients,
+        "added_rss_kilobytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - initial_rss,
+    })
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark starting a server over many banks.")
+    parser.add_argument("--banks", type = int, default = BANKS)
+    parser.add_argument("--scenarios", type = int, default = SCENARIOS, help = "Scenarios per bank")
+    parser.add_argument("--clients", type = int, default = CLIENTS)
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    report = run(args.banks, args.scenarios, args.clients)
+
+    for name in SERVERS:
+        result = report["results"][name]
+        if "failed" in result:
+            print "{:<16s}failed: {:s}".format(name, result["failed"])
+            continue
+
+        print "{:<16s}{:8.3f}s startup {:10.6f}s per deal {:8d}KB memory".format(
+            name, result["startup_seconds"], result["deal_seconds"], result["added_rss_kilobytes"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Measure how the bank server copes with many open connections.
+
+Run with `python -m benchmarks.bench_connections [OPTIONS]` (see `--help`). The server runs in a
+separate process and is sent many idle connections (clients which connected and haven't sent a
+request yet, or kept their connection open), then a single client calls it repeatedly. This
+compares serving one connection at a time, in a pool of threads and over an event loop. The results
+are written as JSON so they can be compared between releases.
+"""
+
+import json
+import platform
+import resource
+import socket
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+from bddbot.server import BankServer
+from bddbot.eventloop import EventLoopServer
+from bddbot.transport import JSONProxy
+from .bench_parser import _get_version
+from .generator import generate_bank
+
+CONNECTIONS = 2000
+REQUESTS = 200
+THREADS = 8
+KEEP_ALIVE = 5.0
+TIMEOUT = 2.0
+HOST = "localhost"
+CLIENT = "benchmark"
+OUTPUT_PATH = "bench_connections.json"
+
+SERVERS = [
+    ("one_at_a_time", BankServer, {}),
+    ("threads", BankServer, {"threads": THREADS, }),
+    ("event_loop", EventLoopServer, {}),
+]
+
+def _serve(server_class, kwargs, path, ports):
+    """Serve a bank in a separate process, reporting the port it listens on."""
+    _raise_file_limit()
+    server = server_class(HOST, 0, [path, ], keep_alive = KEEP_ALIVE, **kwargs)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+def run(connections = CONNECTIONS, requests = REQUESTS):
+    """Measure each kind of server, returning the results."""
+    _raise_file_limit()
+    directory = mkdtemp()
+
+    try:
+        path = join(directory, "benchmark.bank")
+        with open(path, "w") as bank_file:
+            bank_file.write(generate_bank(scenarios = 1))
+
+        results = {}
+        for (name, server_class, kwargs) in SERVERS:
+            results[name] = _run_server(server_class, kwargs, path, connections, requests)
+    finally:
+        rmtree(directory)
+
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "connections": connections,
+        "requests": requests,
+        "keep_alive": KEEP_ALIVE,
+        "results": results,
+    }
+
+def _run_server(server_class, kwargs, path, connections, requests):
+    """Call a new server while it holds many idle connections."""
+    ports = Queue()
+    server = Process(target = _serve, args = (server_class, kwargs, path, ports))
+    server.start()
+    idle = []
+
+    try:
+        port = ports.get()
+
+        # Connect without waiting, servers which don't accept them right away would take forever.
+        for _ in xrange(connections):
+            sock = socket.socket()
+            sock.setblocking(False)
+            sock.connect_ex((HOST, port))
+            idle.append(sock)
+
+        (latencies, failed) = _call(port, requests)
+    finally:
+        for sock in idle:
+            sock.close()
+
+        server.terminate()
+        server.join()
+
+    latencies.sort()
+    return {
+        "failed": failed,
+        "median_seconds": latencies[len(latencies) // 2] if latencies else None,
+        "max_seconds": latencies[-1] if latencies else None,
+    }
+
+def _call(port, requests):
+    """Call the server repeatedly, returning the calls' latencies and whether one timed out.
+
+    There's no point waiting for the rest once a call timed out, since they'd time out as well.
+    """
+    proxy = JSONProxy(HOST, port, timeout = TIMEOUT)
+    latencies = []
+
+    try:
+        for _ in xrange(requests):
+            start = default_timer()
+            proxy.get_status(CLIENT)
+            latencies.append(default_timer() - start)
+    except socket.error:
+        return (latencies, True)
+    finally:
+        proxy("close")()
+
+    return (latencies, False)
+
+def _raise_file_limit():
+    """Allow the process as many open files as it may, since each connection takes one."""
+    (_, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark the bank server with many connections.")
+    parser.add_argument("--connections", type = int, default = CONNECTIONS,
+                        help = "Idle connections to open")
+    parser.add_argument("--requests", type = int, default = REQUESTS)
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    report = run(args.connections, args.requests)
+
+    for (name, _, _) in SERVERS:
+        result = report["results"][name]
+        if result["failed"]:
+            print "{:<16s}timed out".format(name)
+        else:
+            print "{:<16s}{:8.4f}s median {:8.4f}s max".format(
+                name, result["median_seconds"], result["max_seconds"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
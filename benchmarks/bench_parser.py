@@ -0,0 +1,174 @@
+"""Measure the bank parser's throughput and memory use on generated banks.
+
+Run with `python -m benchmarks.bench_parser [OPTIONS]` (see `--help`). Each benchmark runs in a
+fresh worker process so its peak memory can be measured separately, and the results are written as
+JSON so they can be compared between releases.
+"""
+
+import json
+import platform
+import resource
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from os import chdir
+from os.path import join, dirname, abspath
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+from bddbot.parser import parse_bank, index_bank
+from bddbot.bank import Bank
+from bddbot.dealer import Dealer
+from .generator import generate_bank, SCENARIOS, TAGS, OUTLINES, TABLE_ROWS, MULTILINES
+
+REPEAT = 5
+BANKS = 1
+OUTPUT_PATH = "bench_parser.json"
+VERSION_PATH = join(dirname(dirname(abspath(__file__))), ".version")
+
+def _parse_bank(paths):
+    """Parse banks after reading them whole."""
+    for path in paths:
+        with open(path, "r") as bank_file:
+            parse_bank(bank_file.read())
+
+def _index_bank(paths):
+    """Index banks line by line."""
+    for path in paths:
+        with open(path, "rb") as bank_file:
+            index_bank(bank_file)
+
+def _load_banks(paths):
+    """Load banks."""
+    return [Bank(path) for path in paths]
+
+def _load_dealer(paths):
+    """Load a dealer with the banks (without any saved state)."""
+    dealer = Dealer(paths, [])
+    dealer.load()
+    return dealer
+
+BENCHMARKS = [
+    ("parse_bank", _parse_bank),
+    ("index_bank", _index_bank),
+    ("Bank", _load_banks),
+    ("Dealer.load", _load_dealer),
+]
+
+def measure(function, argument, repeat = REPEAT):
+    """Return the best time (in seconds) out of several calls to a function."""
+    timings = []
+    for _ in xrange(repeat):
+        start = default_timer()
+        function(argument)
+        timings.append(default_timer() - start)
+
+    return min(timings)
+
+def _run_benchmark(args):
+    """Run a benchmark in a worker process.
+
+    Returns the best time and the process's peak memory (in kilobytes), both overall and on top of
+    what the process used before running the benchmark.
+    """
+    (name, directory, paths, repeat) = args
+    function = dict(BENCHMARKS)[name]
+
+    # The dealer looks for its state in the working directory.
+    chdir(directory)
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    elapsed = measure(function, paths, repeat)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return (elapsed, peak, peak - baseline)
+
+def run(bank_options, banks = BANKS, repeat = REPEAT):
+    """Generate banks and run all benchmarks on them, returning the results."""
+    directory = mkdtemp()
+
+    try:
+        contents = generate_bank(**bank_options)
+        (lines, size) = (len(contents.splitlines()) * banks, len(contents) * banks)
+        paths = [join(directory, "{:d}.bank".format(i)) for i in xrange(banks)]
+        for path in paths:
+            with open(path, "w") as bank_file:
+                bank_file.write(contents)
+
+        # Don't hold on to the contents while measuring memory in the workers.
+        del contents
+
+        results = {}
+        for (name, _) in BENCHMARKS:
+            pool = Pool(1)
+            try:
+                (elapsed, peak, delta) = pool.apply(
+                    _run_benchmark,
+                    ((name, directory, paths, repeat), ))
+            finally:
+                pool.close()
+                pool.join()
+
+            results[name] = {
+                "seconds": elapsed,
+                "lines_per_second": lines / elapsed,
+                "peak_memory_kb": peak,
+                "memory_delta_kb": delta,
+            }
+    finally:
+        rmtree(directory)
+
+    bank = dict(bank_options, banks = banks, lines = lines, bytes = size)
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "bank": bank,
+        "results": results,
+    }
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark parsing and loading generated banks.")
+    parser.add_argument("--scenarios", type = int, default = SCENARIOS)
+    parser.add_argument("--tags", type = int, default = TAGS, help = "Tags per scenario")
+    parser.add_argument("--outlines", type = int, default = OUTLINES,
+                        help = "Every N-th scenario is an outline (0 for none)")
+    parser.add_argument("--table-rows", type = int, default = TABLE_ROWS)
+    parser.add_argument("--multilines", type = int, default = MULTILINES,
+                        help = "Every N-th scenario has a multiline text (0 for none)")
+    parser.add_argument("--banks", type = int, default = BANKS, help = "Number of bank files")
+    parser.add_argument("--repeat", type = int, default = REPEAT)
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    bank_options = {
+        "scenarios": args.scenarios,
+        "tags": args.tags,
+        "outlines": args.outlines,
+        "table_rows": args.table_rows,
+        "multilines": args.multilines,
+    }
+    report = run(bank_options, args.banks, args.repeat)
+
+    print "{:d} bank/s, {:d} lines, {:d} bytes".format(
+        args.banks, report["bank"]["lines"], report["bank"]["bytes"])
+    for (name, _) in BENCHMARKS:
+        result = report["results"][name]
+        print "{:<12s}{:8.3f}s {:12,.0f} lines/s {:10,d} KB peak ({:+,d} KB)".format(
+            name, result["seconds"], result["lines_per_second"],
+            result["peak_memory_kb"], result["memory_delta_kb"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+def _get_version():
+    """Return the package's version (None if it's unknown)."""
+    try:
+        with open(VERSION_PATH) as version:
+            return version.read().rstrip("\n")
+    except IOError:
+        return None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Measure the cost of dealing from a remote bank over a slow network.
+
+Run with `python -m benchmarks.bench_remote [OPTIONS]` (see `--help`). The bank server runs locally
+behind a proxy which adds latency, jitter and a bandwidth limit (see `benchmarks.proxy`), and each
+deal is made by a new dealer, restored from the previous one's state (the same as running the bot
+once per deal). The server counts the calls made to it, so the results show how many round trips a
+deal takes along with its latency. The results are written as JSON so they can be compared between
+releases.
+"""
+
+import json
+import platform
+from argparse import ArgumentParser
+from os import chdir, getcwd, remove
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from timeit import default_timer
+from bddbot.dealer import Dealer, STATE_PATH
+from bddbot.server import BankServer
+from bddbot.transport import format_address, PROTOCOLS
+from .bench_parser import _get_version
+from .generator import generate_bank
+from .proxy import LatencyProxy
+
+DEALS = 20
+LATENCY = 0.05
+JITTER = 0.01
+BANDWIDTH = None
+TEST_SECONDS = 0.0
+HOST = "localhost"
+CLIENT = "benchmark"
+OUTPUT_PATH = "bench_remote.json"
+
+class _CountingServer(BankServer):
+    """A bank server which counts the calls made to it."""
+    def __init__(self, *args, **kwargs):
+        super(_CountingServer, self).__init__(*args, **kwargs)
+        self.calls = 0
+
+    def _dispatch(self, method, params):
+        self.calls += 1
+        return super(_CountingServer, self)._dispatch(method, params)
+
+def run(network, deals = DEALS, test_seconds = TEST_SECONDS, prefetch = False):
+    """Deal over each protocol through a slow network, returning the results.
+
+    If `test_seconds` is set, the dealer's tests take that long (otherwise there aren't any).
+    """
+    directory = mkdtemp()
+    original_directory = getcwd()
+
+    try:
+        path = join(directory, "benchmark.bank")
+        with open(path, "w") as bank_file:
+            bank_file.write(generate_bank(scenarios = deals))
+
+        # The dealer writes its features to the working directory.
+        chdir(directory)
+
+        tests = [["sleep", str(test_seconds)], ] if test_seconds else []
+        results = {}
+        for protocol in PROTOCOLS:
+            results[protocol] = _run_protocol(path, protocol, network, deals, tests, prefetch)
+    finally:
+        chdir(original_directory)
+        rmtree(directory)
+
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "network": network,
+        "deals": deals,
+        "test_seconds": test_seconds,
+        "prefetch": prefetch,
+        "results": results,
+    }
+
+def _run_protocol(path, protocol, network, deals, tests, prefetch):
+    """Deal over a single protocol, from a new server."""
+    # pylint: disable=too-many-arguments, too-many-locals
+    server = _CountingServer(HOST, 0, [path, ])
+    server_thread = Thread(target = server.serve_forever, kwargs = {"poll_interval": 0.01})
+    server_thread.start()
+
+    proxy = LatencyProxy(server.server_address, **network)
+    proxy.start()
+
+    try:
+        address = format_address(protocol, HOST, proxy.address[1])
+        timings = []
+
+        for _ in xrange(deals):
+            dealer = Dealer([address, ], tests, name = CLIENT, prefetch = prefetch)
+            start = default_timer()
+            dealer.deal()
+            timings.append(default_timer() - start)
+            dealer.save()
+
+        remove(STATE_PATH)
+    finally:
+        proxy.stop()
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+    timings.sort()
+    return {
+        "mean_seconds": sum(timings) / deals,
+        "median_seconds": timings[deals // 2],
+        "max_seconds": timings[-1],
+        "calls_per_deal": float(server.calls) / deals,
+        "connections_per_deal": float(proxy.connections) / deals,
+    }
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark dealing from a remote bank.")
+    parser.add_argument("--deals", type = int, default = DEALS)
+    parser.add_argument("--latency", type = float, default = LATENCY * 1000,
+                        help = "One-way latency (milliseconds)")
+    parser.add_argument("--jitter", type = float, default = JITTER * 1000,
+                        help = "Maximal random latency added (milliseconds)")
+    parser.add_argument("--bandwidth", type = float, default = BANDWIDTH,
+                        help = "Bandwidth (kilobytes per second, unlimited by default)")
+    parser.add_argument("--test-seconds", type = float, default = TEST_SECONDS,
+                        help = "How long the dealer's tests take")
+    parser.add_argument("--prefetch", action = "store_true",
+                        help = "Prefetch scenarios while the tests run")
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    network = {
+        "latency": args.latency / 1000,
+        "jitter": args.jitter / 1000,
+        "bandwidth": args.bandwidth * 1024 if args.bandwidth else None,
+    }
+    report = run(network, args.deals, args.test_seconds, args.prefetch)
+
+    print "Per deal:"
+    for protocol in PROTOCOLS:
+        result = report["results"][protocol]
+        print "{:<8s}{:8.3f}s mean {:8.3f}s median {:6.2f} calls {:6.2f} connections".format(
+            protocol, result["mean_seconds"], result["median_seconds"],
+            result["calls_per_deal"], result["connections_per_deal"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
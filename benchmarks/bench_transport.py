@@ -0,0 +1,134 @@
+"""Measure the bank server's throughput over each of its protocols.
+
+Run with `python -m benchmarks.bench_transport [OPTIONS]` (see `--help`). The server runs in a
+separate process, serving a generated bank, and a single client calls it repeatedly over each
+protocol. The results are written as JSON so they can be compared between releases.
+"""
+
+import json
+import platform
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from xmlrpclib import ServerProxy
+from bddbot.server import BankServer
+from bddbot.transport import JSONProxy, PROTOCOLS, PROTOCOL_JSON
+from .bench_parser import measure, _get_version
+from .generator import generate_bank
+
+REPEAT = 5
+REQUESTS = 2000
+HOST = "localhost"
+CLIENT = "benchmark"
+OUTPUT_PATH = "bench_transport.json"
+
+def _get_status(proxy):
+    """Query the client's status (the metadata is only sent the first time)."""
+    token = proxy.get_status(CLIENT)["token"]
+
+    def run(requests):
+        # pylint: disable=missing-docstring
+        for _ in xrange(requests):
+            proxy.get_status(CLIENT, token)
+    return run
+
+def _deal(proxy):
+    """Deal scenarios (each along with the status for the next deal)."""
+    token = proxy.get_status(CLIENT)["token"]
+
+    def run(requests):
+        # pylint: disable=missing-docstring
+        for _ in xrange(requests):
+            proxy.deal(CLIENT, token)
+    return run
+
+BENCHMARKS = [
+    ("get_status", _get_status),
+    ("deal", _deal),
+]
+
+def _serve(path, ports):
+    """Serve a bank in a separate process, reporting the port it listens on."""
+    server = BankServer(HOST, 0, [path, ])
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+def run(requests = REQUESTS, repeat = REPEAT):
+    """Run all benchmarks over each protocol, returning the results."""
+    directory = mkdtemp()
+
+    try:
+        path = join(directory, "benchmark.bank")
+        with open(path, "w") as bank_file:
+            bank_file.write(generate_bank(scenarios = requests * repeat + 1))
+
+        results = {}
+        for protocol in PROTOCOLS:
+            results[protocol] = _run_protocol(path, protocol, requests, repeat)
+    finally:
+        rmtree(directory)
+
+    return {
+        "version": _get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "requests": requests,
+        "results": results,
+    }
+
+def _run_protocol(path, protocol, requests, repeat):
+    """Run all benchmarks over a single protocol, against a new server."""
+    ports = Queue()
+    server = Process(target = _serve, args = (path, ports))
+    server.start()
+
+    try:
+        proxy = _connect(protocol, ports.get())
+        results = {}
+
+        for (name, benchmark) in BENCHMARKS:
+            elapsed = measure(benchmark(proxy), requests, repeat)
+            results[name] = {
+                "seconds": elapsed,
+                "requests_per_second": requests / elapsed,
+            }
+
+        proxy("close")()
+    finally:
+        server.terminate()
+        server.join()
+
+    return results
+
+def _connect(protocol, port):
+    """Return a proxy to call the server with over a protocol (the same way remote banks do)."""
+    if PROTOCOL_JSON == protocol:
+        return JSONProxy(HOST, port)
+
+    return ServerProxy("http://{:s}:{:d}".format(HOST, port), allow_none = True)
+
+def main():
+    # pylint: disable=missing-docstring
+    parser = ArgumentParser(description = "Benchmark the bank server's protocols.")
+    parser.add_argument("--requests", type = int, default = REQUESTS,
+                        help = "Requests per measurement")
+    parser.add_argument("--repeat", type = int, default = REPEAT)
+    parser.add_argument("--output", default = OUTPUT_PATH, help = "Path to write results to")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.repeat)
+
+    for protocol in PROTOCOLS:
+        for (name, _) in BENCHMARKS:
+            result = report["results"][protocol][name]
+            print "{:<8s}{:<12s}{:8.3f}s {:10,.0f} requests/s".format(
+                protocol, name, result["seconds"], result["requests_per_second"])
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Generate synthetic banks to benchmark with."""
+
+SCENARIOS = 20000
+TAGS = 2
+OUTLINES = 3
+TABLE_ROWS = 2
+MULTILINES = 2
+
+MULTILINE_DELIMITERS = ("\"\"\"", "'''", )
+
+def generate_bank(scenarios = SCENARIOS, tags = TAGS, outlines = OUTLINES,
+                  table_rows = TABLE_ROWS, multilines = MULTILINES):
+    """Generate the contents of a bank.
+
+    The bank has the given number of scenarios, each with the given number of tags. Every
+    `outlines`-th scenario is a Scenario Outline with an examples table, every `multilines`-th
+    other scenario has a multiline text (alternating between both kinds of delimiters) and the rest
+    have a data table. Tables have `table_rows` rows, and setting either `outlines` or `multilines`
+    to zero leaves out that kind of scenario.
+    """
+    lines = [
+        "# A generated bank",
+        "@generated",
+        "Feature: A generated feature",
+        "    Background:",
+        "        Given a generated bank",
+        "",
+    ]
+
+    for i in xrange(scenarios):
+        if tags:
+            lines.append("    " + " ".join("@tag_{:d}_{:d}".format(i, j) for j in xrange(tags)))
+
+        if outlines and (0 == i % outlines):
+            lines.extend(_generate_outline(i, table_rows))
+        elif multilines and (0 == i % multilines):
+            lines.extend(_generate_multiline(i, MULTILINE_DELIMITERS[(i // multilines) % 2]))
+        else:
+            lines.extend(_generate_table(i, table_rows))
+
+        lines.append("")
+
+    return "\n".join(lines)
+
+def _generate_outline(i, table_rows):
+    """Generate a Scenario Outline's lines."""
+    return [
+        "    Scenario Outline: Generated outline #{:d}".format(i),
+        "        Given <value>",
+        "        When <action>",
+        "        Then <result>",
+        "        Examples:",
+        "        | value | action | result |",
+    ] + [
+        "        | A{0:<4d} | B{0:<5d} | C{0:<5d} |".format(row) for row in xrange(table_rows)
+    ]
+
+def _generate_multiline(i, delimiter):
+    """Generate the lines of a scenario with a multiline text (which looks like a feature)."""
+    return [
+        "    Scenario: Generated scenario #{:d}".format(i),
+        "        Given some multiline text:",
+        "            " + delimiter,
+        "            @not_really_tags",
+        "            Feature: Not really a feature",
+        "                Scenario: Not really a scenario",
+        "            " + delimiter,
+        "        When the text is parsed",
+        "        Then the scenario is generated",
+    ]
+
+def _generate_table(i, table_rows):
+    """Generate the lines of a scenario with a data table."""
+    return [
+        "    Scenario: Generated scenario #{:d}".format(i),
+        "        Given a table:",
+        "        | key | value |",
+    ] + [
+        "        | K{0:<2d} | V{0:<4d} |".format(row) for row in xrange(table_rows)
+    ] + [
+        "        Then the scenario is generated",
+    ]
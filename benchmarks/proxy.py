@@ -0,0 +1,142 @@
+"""A local TCP proxy which makes a connection behave like a slower network.
+
+The proxy forwards connections to a server, delaying everything sent either way by a fixed latency
+(plus some random jitter) and limiting how fast it goes through (its bandwidth), so a bank server
+on localhost can be called as if it were far away.
+"""
+
+import socket
+from random import uniform
+from threading import Thread, Lock
+from Queue import Queue
+from timeit import default_timer
+from time import sleep
+
+CHUNK_SIZE = 0x4000
+
+class LatencyProxy(object):
+    """Forward connections to a server over a simulated network link.
+
+    `latency` and `jitter` are in seconds, one way (so each round trip takes twice the latency),
+    and `bandwidth` is in bytes per second (None doesn't limit it). Call `start()` to start
+    forwarding connections and `stop()` to stop, closing all of them.
+    """
+    def __init__(self, target, latency = 0.0, jitter = 0.0, bandwidth = None, host = "localhost"):
+        # pylint: disable=too-many-arguments
+        self.target = target
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.connections = 0
+        self.__listener = socket.socket()
+        self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listener.bind((host, 0))
+        self.__listener.listen(5)
+        self.__sockets = []
+        self.__lock = Lock()
+        self.__thread = None
+
+    @property
+    def address(self):
+        """The address to connect to the server through."""
+        return self.__listener.getsockname()
+
+    def start(self):
+        """Start accepting connections in the background."""
+        self.__thread = Thread(target = self.__accept)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """Stop accepting connections and close the open ones."""
+        try:
+            self.__listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self.__listener.close()
+        with self.__lock:
+            for sock in self.__sockets:
+                sock.close()
+
+            self.__sockets = []
+
+    def __accept(self):
+        """Accept connections, forwarding each to the server in both directions."""
+        while True:
+            try:
+                (client, _) = self.__listener.accept()
+                server = socket.create_connection(self.target)
+            except socket.error:
+                return
+
+            for sock in (client, server, ):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            with self.__lock:
+                self.connections += 1
+                self.__sockets.extend([client, server, ])
+
+            _Link(self, client, server).start()
+            _Link(self, server, client).start()
+
+class _Link(object):
+    """Send whatever's received on one socket through the other, as if over a network link.
+
+    Chunks are read as soon as they arrive and sent once they've gone "through the link": After the
+    link's latency (and jitter), and no sooner than the bandwidth allows after the previous chunk.
+    Chunks are never reordered.
+    """
+    def __init__(self, proxy, source, destination):
+        self.__proxy = proxy
+        self.__source = source
+        self.__destination = destination
+        self.__chunks = Queue()
+
+    def start(self):
+        """Start forwarding, in a pair of threads."""
+        for target in (self.__receive, self.__send, ):
+            thread = Thread(target = target)
+            thread.daemon = True
+            thread.start()
+
+    def __receive(self):
+        """Read chunks, scheduling when each should be sent."""
+        proxy = self.__proxy
+        (link_free, last_arrival) = (0, 0)
+
+        while True:
+            try:
+                chunk = self.__source.recv(CHUNK_SIZE)
+            except socket.error:
+                chunk = ""
+
+            if not chunk:
+                self.__chunks.put((last_arrival, None))
+                return
+
+            # The chunk goes through the link after the previous ones, then takes its latency.
+            link_free = max(link_free, default_timer())
+            if proxy.bandwidth:
+                link_free += float(len(chunk)) / proxy.bandwidth
+
+            arrival = link_free + proxy.latency + uniform(0, proxy.jitter)
+            last_arrival = max(last_arrival, arrival)
+            self.__chunks.put((last_arrival, chunk))
+
+    def __send(self):
+        """Send chunks once they're due."""
+        while True:
+            (arrival, chunk) = self.__chunks.get()
+            delay = arrival - default_timer()
+            if 0 < delay:
+                sleep(delay)
+
+            try:
+                if chunk is None:
+                    self.__destination.shutdown(socket.SHUT_WR)
+                    return
+
+                self.__destination.sendall(chunk)
+            except socket.error:
+                return
@@ -55,6 +55,31 @@ Feature: Configure parameters
                 Scenario: Giving money to the poor
             """
 
+    Scenario: Setting the parse cache
+        Given the configuration file:
+            """
+            [paths]
+            bank: banks/goodness.bank
+            cache: .cache
+            """
+        And the features bank "banks/goodness.bank":
+            """
+            Feature: Doing great deeds #4
+                Scenario: Recycling
+                Scenario: Planting a tree
+            """
+        And a directory "features/steps"
+        And 1 scenario/s were dealt
+        When the bot's state is saved
+        And the bot is restarted
+        And another scenario is dealt
+        Then "features/goodness.feature" contains:
+            """
+            Feature: Doing great deeds #4
+                Scenario: Recycling
+                Scenario: Planting a tree
+            """
+
     Scenario: Setting the test command
         Given the configuration file:
             """
@@ -58,6 +58,32 @@ Feature: Remote bot server
                 Scenario: The second remote scenario
             """
 
+    Scenario: Deal from a server running an event loop
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+
+            [server]
+            host: localhost
+            port: 3037
+            event_loop: yes
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @json://localhost:3037
+            """
+        And a directory "features/steps" on the client
+        When a scenario is dealt on the client
+        Then "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+            """
+
     Scenario: Deal separate features to different clients
         Given the configuration file on the server:
             """
@@ -101,3 +127,149 @@ Feature: Remote bot server
             Feature: The second remote feature
                 Scenario: The third remote scenario
             """
+
+    Scenario: Resume dealing after the server restarts
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+            journal:
+
+            [server]
+            host: localhost
+            port: 3037
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @localhost:3037
+            """
+        And a directory "features/steps" on the client
+        When a scenario is dealt on the client
+        And the server is restarted
+        And a scenario is dealt on the client
+        Then "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+                Scenario: The second remote scenario
+            """
+
+    Scenario: Deal from a catalog across server restarts
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+            catalog:
+
+            [server]
+            host: localhost
+            port: 3037
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @localhost:3037
+            """
+        And a directory "features/steps" on the client
+        When a scenario is dealt on the client
+        And the server is restarted
+        And a scenario is dealt on the client
+        Then "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+                Scenario: The second remote scenario
+            """
+
+    Scenario: Serve banks lazily
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+
+            [server]
+            host: localhost
+            port: 3037
+            lazy: yes
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @localhost:3037
+            """
+        And a directory "features/steps" on the client
+        When a scenario is dealt on the client
+        Then "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+            """
+
+    Scenario: Prefetch the next scenario while the tests run
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+
+            [server]
+            host: localhost
+            port: 3037
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @localhost:3037
+
+            [server]
+            prefetch: yes
+            """
+        And a directory "features/steps" on the client
+        When a scenario is dealt on the client
+        And a scenario is dealt on the client
+        Then "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+                Scenario: The second remote scenario
+            """
+
+    Scenario: Don't deal the prefetched scenario if the tests fail
+        Given the configuration file on the server:
+            """
+            [paths]
+            bank: banks/first.bank
+
+            [server]
+            host: localhost
+            port: 3037
+            """
+        When the dealer is loaded on the server
+        And the server is started
+        Given the configuration file on the client:
+            """
+            [paths]
+            bank: @localhost:3037
+
+            [test]
+            run: false
+
+            [server]
+            prefetch: yes
+            """
+        When a scenario is dealt on the client
+        And a scenario is dealt on the client
+        Then an error saying "unimplemented scenarios" is raised
+        And "features/first.feature" on the client contains:
+            """
+            Feature: The first remote feature
+                Scenario: The first remote scenario
+            """
@@ -7,14 +7,18 @@ from nose.tools import assert_true, assert_equal, assert_is_none, assert_is_not_
 from nose.tools import assert_in, assert_not_in, assert_greater
 from bddbot.dealer import Dealer, STATE_PATH
 from bddbot.server import BankServer
+from bddbot.eventloop import EventLoopServer
 from bddbot.config import BotConfiguration
+from bddbot.cache import ParseCache
+from bddbot.journal import DealJournal
+from bddbot.catalog import BankCatalog
 from bddbot.errors import BotError
 
 @given("{count:Count} scenario/s were dealt")
 def n_scenarios_were_dealt(context, count):
     if not context.dealer:
         config = BotConfiguration()
-        context.dealer = Dealer(config.banks, config.tests)
+        context.dealer = _create_dealer(config)
 
     for _ in xrange(count):
         context.dealer.deal()
@@ -25,7 +29,7 @@ def load_dealer(context):
     assert_is_none(context.dealer)
 
     config = BotConfiguration()
-    context.dealer = Dealer(config.banks, config.tests)
+    context.dealer = _create_dealer(config)
 
     try:
         context.dealer.load()
@@ -42,7 +46,7 @@ def load_dealer_on_side(context, side):
     chdir(context.sandbox[side].path)
 
     config = BotConfiguration()
-    dealer = Dealer(config.banks, config.tests, name = side)
+    dealer = _create_dealer(config, name = side)
 
     context.bot_config[side] = config
     context.dealer[side] = dealer
@@ -67,22 +71,43 @@ def server_is_started(context):
     original_directory = getcwd()
     chdir(context.sandbox["server"].path)
 
-    context.server = BankServer(
+    server_class = EventLoopServer if context.bot_config["server"].event_loop else BankServer
+    context.server = server_class(
         context.bot_config["server"].host,
         context.bot_config["server"].port,
-        context.bot_config["server"].banks)
+        context.bot_config["server"].banks,
+        lazy = context.bot_config["server"].lazy,
+        cache = _create_cache(context.bot_config["server"]),
+        workers = context.bot_config["server"].workers,
+        reload_interval = context.bot_config["server"].reload_interval,
+        keep_alive = context.bot_config["server"].keep_alive,
+        threads = context.bot_config["server"].threads,
+        compress_threshold = context.bot_config["server"].compress_threshold,
+        journal = _create_journal(context.bot_config["server"]),
+        catalog = _create_catalog(context.bot_config["server"]))
     context.server_thread = Thread(target = context.server.serve_forever)
     context.server_thread.start()
 
     # Return to original working directory.
     chdir(original_directory)
 
+@when("the server is restarted")
+def server_is_restarted(context):
+    assert_is_not_none(context.server)
+
+    context.server.shutdown()
+    context.server_thread.join()
+    context.server.server_close()
+    (context.server, context.server_thread) = (None, None)
+
+    server_is_started(context)
+
 @when("the bot is restarted")
 def restart_the_bot(context):
     assert_is_not_none(context.dealer)
 
     config = BotConfiguration()
-    context.dealer = Dealer(config.banks, config.tests)
+    context.dealer = _create_dealer(config)
 
 @when("the bot's state is saved")
 def save_state(context):
@@ -95,7 +120,7 @@ def first_scenario_is_dealt(context):
 
     if not context.dealer:
         config = BotConfiguration()
-        context.dealer = Dealer(config.banks, config.tests)
+        context.dealer = _create_dealer(config)
 
     try:
         context.dealer.deal()
@@ -137,3 +162,34 @@ def no_more_scenarios(context):
     assert_is_none(context.error)
     assert_is_not_none(context.dealer)
     assert_true(context.dealer.is_done)
+
+def _create_dealer(config, name = ""):
+    return Dealer(
+        config.banks,
+        config.tests,
+        name = name,
+        cache = _create_cache(config),
+        workers = config.workers,
+        compress_threshold = config.compress_threshold,
+        prefetch = config.prefetch,
+        timeout = config.timeout,
+        retries = config.retries,
+        retry_backoff = config.retry_backoff)
+
+def _create_cache(config):
+    if not config.cache:
+        return None
+
+    return ParseCache(config.cache)
+
+def _create_journal(config):
+    if not config.journal:
+        return None
+
+    return DealJournal(config.journal, config.group_commit)
+
+def _create_catalog(config):
+    if not config.catalog:
+        return None
+
+    return BankCatalog(config.catalog)